@@ -54,6 +54,9 @@ RERANKER_SERVICE_URL = os.environ.get("RERANKER_SERVICE_URL") or os.environ.get(
 TABLE_NAME = "hc_ai_table"
 # mxbai-embed-large:latest produces 1024-dimensional embeddings
 VECTOR_SIZE = 1024
+# "halfvec" stores fp16 embeddings (pgvector >= 0.7). Used when the table is created;
+# queries follow the existing column's type (see get_vector_type)
+VECTOR_TYPE = os.getenv("HC_AI_VECTOR_TYPE", "vector").lower()
 SCHEMA_NAME = "hc_ai_schema"
 
 # Connection pool / queue configuration
@@ -84,6 +87,7 @@ _pg_engine: Optional[PGEngine] = None
 _vector_store: Optional[PGVectorStore] = None
 _queue: Optional[asyncio.Queue] = None
 _queue_worker_task: Optional[asyncio.Task] = None
+_vector_type: Optional[str] = None
 _queue_stats = {
     "queued": 0,
     "processed": 0,
@@ -195,6 +199,36 @@ def classify_error(exc: Exception) -> str:
     return "fatal"
 
 
+async def get_vector_type() -> str:
+    """
+    Base type ("vector" or "halfvec") of the table's embedding column, read once per process.
+
+    Query casts must match the column, not HC_AI_VECTOR_TYPE: a table created with the other
+    type has no <=> operator for the mismatched cast.
+    """
+    global _vector_type
+    if _vector_type is None:
+        async with get_engine().connect() as conn:
+            res = await conn.execute(
+                text("""
+                    SELECT format_type(atttypid, atttypmod)
+                    FROM pg_attribute
+                    WHERE attrelid = CAST(:table AS regclass) AND attname = 'embedding' AND NOT attisdropped
+                """),
+                {"table": f'"{SCHEMA_NAME}"."{TABLE_NAME}"'},
+            )
+            column_type = res.scalar_one_or_none()
+        base_type = (column_type or "").split("(")[0]
+        if base_type not in ("vector", "halfvec"):
+            raise RuntimeError(
+                f'"{SCHEMA_NAME}"."{TABLE_NAME}".embedding is {column_type or "missing"}; expected vector or halfvec'
+            )
+        if base_type != VECTOR_TYPE:
+            print(f"Warning: HC_AI_VECTOR_TYPE={VECTOR_TYPE} but the embedding column is {column_type}; using {base_type}")
+        _vector_type = base_type
+    return _vector_type
+
+
 async def verify_table_exists(engine: AsyncEngine, schema_name: str, table_name: str) -> bool:
     """Check if table exists in the database"""
     async with engine.begin() as conn:
@@ -330,11 +364,18 @@ async def initialize_vector_store() -> PGVectorStore:
             vector_size=VECTOR_SIZE,
             schema_name=SCHEMA_NAME,
         )
+        if VECTOR_TYPE == "halfvec":
+            async with _engine.begin() as conn:
+                await conn.execute(text(
+                    f'ALTER TABLE "{SCHEMA_NAME}"."{TABLE_NAME}" '
+                    f'ALTER COLUMN embedding TYPE halfvec({VECTOR_SIZE})'
+                ))
     
     # Verify table exists
     table_exists = await verify_table_exists(_engine, SCHEMA_NAME, TABLE_NAME)
     if not table_exists:
         raise Exception("Table was not created successfully!")
+    await get_vector_type()
     
     # Create embeddings instance
     embedding = CustomEmbeddings()
@@ -468,6 +509,7 @@ async def _search_similar_with_sql_filter(
         params[param_name] = value
 
     where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+    vector_type = await get_vector_type()
 
     # Use raw SQL with the embedding directly interpolated (safe since we generate it)
     sql = f"""
@@ -475,10 +517,10 @@ async def _search_similar_with_sql_filter(
             langchain_id,
             content,
             langchain_metadata,
-            1 - (embedding <=> '{embedding_str}'::vector) as similarity
+            1 - (embedding <=> '{embedding_str}'::{vector_type}) as similarity
         FROM "{SCHEMA_NAME}"."{TABLE_NAME}"
         WHERE {where_sql}
-        ORDER BY embedding <=> '{embedding_str}'::vector
+        ORDER BY embedding <=> '{embedding_str}'::{vector_type}
         LIMIT :k
     """
 
@@ -1003,6 +1045,75 @@ async def store_chunks_batch(chunks: List[Dict[str, Any]]) -> int:
     return stored
 
 
+async def _insert_embedded_rows(rows: List[Tuple[str, str, str, str]]) -> None:
+    """
+    Upsert (id, content, embedding literal, metadata JSON) rows in one transaction.
+
+    One executemany on the engine's raw asyncpg connection: asyncpg pipelines
+    the bound rows through a single prepared statement, where
+    PGVectorStore.aadd_embeddings runs an INSERT and COMMIT per row.
+    ON CONFLICT matches aadd_embeddings' upsert on the id column.
+    """
+    vector_type = await get_vector_type()
+    async with get_engine().connect() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        async with raw.transaction():
+            await raw.executemany(
+                f'''
+                INSERT INTO "{SCHEMA_NAME}"."{TABLE_NAME}" (langchain_id, content, embedding, langchain_metadata)
+                VALUES ($1::uuid, $2, $3::{vector_type}, $4::json)
+                ON CONFLICT (langchain_id) DO UPDATE
+                SET content = EXCLUDED.content,
+                    embedding = EXCLUDED.embedding,
+                    langchain_metadata = EXCLUDED.langchain_metadata
+                ''',
+                rows,
+            )
+
+
+async def store_chunks_bulk(
+    chunk_texts: List[str],
+    embeddings: List[List[float]],
+    metadatas: List[Dict[str, Any]],
+    chunk_ids: List[str],
+) -> int:
+    """
+    Store pre-embedded chunks in a single transaction (see _insert_embedded_rows).
+
+    If the bulk insert fails, nothing is committed and each row is retried on
+    its own with the embeddings already in hand; rows that still fail are
+    logged to the error log and skipped.
+    """
+    await initialize_vector_store()
+    rows = [
+        (chunk_id, chunk_text, str([float(x) for x in embedding]), json.dumps(metadata))
+        for chunk_text, embedding, metadata, chunk_id in zip(chunk_texts, embeddings, metadatas, chunk_ids)
+    ]
+    try:
+        await _insert_embedded_rows(rows)
+        return len(rows)
+    except Exception as e:
+        print(f"Warning: bulk insert of {len(rows)} chunks failed, retrying one by one: {e}")
+
+    stored = 0
+    for row, metadata in zip(rows, metadatas):
+        try:
+            await _insert_embedded_rows([row])
+            stored += 1
+        except Exception as e:
+            await log_error(
+                file_id=metadata.get("source_file"),
+                resource_id=metadata.get("resource_id"),
+                chunk_id=row[0],
+                chunk_index=metadata.get("chunk_index"),
+                error_type=classify_error(e),
+                error_message=str(e),
+                metadata=metadata,
+                source_file=metadata.get("source_file"),
+            )
+    return stored
+
+
 # ---------------------- Monitoring APIs ----------------------
 
 
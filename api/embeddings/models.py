@@ -1,5 +1,7 @@
 """Request/Response models for embeddings service."""
 
+from typing import List
+
 from pydantic import BaseModel, Field
 
 
@@ -11,3 +13,7 @@ class ClinicalNote(BaseModel):
     patient_id: str = Field(default="unknown", alias="patientId")
     resourceJson: str = Field(default="", alias="resourceJson")  # Optional: original JSON for RecursiveJsonSplitter
     sourceFile: str = Field(default="", alias="sourceFile")  # Source file path
+
+
+class ClinicalNoteBatch(BaseModel):
+    items: List[ClinicalNote] = Field(min_length=1, max_length=500)
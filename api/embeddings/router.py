@@ -5,8 +5,8 @@ from __future__ import annotations
 import logging
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 
-from api.embeddings.models import ClinicalNote
-from api.embeddings.utils.helper import process_and_store
+from api.embeddings.models import ClinicalNote, ClinicalNoteBatch
+from api.embeddings.utils.helper import process_and_store, process_and_store_batch
 from api.auth.dependencies import get_current_user
 
 router = APIRouter()
@@ -41,6 +41,30 @@ async def ingest_note(note: ClinicalNote, background_tasks: BackgroundTasks, cur
     }
 
 
+@router.post("/ingest_bulk")
+async def ingest_notes_bulk(batch: ClinicalNoteBatch, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)):
+    """
+    Ingest many clinical notes in one request.
+    
+    All notes are chunked, embedded and stored together by a single
+    background task.
+    """
+    for note in batch.items:
+        if not note.content or len(note.content.strip()) == 0:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Content cannot be empty for resource {note.id}"
+            )
+    
+    background_tasks.add_task(process_and_store_batch, batch.items)
+    logger.info(f"Accepted {len(batch.items)} notes for bulk ingest")
+    return {
+        "status": "accepted",
+        "count": len(batch.items),
+        "ids": [note.id for note in batch.items],
+    }
+
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint."""
@@ -54,6 +78,7 @@ async def root():
         "message": "FHIR Data Processing API - Embeddings Service",
         "endpoints": {
             "ingest": "/embeddings/ingest (POST)",
+            "ingest_bulk": "/embeddings/ingest_bulk (POST)",
             "health": "/embeddings/health (GET)",
         },
     }
@@ -4,17 +4,23 @@
 from api.embeddings.utils.helper import (
     get_chunk_embedding,
     process_and_store,
+    process_and_store_batch,
     semantic_chunking,
     recursive_json_chunking,
+    fhir_fast_chunk,
     parent_child_chunking,
     extract_resource_metadata,
+    extract_resource_metadata_dict,
 )
 
 __all__ = [
     "get_chunk_embedding",
     "process_and_store",
+    "process_and_store_batch",
     "semantic_chunking",
     "recursive_json_chunking",
+    "fhir_fast_chunk",
     "parent_child_chunking",
     "extract_resource_metadata",
+    "extract_resource_metadata_dict",
 ]
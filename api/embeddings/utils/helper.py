@@ -7,6 +7,7 @@ import os
 import sys
 import json
 import logging
+import orjson
 import requests
 import nltk
 import numpy as np
@@ -302,6 +303,62 @@ def recursive_json_chunking(
         }]
 
 
+def fhir_fast_chunk(resource: dict, max_chunk_size: int = 1000):
+    """
+    Chunk a single FHIR resource in one pass over its top-level keys.
+
+    FHIR resources are shallow, so instead of RecursiveJsonSplitter's
+    recursive re-serialization this serializes each top-level field once
+    (orjson) and packs the fields greedily into JSON objects of at most
+    max_chunk_size characters. A single field larger than max_chunk_size
+    is emitted as consecutive max_chunk_size slices of its text.
+
+    Args:
+        resource: Parsed FHIR resource
+        max_chunk_size: Maximum size of chunks
+
+    Returns:
+        List of chunk dictionaries (same shape as recursive_json_chunking)
+    """
+    texts = []
+    parts = []
+    size = 2  # surrounding braces
+
+    def flush():
+        nonlocal size
+        if parts:
+            texts.append("{" + ",".join(parts) + "}")
+            parts.clear()
+            size = 2
+
+    for key, value in resource.items():
+        # '"key":value' without the enclosing braces
+        part = orjson.dumps({key: value}).decode()[1:-1]
+        if len(part) + 2 > max_chunk_size:
+            flush()
+            whole = "{" + part + "}"
+            texts.extend(whole[i:i + max_chunk_size] for i in range(0, len(whole), max_chunk_size))
+            continue
+        added = len(part) + (1 if parts else 0)
+        if size + added > max_chunk_size:
+            flush()
+            added = len(part)
+        parts.append(part)
+        size += added
+    flush()
+
+    return [
+        {
+            "chunk_id": f"chunk_{i}",
+            "chunk_type": "chunk",
+            "text": chunk_text,
+            "chunk_size": len(chunk_text),
+            "chunk_index": i
+        }
+        for i, chunk_text in enumerate(texts)
+    ]
+
+
 def parent_child_chunking(
     text: str,
     parent_chunk_size: int = 2000,
@@ -671,6 +728,26 @@ def extract_resource_metadata(resource_json: str) -> dict:
     """
     Extract common metadata fields from FHIR resource JSON.
     
+    Parses the JSON and delegates to extract_resource_metadata_dict.
+    
+    Returns:
+        Dictionary with extracted metadata fields (may be empty if extraction fails)
+    """
+    if not resource_json or not resource_json.strip():
+        return {}
+    
+    try:
+        resource = json.loads(resource_json)
+    except Exception as e:
+        logger.debug(f"Could not extract metadata from JSON: {e}")
+        return {}
+    return extract_resource_metadata_dict(resource)
+
+
+def extract_resource_metadata_dict(resource: dict) -> dict:
+    """
+    Extract common metadata fields from a parsed FHIR resource.
+    
     Extracts:
     - effectiveDate/date: When the data was recorded (varies by resource type)
     - status: Status of the resource (varies by resource type)
@@ -680,12 +757,10 @@ def extract_resource_metadata(resource_json: str) -> dict:
         Dictionary with extracted metadata fields (may be empty if extraction fails)
     """
     metadata = {}
-    if not resource_json or not resource_json.strip():
+    if not isinstance(resource, dict):
         return metadata
     
     try:
-        resource = json.loads(resource_json)
-        
         # Extract effective date (varies by resource type)
         if "effectiveDateTime" in resource:
             metadata["effectiveDate"] = resource["effectiveDateTime"]
@@ -715,11 +790,97 @@ def extract_resource_metadata(resource_json: str) -> dict:
                 metadata["lastUpdated"] = resource["meta"]["lastUpdated"]
             
     except Exception as e:
-        logger.debug(f"Could not extract metadata from JSON: {e}")
+        logger.debug(f"Could not extract metadata from resource: {e}")
     
     return metadata
 
 
+def _chunk_note(note) -> list:
+    """
+    Chunk a clinical note's resource JSON, falling back to its text content.
+    
+    Args:
+        note: ClinicalNote object with resource data
+    
+    Returns:
+        List of chunk dicts with chunk_id, chunk_type, text, chunk_size, chunk_index
+    """
+    # Use RecursiveJsonSplitter if JSON is available, otherwise use RecursiveCharacterTextSplitter
+    if note.resourceJson and note.resourceJson.strip():
+        logger.info("  Using RecursiveJsonSplitter on JSON resource")
+        json_to_chunk = note.resourceJson
+        chunk_hierarchy = recursive_json_chunking(
+            json_to_chunk,
+            max_chunk_size=1000,
+            min_chunk_size=500
+        )
+    else:
+        logger.warning("  No JSON resource provided, using RecursiveCharacterTextSplitter on content")
+        # Fallback to RecursiveCharacterTextSplitter when JSON is not available
+        if LANGCHAIN_AVAILABLE and RecursiveCharacterTextSplitter:
+            text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1000,
+                chunk_overlap=100,
+                separators=["\n\n", "\n", ". ", " ", ""],
+                length_function=len
+            )
+            split_chunks = text_splitter.split_text(note.content)
+            chunk_hierarchy = []
+            for i, chunk_text in enumerate(split_chunks):
+                if chunk_text.strip():
+                    chunk_hierarchy.append({
+                        "chunk_id": f"chunk_{i}",
+                        "chunk_type": "chunk",
+                        "text": chunk_text,
+                        "chunk_size": len(chunk_text),
+                        "chunk_index": i
+                    })
+        else:
+            # Final fallback: simple splitting
+            chunk_hierarchy = []
+            for i in range(0, len(note.content), 1000):
+                chunk_text = note.content[i:i+1000]
+                if chunk_text.strip():
+                    chunk_hierarchy.append({
+                        "chunk_id": f"chunk_{i // 1000}",
+                        "chunk_type": "chunk",
+                        "text": chunk_text,
+                        "chunk_size": len(chunk_text),
+                        "chunk_index": i // 1000
+                    })
+    return chunk_hierarchy
+
+
+def _chunk_metadata(note, chunk: dict, total_chunks: int, resource_metadata: dict) -> dict:
+    """Build the stored metadata for one chunk of a clinical note."""
+    # Build metadata (using snake_case for consistency with retrieval)
+    metadata = {
+        # Core identifiers
+        "patient_id": note.patient_id,
+        "resource_id": note.id,
+        "resource_type": note.resourceType,
+        "full_url": note.fullUrl,
+        "source_file": note.sourceFile,
+        
+        # Chunk identifiers
+        "chunk_id": f"{note.id}_{chunk['chunk_id']}",
+        "chunk_index": chunk["chunk_index"],
+        "total_chunks": total_chunks,
+        
+        # Chunk properties
+        "chunk_size": chunk["chunk_size"],
+    }
+    
+    # Add extracted metadata from resource JSON if available (snake_case)
+    if "effectiveDate" in resource_metadata:
+        metadata["effective_date"] = resource_metadata["effectiveDate"]
+    if "status" in resource_metadata:
+        metadata["status"] = resource_metadata["status"]
+    if "lastUpdated" in resource_metadata:
+        metadata["last_updated"] = resource_metadata["lastUpdated"]
+    return metadata
+
+
 async def process_and_store(note):
     """
     Process and store a clinical note with RecursiveJsonSplitter chunking.
@@ -737,49 +898,7 @@ async def process_and_store(note):
         logger.info(f"  Content Length: {len(note.content)} chars")
         logger.info(f"{'='*80}")
         
-        # Use RecursiveJsonSplitter if JSON is available, otherwise use RecursiveCharacterTextSplitter
-        if note.resourceJson and note.resourceJson.strip():
-            logger.info("  Using RecursiveJsonSplitter on JSON resource")
-            json_to_chunk = note.resourceJson
-            chunk_hierarchy = recursive_json_chunking(
-                json_to_chunk,
-                max_chunk_size=1000,
-                min_chunk_size=500
-            )
-        else:
-            logger.warning("  No JSON resource provided, using RecursiveCharacterTextSplitter on content")
-            # Fallback to RecursiveCharacterTextSplitter when JSON is not available
-            if LANGCHAIN_AVAILABLE and RecursiveCharacterTextSplitter:
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1000,
-                    chunk_overlap=100,
-                    separators=["\n\n", "\n", ". ", " ", ""],
-                    length_function=len
-                )
-                split_chunks = text_splitter.split_text(note.content)
-                chunk_hierarchy = []
-                for i, chunk_text in enumerate(split_chunks):
-                    if chunk_text.strip():
-                        chunk_hierarchy.append({
-                            "chunk_id": f"chunk_{i}",
-                            "chunk_type": "chunk",
-                            "text": chunk_text,
-                            "chunk_size": len(chunk_text),
-                            "chunk_index": i
-                        })
-            else:
-                # Final fallback: simple splitting
-                chunk_hierarchy = []
-                for i in range(0, len(note.content), 1000):
-                    chunk_text = note.content[i:i+1000]
-                    if chunk_text.strip():
-                        chunk_hierarchy.append({
-                            "chunk_id": f"chunk_{i // 1000}",
-                            "chunk_type": "chunk",
-                            "text": chunk_text,
-                            "chunk_size": len(chunk_text),
-                            "chunk_index": i // 1000
-                        })
+        chunk_hierarchy = _chunk_note(note)
         
         if not chunk_hierarchy:
             logger.warning(f"No chunks created for {note.id}")
@@ -812,31 +931,7 @@ async def process_and_store(note):
             else:
                 embedding_info = "Embedding: Not available"
             
-            # Build metadata (using snake_case for consistency with retrieval)
-            metadata = {
-                # Core identifiers
-                "patient_id": note.patient_id,
-                "resource_id": note.id,
-                "resource_type": note.resourceType,
-                "full_url": note.fullUrl,
-                "source_file": note.sourceFile,
-                
-                # Chunk identifiers
-                "chunk_id": f"{note.id}_{chunk_id}",
-                "chunk_index": chunk["chunk_index"],
-                "total_chunks": total_chunks,
-                
-                # Chunk properties
-                "chunk_size": chunk["chunk_size"],
-            }
-            
-            # Add extracted metadata from resource JSON if available (snake_case)
-            if "effectiveDate" in resource_metadata:
-                metadata["effective_date"] = resource_metadata["effectiveDate"]
-            if "status" in resource_metadata:
-                metadata["status"] = resource_metadata["status"]
-            if "lastUpdated" in resource_metadata:
-                metadata["last_updated"] = resource_metadata["lastUpdated"]
+            metadata = _chunk_metadata(note, chunk, total_chunks, resource_metadata)
             
             # Display chunk details
             logger.info(f"\n{'═' * 80}")
@@ -964,3 +1059,76 @@ async def process_and_store(note):
         
     except Exception as e:
         logger.error(f"Error processing note {note.id}: {e}", exc_info=True)
+
+
+async def process_and_store_batch(notes):
+    """
+    Process and store many clinical notes with one embedding call and one insert.
+    
+    Chunks each note the same way as process_and_store, embeds every chunk
+    text in a single get_embeddings call, then writes all rows at once.
+    
+    Args:
+        notes: List of ClinicalNote objects
+    """
+    import asyncio
+    import uuid
+    
+    try:
+        from api.database.postgres import log_error, store_chunks_batch, store_chunks_bulk, validate_chunk
+    except ImportError as e:
+        logger.warning(f"Could not import PostgreSQL vector store functions: {e}")
+        return
+    
+    try:
+        chunk_texts = []
+        metadatas = []
+        chunk_ids = []
+        for note in notes:
+            chunk_hierarchy = _chunk_note(note)
+            if not chunk_hierarchy:
+                logger.warning(f"No chunks created for {note.id}")
+                continue
+            
+            resource_metadata = extract_resource_metadata(note.resourceJson) if note.resourceJson else {}
+            total_chunks = len(chunk_hierarchy)
+            for chunk in chunk_hierarchy:
+                chunk_uuid = str(uuid.uuid4())
+                metadata = _chunk_metadata(note, chunk, total_chunks, resource_metadata)
+                is_valid, validation_msg = validate_chunk(chunk["text"], chunk_uuid, metadata)
+                if not is_valid:
+                    await log_error(
+                        file_id=note.sourceFile,
+                        resource_id=note.id,
+                        chunk_id=chunk_uuid,
+                        chunk_index=chunk["chunk_index"],
+                        error_type="validation",
+                        error_message=validation_msg,
+                        metadata=metadata,
+                        source_file=note.sourceFile,
+                    )
+                    logger.warning(f"⚠ Skipping invalid chunk {note.id}_{chunk['chunk_id']}: {validation_msg}")
+                    continue
+                chunk_texts.append(chunk["text"])
+                metadatas.append(metadata)
+                chunk_ids.append(chunk_uuid)
+        
+        if not chunk_texts:
+            logger.warning(f"No chunks created for batch of {len(notes)} resources")
+            return
+        
+        embeddings = await asyncio.to_thread(get_embeddings, chunk_texts)
+        if embeddings and all(embeddings):
+            stored = await store_chunks_bulk(chunk_texts, embeddings, metadatas, chunk_ids)
+        else:
+            # Partial or failed embedding - let the per-chunk path embed and queue retries
+            logger.warning("Batch embedding incomplete, storing chunks individually")
+            stored = await store_chunks_batch([
+                {"text": chunk_text, "id": chunk_id, "metadata": metadata}
+                for chunk_text, chunk_id, metadata in zip(chunk_texts, chunk_ids, metadatas)
+            ])
+        
+        logger.info(f"✓ Stored {stored}/{len(chunk_texts)} chunks from {len(notes)} resources")
+        
+    except Exception as e:
+        logger.error(f"Error processing batch of {len(notes)} notes: {e}", exc_info=True)
@@ -114,6 +114,14 @@ async def _on_startup() -> None:
     except Exception as e:
         print(f"[STARTUP] Vector store pre-warm failed (will retry on first query): {e}")
 
+    # Create raw FHIR tables up front so full-document reads never pay the DDL
+    try:
+        from postgres.ingest_fhir_json import ensure_tables_once
+        await ensure_tables_once()
+        print("[STARTUP] Raw FHIR tables ready")
+    except Exception as e:
+        print(f"[STARTUP] Raw FHIR table check failed (will retry on first read): {e}")
+
     # Pre-warm reranker model
     try:
         from api.retrieval.cross_encoder import Reranker
@@ -3,14 +3,25 @@
 Batch Embedding Script for FHIR Patient Data — Amazon Bedrock Titan
 
 Direct Bedrock embedding script that bypasses the HTTP API layer for maximum
-throughput. Reads from fhir_raw_files in Postgres, chunks with RecursiveJsonSplitter,
+throughput. Reads from fhir_raw_files in Postgres, chunks each resource by top-level field,
 embeds via Bedrock Titan with parallel API calls, and bulk-inserts into hc_ai_table.
 
 Key optimizations over batch_embed_patients.py:
 - Direct Bedrock API calls (no FastAPI server needed)
-- Parallel embedding (25 concurrent Bedrock calls via ThreadPoolExecutor)
-- Bulk DB inserts (50 documents per aadd_documents call)
-- Concurrent patient fetching (5 patients via asyncio)
+- Parallel embedding (CPU count × 8 concurrent Bedrock calls via ThreadPoolExecutor,
+  override with BEDROCK_MAX_PARALLEL / --embed-batch)
+- Multi-input requests (96 texts per call) for models that support them (Cohere Embed)
+- Identical chunk texts are embedded once (per call and via a run-wide LRU)
+- Pipelined stages: chunking, Bedrock embedding and DB loads overlap via
+  bounded queues (fetch/chunk -> embed workers -> insert writer)
+- Bulk DB loads via binary COPY FROM STDIN of pre-embedded vectors (pgvector
+  wire format, no float parsing on the server), buffered across
+  patients by a single writer task (1000 documents per COPY)
+- Batched bundle fetching (one query per group of patients, prefetched one
+  group ahead) with concurrent chunking (5 patients, in a process pool)
+- Resumes at resource granularity: half-embedded patients are picked up
+  again and only their missing or changed resources are (re-)embedded
+- HNSW vector index built once after the bulk load (if the table has none)
 
 Usage:
     python scripts/batch_embed_bedrock.py [options]
@@ -18,25 +29,46 @@ Usage:
 Options:
     --limit N           Only process first N patients
     --batch-size N      Concurrent patients (default: 5)
-    --embed-batch N     Parallel Bedrock calls (default: 25)
-    --insert-batch N    Documents per DB insert (default: 50)
+    --embed-batch N     Parallel Bedrock calls (default: BEDROCK_MAX_PARALLEL or CPU count × 8)
+    --insert-batch N    Documents per COPY, coalesced across patients (default: 1000)
+    --skip-index        Do not build the HNSW vector index after loading
     --dry-run           Show what would be done without making changes
 
 Environment Variables:
     AWS_REGION              AWS region for Bedrock (default: us-east-1)
-    BEDROCK_EMBED_MODEL     Model ID (default: amazon.titan-embed-text-v2:0)
+    BEDROCK_MAX_PARALLEL    Concurrent Bedrock calls; set toward your account's
+                            Bedrock concurrency quota (default: CPU count × 8)
+    BEDROCK_MAX_RPS         Bedrock requests/second shared by all threads; 0 disables
+                            the limiter (default: 500)
+    BEDROCK_EMBED_MODEL     Model ID (default: amazon.titan-embed-text-v2:0).
+                            cohere.embed-* models are embedded 96 texts per request.
+    BEDROCK_EMBED_CACHE_SIZE  Chunk vectors kept for reuse across patients (default: 16384)
     DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME - Database connection
+    HC_AI_CHUNK_WORKERS     Processes used for chunking bundles (default: CPU count)
+    HC_AI_VECTOR_TYPE       "vector" (default) or "halfvec" to store fp16 embeddings when
+                            the table is created (pgvector >= 0.7). Existing tables can be
+                            converted with ALTER COLUMN embedding TYPE halfvec(1024); rebuild
+                            vector indexes with halfvec_cosine_ops afterwards. Loads always
+                            follow the existing column's type (a mismatch is logged)
+    HC_AI_INSERT_MODE       "copy" (default) or "executemany". executemany sends one
+                            prepared INSERT pipelined over all rows, for setups
+                            where COPY FROM STDIN is not available
 """
 
 import argparse
 import asyncio
-import json
+import hashlib
 import os
+import random
+import struct
 import sys
+import threading
 import time
 import uuid
+import weakref
 import logging
-from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Set, Tuple
@@ -54,11 +86,13 @@ load_env_recursive(ROOT_DIR)
 os.environ.setdefault("EMBEDDING_PROVIDER", "bedrock")
 
 import boto3
+import numpy as np
+import orjson
 from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
-from langchain_postgres import PGVectorStore, PGEngine
+from langchain_postgres import PGEngine
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 
@@ -69,8 +103,8 @@ _helper_path = ROOT_DIR / "api" / "embeddings" / "utils" / "helper.py"
 _spec = _ilu.spec_from_file_location("helper", _helper_path)
 _helper = _ilu.module_from_spec(_spec)
 _spec.loader.exec_module(_helper)
-recursive_json_chunking = _helper.recursive_json_chunking
-extract_resource_metadata = _helper.extract_resource_metadata
+fhir_fast_chunk = _helper.fhir_fast_chunk
+extract_resource_metadata_dict = _helper.extract_resource_metadata_dict
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # LOGGING
@@ -84,8 +118,6 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Suppress noisy loggers from imports
-# recursive_json_chunking logs ERROR for each resource where RecursiveJsonSplitter
-# hits an edge case — the fallback (single chunk) still works, so treat as debug noise
 for name in ("api.embeddings.utils.helper", "helper", "langchain_postgres", "botocore", "urllib3"):
     logging.getLogger(name).setLevel(logging.CRITICAL)
 
@@ -100,38 +132,141 @@ DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME")
 SCHEMA_NAME = os.getenv("HC_AI_SCHEMA", "hc_ai_schema")
 TABLE_NAME = "hc_ai_table"
+# One row per patient, written in the same transaction as its last chunks:
+# the bundle version that is fully embedded (see get_patients_needing_embedding)
+PROGRESS_TABLE = "hc_ai_embed_progress"
 VECTOR_SIZE = 1024
+# "halfvec" stores embeddings as fp16 (pgvector >= 0.7): half the table and
+# index size. Only applied when this script creates the table
+VECTOR_TYPE = os.getenv("HC_AI_VECTOR_TYPE", "vector").lower()
 
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 BEDROCK_MODEL_ID = os.getenv("BEDROCK_EMBED_MODEL", "amazon.titan-embed-text-v2:0")
 
+# Bedrock calls are I/O-bound, so size the pool well past cpu_count()+4
+# (ThreadPoolExecutor's default) — the real limit is the account quota
+DEFAULT_MAX_PARALLEL = int(os.getenv("BEDROCK_MAX_PARALLEL", str((os.cpu_count() or 4) * 8)))
+
+# Shared request-rate ceiling across all worker threads (token bucket), so a
+# large pool does not overshoot the account quota and retry in lockstep
+BEDROCK_MAX_RPS = float(os.getenv("BEDROCK_MAX_RPS", "500"))
+
+# Models whose invoke_model body accepts a list of inputs ({"texts": [...]}).
+# Titan Embed v2 only takes a single "inputText", so it stays one call per text.
+MULTI_INPUT_MODEL_PREFIXES = ("cohere.embed",)
+MAX_INPUTS_PER_CALL = 96  # Cohere Embed limit per request
+
+# FHIR bundles repeat sub-resources (same Organization, CodeableConcept, ...),
+# so identical chunk texts are embedded once and reused. The LRU keeps the
+# most recent vectors across patients (4KB each as float32 arrays)
+EMBED_CACHE_SIZE = int(os.getenv("BEDROCK_EMBED_CACHE_SIZE", "16384"))
+
+# COPY batching: flush once this many rows are buffered, or when the insert
+# queue has been idle for INSERT_FLUSH_IDLE_SECONDS
+MAX_INSERT_BATCH = 10_000
+INSERT_FLUSH_IDLE_SECONDS = 0.2
+# Embedding stage: workers coalesce queued patients into one embed_documents
+# call of up to EMBED_COALESCE_FACTOR × max_workers texts
+EMBED_WORKERS = 2
+EMBED_QUEUE_SIZE = 4
+EMBED_COALESCE_FACTOR = 4
+# Chunking is pure-Python CPU work, so it runs in worker processes to keep
+# the event loop (and the Bedrock/DB stages it drives) responsive
+CHUNK_WORKERS = int(os.getenv("HC_AI_CHUNK_WORKERS", str(os.cpu_count() or 1)))
+INSERT_MODE = os.getenv("HC_AI_INSERT_MODE", "copy").lower()
+
 # Global DB engine
 _engine: Optional[AsyncEngine] = None
+_chunk_pool: Optional[ProcessPoolExecutor] = None
+_bedrock_executor: Optional[ThreadPoolExecutor] = None
 
 
 def get_engine() -> AsyncEngine:
     global _engine
     if _engine is None:
         conn_str = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        _engine = create_async_engine(conn_str, pool_size=10, max_overflow=5, echo=False)
+        _engine = create_async_engine(
+            conn_str,
+            pool_size=10,
+            max_overflow=5,
+            echo=False,
+        )
     return _engine
 
 
+def get_chunk_pool() -> ProcessPoolExecutor:
+    global _chunk_pool
+    if _chunk_pool is None:
+        _chunk_pool = ProcessPoolExecutor(max_workers=CHUNK_WORKERS)
+    return _chunk_pool
+
+
+def shutdown_chunk_pool():
+    global _chunk_pool
+    if _chunk_pool is not None:
+        _chunk_pool.shutdown(wait=True)
+        _chunk_pool = None
+
+
+def get_bedrock_executor(max_workers: int = DEFAULT_MAX_PARALLEL) -> ThreadPoolExecutor:
+    """
+    Thread pool shared by all Bedrock calls and the event loop's default
+    executor. Sized by the first caller; later calls reuse it as is.
+    """
+    global _bedrock_executor
+    if _bedrock_executor is None:
+        _bedrock_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bedrock")
+    return _bedrock_executor
+
+
+def shutdown_bedrock_executor():
+    """Wait for in-flight Bedrock calls; drop calls that have not started."""
+    global _bedrock_executor
+    if _bedrock_executor is not None:
+        _bedrock_executor.shutdown(wait=True, cancel_futures=True)
+        _bedrock_executor = None
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # BEDROCK EMBEDDINGS (BATCHED VIA THREAD POOL)
 # ═══════════════════════════════════════════════════════════════════════════════
 
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a request slot is free."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
 class BatchBedrockEmbeddings(Embeddings):
     """
     LangChain-compatible embeddings using Amazon Bedrock Titan.
-    Parallelizes invoke_model calls using a shared ThreadPoolExecutor.
+    Parallelizes invoke_model calls on the shared Bedrock thread pool
+    (see get_bedrock_executor).
     """
 
     def __init__(
         self,
         model_id: str = BEDROCK_MODEL_ID,
         region: str = AWS_REGION,
-        max_workers: int = 25,
+        max_workers: int = DEFAULT_MAX_PARALLEL,
+        max_rps: float = BEDROCK_MAX_RPS,
     ):
         self.model_id = model_id
         self.region = region
@@ -139,50 +274,175 @@ class BatchBedrockEmbeddings(Embeddings):
         # Size boto3's HTTP pool to match thread count (avoids "pool is full" warnings)
         boto_config = BotoConfig(max_pool_connections=max_workers + 5)
         self.client = boto3.client("bedrock-runtime", region_name=self.region, config=boto_config)
-        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._executor = get_bedrock_executor(max_workers)
+        self._limiter = TokenBucket(max_rps) if max_rps > 0 else None
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
         self._call_count = 0
         self._retry_count = 0
+        self._cache_hits = 0
+
+    def _supports_multi_input(self) -> bool:
+        """Whether the model accepts several inputs in one invoke_model body."""
+        return self.model_id.startswith(MULTI_INPUT_MODEL_PREFIXES)
+
+    def _invoke(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Call invoke_model with retry for throttling and return the parsed body.
 
-    def _embed_single(self, text_input: str) -> List[float]:
-        """Embed a single text with retry for throttling."""
+        Every attempt takes a token from the shared limiter, and throttling
+        retries sleep a fully jittered delay so threads that were throttled
+        together do not all retry at the same moment.
+        """
         max_retries = 5
         for attempt in range(max_retries):
+            if self._limiter is not None:
+                self._limiter.acquire()
             try:
-                body = json.dumps({"inputText": text_input})
                 response = self.client.invoke_model(
                     modelId=self.model_id,
-                    body=body,
+                    body=orjson.dumps(body),
                     contentType="application/json",
                     accept="application/json",
                 )
-                result = json.loads(response["body"].read())
+                result = orjson.loads(response["body"].read())
                 self._call_count += 1
-                return result.get("embedding", [])
+                return result
             except ClientError as e:
                 error_code = e.response["Error"]["Code"]
                 if error_code in ("ThrottlingException", "TooManyRequestsException") and attempt < max_retries - 1:
-                    delay = min(2 ** attempt, 16)
+                    delay = random.uniform(0, min(2 ** attempt, 16))
                     self._retry_count += 1
                     time.sleep(delay)
                     continue
                 raise
-        return []  # unreachable but satisfies type checker
+        return {}  # unreachable but satisfies type checker
+
+    def _embed_single(self, text_input: str) -> np.ndarray:
+        """Embed a single text (Titan request body)."""
+        result = self._invoke({"inputText": text_input})
+        return np.asarray(result.get("embedding", []), dtype=np.float32)
+
+    def _embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Embed up to MAX_INPUTS_PER_CALL texts with one invoke_model call.
+
+        Only valid for multi-input models (Cohere Embed). Titan Embed v2's
+        invoke_model body takes a single ``inputText``, so Titan texts go
+        through _embed_single instead.
+        """
+        result = self._invoke({"texts": texts, "input_type": "search_document"})
+        embeddings = result.get("embeddings", [])
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Bedrock returned {len(embeddings)} embeddings for {len(texts)} texts")
+        return list(np.asarray(embeddings, dtype=np.float32))
+
+    def _dedup(self, texts: List[str]) -> Tuple[Dict[str, np.ndarray], List[str]]:
+        """
+        Split texts into cached vectors and unique texts still to embed.
+
+        Cache access happens on the calling thread only (never inside the
+        pool), so the OrderedDict needs no lock.
+        """
+        found: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+        for t in dict.fromkeys(texts):
+            vec = self._cache.get(t)
+            if vec is None:
+                missing.append(t)
+            else:
+                self._cache.move_to_end(t)
+                found[t] = vec
+        self._cache_hits += len(texts) - len(missing)
+        return found, missing
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Embed multiple texts in parallel using the shared thread pool."""
-        workers = min(self.max_workers, len(texts))
-        if workers == 0:
+    def _scatter(
+        self,
+        texts: List[str],
+        found: Dict[str, np.ndarray],
+        missing: List[str],
+        vectors: List[np.ndarray],
+    ) -> List[np.ndarray]:
+        """Cache freshly embedded vectors and map every input text to its vector."""
+        for t, vec in zip(missing, vectors):
+            found[t] = vec
+            self._cache[t] = vec
+        while len(self._cache) > EMBED_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return [found[t] for t in texts]
+
+    def _embed_unique(self, texts: List[str]) -> List[np.ndarray]:
+        if not texts:
             return []
+        if self._supports_multi_input():
+            batches = self._split_batches(texts)
+            return [vec for batch in self._executor.map(self._embed_batch, batches) for vec in batch]
         return list(self._executor.map(self._embed_single, texts))
 
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed multiple texts in parallel using the shared thread pool.
+
+        Duplicate texts (and texts seen recently) are only sent to Bedrock
+        once. Multi-input models embed MAX_INPUTS_PER_CALL texts per request
+        and the pool parallelizes across those batches; single-input models
+        fan out one request per text.
+        """
+        if not texts:
+            return []
+        found, missing = self._dedup(texts)
+        vectors = self._scatter(texts, found, missing, self._embed_unique(missing))
+        return [v.tolist() for v in vectors]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Async embed_documents: submits each boto3 call to the shared thread
+        pool and awaits them, so the event loop stays free for DB I/O.
+        """
+        return [v.tolist() for v in await self.aembed_arrays(texts)]
+
+    async def aembed_arrays(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Like aembed_documents, but returns float32 arrays instead of
+        lists of Python floats (4KB per vector instead of ~32KB). Used by
+        the pipeline, which hands the arrays straight to the COPY writer.
+        """
+        if not texts:
+            return []
+        found, missing = self._dedup(texts)
+        loop = asyncio.get_running_loop()
+        if not missing:
+            vectors: List[np.ndarray] = []
+        elif self._supports_multi_input():
+            results = await asyncio.gather(*(
+                loop.run_in_executor(self._executor, self._embed_batch, batch)
+                for batch in self._split_batches(missing)
+            ))
+            vectors = [vec for batch in results for vec in batch]
+        else:
+            vectors = list(await asyncio.gather(*(
+                loop.run_in_executor(self._executor, self._embed_single, t) for t in missing
+            )))
+        return self._scatter(texts, found, missing, vectors)
+
+    async def aembed_query(self, text_input: str) -> List[float]:
+        """Async embed_query on the shared thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.embed_query, text_input)
+
+    @staticmethod
+    def _split_batches(texts: List[str]) -> List[List[str]]:
+        return [texts[i : i + MAX_INPUTS_PER_CALL] for i in range(0, len(texts), MAX_INPUTS_PER_CALL)]
+
     def embed_query(self, text_input: str) -> List[float]:
         """Embed a single query text."""
-        return self._embed_single(text_input)
+        if self._supports_multi_input():
+            return self._embed_batch([text_input])[0].tolist()
+        return self._embed_single(text_input).tolist()
 
     def test_connection(self) -> bool:
         """Verify Bedrock access with a single test embedding."""
         try:
-            result = self._embed_single("connection test")
+            result = self.embed_query("connection test")
             if result and len(result) == VECTOR_SIZE:
                 return True
             logger.error(f"Unexpected embedding dimension: {len(result)} (expected {VECTOR_SIZE})")
@@ -191,24 +451,46 @@ class BatchBedrockEmbeddings(Embeddings):
             logger.error(f"Bedrock connection test failed: {e}")
             return False
 
-    def shutdown(self):
-        self._executor.shutdown(wait=False)
+    def prewarm(self):
+        """
+        Open the pool's HTTPS connections before the real workload.
+
+        Issues max_workers tiny embed calls in parallel so every worker
+        thread pays its TLS handshake (and boto3 its credential/signing
+        setup) now rather than on the first patients' chunks.
+        """
+        try:
+            list(self._executor.map(self.embed_query, ["connection test"] * self.max_workers))
+        except Exception as e:
+            # Not fatal: the real calls will open connections on demand
+            logger.warning(f"Bedrock pre-warm failed: {e}")
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
-# PATIENT DISCOVERY (reused SQL from batch_embed_patients.py)
+# PATIENT DISCOVERY
 # ═══════════════════════════════════════════════════════════════════════════════
 
-async def get_embedded_patients() -> Set[str]:
-    """Get patient IDs that already have embeddings."""
+async def get_embedded_resource_hashes(patient_ids: List[str]) -> Dict[str, Dict[str, Optional[str]]]:
+    """
+    Get the resources that already have embeddings, per patient, with the
+    resource_hash their chunks were built from (None for chunks stored
+    before the hash was recorded).
+    """
+    if not patient_ids:
+        return {}
     engine = get_engine()
     async with engine.begin() as conn:
         result = await conn.execute(text(f'''
-            SELECT DISTINCT langchain_metadata->>'patient_id'
+            SELECT langchain_metadata->>'patient_id', langchain_metadata->>'resource_id',
+                   MIN(langchain_metadata->>'resource_hash')
             FROM "{SCHEMA_NAME}".{TABLE_NAME}
-            WHERE langchain_metadata->>'patient_id' IS NOT NULL
-        '''))
-        return {row[0] for row in result.fetchall()}
+            WHERE langchain_metadata->>'patient_id' = ANY(:patient_ids)
+            GROUP BY 1, 2
+        '''), {"patient_ids": list(patient_ids)})
+        embedded: Dict[str, Dict[str, Optional[str]]] = {}
+        for patient_id, resource_id, resource_hash in result.fetchall():
+            embedded.setdefault(patient_id, {})[resource_id] = resource_hash
+        return embedded
 
 
 async def get_all_fhir_patients() -> List[str]:
@@ -224,46 +506,111 @@ async def get_all_fhir_patients() -> List[str]:
 
 
 async def get_patients_needing_embedding() -> List[str]:
-    """Get patient IDs that have FHIR data but no embeddings yet."""
-    embedded = await get_embedded_patients()
-    all_patients = await get_all_fhir_patients()
-    return [p for p in all_patients if p not in embedded]
+    """
+    Get patient IDs whose latest bundle version is not marked as embedded.
 
+    Completion is recorded explicitly in PROGRESS_TABLE once a patient's
+    chunks are committed (see mark_patients_embedded), so discovery only
+    compares bundle versions and never parses bundle_json. Patients left
+    half-embedded by an interrupted run have no marker and are picked up
+    again, as are patients with a newer bundle; resources whose chunks
+    match the bundle's content are skipped (see get_embedded_resource_hashes).
 
-async def get_patient_fhir_data(patient_id: str) -> List[Dict[str, Any]]:
-    """Fetch the latest FHIR bundle for a patient."""
+    Before the first non dry-run run creates PROGRESS_TABLE (backfilling it,
+    see init_vector_store), patients with rows in TABLE_NAME count as done.
+    """
     engine = get_engine()
     async with engine.begin() as conn:
+        result = await conn.execute(
+            text("SELECT to_regclass(:progress), to_regclass(:table)"),
+            {"progress": f'"{SCHEMA_NAME}".{PROGRESS_TABLE}', "table": f'"{SCHEMA_NAME}".{TABLE_NAME}'},
+        )
+        progress_table, vector_table = result.one()
+        if progress_table is None:
+            if vector_table is None:
+                return await get_all_fhir_patients()
+            result = await conn.execute(text(f'''
+                SELECT DISTINCT f.patient_id
+                FROM "{SCHEMA_NAME}".fhir_raw_files f
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM "{SCHEMA_NAME}".{TABLE_NAME} t
+                    WHERE t.langchain_metadata->>'patient_id' = f.patient_id
+                )
+                ORDER BY f.patient_id
+            '''))
+            return [row[0] for row in result.fetchall()]
         result = await conn.execute(text(f'''
-            SELECT source_filename, bundle_json
+            SELECT f.patient_id
+            FROM (
+                SELECT patient_id, MAX(version) AS version
+                FROM "{SCHEMA_NAME}".fhir_raw_files
+                GROUP BY patient_id
+            ) f
+            LEFT JOIN "{SCHEMA_NAME}".{PROGRESS_TABLE} p USING (patient_id)
+            WHERE p.bundle_version IS NULL OR p.bundle_version < f.version
+            ORDER BY f.patient_id
+        '''))
+        return [row[0] for row in result.fetchall()]
+
+
+async def get_patient_fhir_data_many(patient_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Fetch the latest FHIR bundle for each patient in one query.
+
+    DISTINCT ON walks the (patient_id, version) primary key backwards (both
+    sort keys DESC, so no Sort node), so this is one round-trip per group
+    instead of one per patient. Patients without a bundle are absent from
+    the result.
+    """
+    if not patient_ids:
+        return {}
+    engine = get_engine()
+    async with engine.begin() as conn:
+        result = await conn.execute(text(f'''
+            SELECT DISTINCT ON (patient_id) patient_id, source_filename, bundle_json, version
             FROM "{SCHEMA_NAME}".fhir_raw_files
-            WHERE patient_id = :patient_id
-            ORDER BY version DESC
-            LIMIT 1
-        '''), {"patient_id": patient_id})
-        rows = result.fetchall()
-        return [{"filename": r[0], "bundle": r[1]} for r in rows]
+            WHERE patient_id = ANY(:patient_ids)
+            ORDER BY patient_id DESC, version DESC
+        '''), {"patient_ids": list(patient_ids)})
+        return {
+            r[0]: [{"filename": r[1], "bundle": r[2], "version": r[3]}]
+            for r in result.fetchall()
+        }
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # RESOURCE PROCESSING
 # ═══════════════════════════════════════════════════════════════════════════════
 
+def _resource_hash(resource: Dict[str, Any]) -> str:
+    """sha256 of a resource's canonical JSON; stored with its chunks as resource_hash."""
+    return hashlib.sha256(orjson.dumps(resource, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
 def process_patient_resources(
     patient_id: str,
     source_filename: str,
     bundle: Dict[str, Any],
-) -> List[Document]:
+    embedded: Optional[Dict[str, Optional[str]]] = None,
+) -> Tuple[List[Document], List[str]]:
     """
     Process a patient's FHIR bundle into Document objects ready for embedding.
 
-    Chunks each resource with RecursiveJsonSplitter and builds metadata
+    Chunks each resource with fhir_fast_chunk and builds metadata
     matching the format used by process_and_store() in helper.py.
+    embedded maps already-embedded resource IDs to their resource_hash;
+    resources whose hash still matches are left out.
+
+    Returns (documents, stale_resource_ids): the IDs in embedded whose
+    stored chunks no longer match the bundle (changed or removed
+    resources), to be deleted when the new chunks are written.
     """
     documents = []
+    embedded = embedded or {}
+    current: Set[str] = set()
 
     if not isinstance(bundle, dict):
-        return documents
+        return documents, []
 
     entries = bundle.get("entry", [])
 
@@ -274,25 +621,21 @@ def process_patient_resources(
 
         if not resource_type:
             continue
-
-        # Serialize resource to JSON for chunking (same as process_and_store)
-        resource_json = json.dumps(resource, ensure_ascii=False)
-
-        if not resource_json or len(resource_json.strip()) < 10:
+        resource_hash = _resource_hash(resource)
+        if resource_id in embedded and embedded[resource_id] == resource_hash:
+            current.add(resource_id)
             continue
 
-        # Chunk using RecursiveJsonSplitter (same params as process_and_store)
-        chunks = recursive_json_chunking(
-            resource_json,
-            max_chunk_size=1000,
-            min_chunk_size=500,
-        )
+        # Single-pass chunking by top-level field (≤1000 chars per chunk).
+        # Chunking and metadata extraction both work on the parsed dict, so
+        # the resource is never serialized whole and parsed back
+        chunks = fhir_fast_chunk(resource, max_chunk_size=1000)
 
         if not chunks:
             continue
 
         # Extract date/status metadata from the resource
-        resource_metadata = extract_resource_metadata(resource_json)
+        resource_metadata = extract_resource_metadata_dict(resource)
         total_chunks = len(chunks)
 
         for chunk in chunks:
@@ -309,6 +652,7 @@ def process_patient_resources(
                 "chunk_index": chunk["chunk_index"],
                 "total_chunks": total_chunks,
                 "chunk_size": chunk["chunk_size"],
+                "resource_hash": resource_hash,
             }
 
             if "effectiveDate" in resource_metadata:
@@ -325,15 +669,22 @@ def process_patient_resources(
             )
             documents.append(doc)
 
-    return documents
+    return documents, [rid for rid in embedded if rid not in current]
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # VECTOR STORE INITIALIZATION
 # ═══════════════════════════════════════════════════════════════════════════════
 
-async def init_vector_store(embeddings: BatchBedrockEmbeddings) -> PGVectorStore:
-    """Initialize PGVectorStore with the given embeddings service."""
+async def init_vector_store() -> None:
+    """
+    Create the vector store table, its patient_id index and the progress
+    table if missing; a new progress table next to an existing vector table
+    is backfilled from the patients already embedded.
+
+    PGVectorStore is only used for its table DDL; rows are loaded with
+    COPY (see copy_documents) rather than through aadd_documents.
+    """
     engine = get_engine()
     pg_engine = PGEngine.from_engine(engine=engine)
 
@@ -357,15 +708,418 @@ async def init_vector_store(embeddings: BatchBedrockEmbeddings) -> PGVectorStore
             vector_size=VECTOR_SIZE,
             schema_name=SCHEMA_NAME,
         )
+        if VECTOR_TYPE == "halfvec":
+            # ainit_vectorstore_table always creates vector(n); the new table is
+            # empty, so switching the column type is instant
+            async with engine.begin() as conn:
+                await conn.execute(text(f'''
+                    ALTER TABLE "{SCHEMA_NAME}".{TABLE_NAME}
+                    ALTER COLUMN embedding TYPE halfvec({VECTOR_SIZE})
+                '''))
+
+    # Discovery, resume and stale-chunk deletes look chunks up by patient_id.
+    # Built CONCURRENTLY so an already-populated table stays writable;
+    # CONCURRENTLY cannot run inside a transaction block
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f'''
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_hc_ai_patient_id
+            ON "{SCHEMA_NAME}".{TABLE_NAME} ((langchain_metadata->>'patient_id'))
+        '''))
+
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            text("SELECT to_regclass(:table)"),
+            {"table": f'"{SCHEMA_NAME}".{PROGRESS_TABLE}'},
+        )
+        progress_exists = result.scalar_one() is not None
+        await conn.execute(text(f'''
+            CREATE TABLE IF NOT EXISTS "{SCHEMA_NAME}".{PROGRESS_TABLE} (
+                patient_id TEXT PRIMARY KEY,
+                bundle_version INTEGER NOT NULL,
+                embedded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        '''))
+        if exists and not progress_exists:
+            # Rows stored before progress was tracked: patients that have any
+            # count as done at their latest bundle, so the first run does not
+            # re-chunk everyone (the rule discovery used before markers)
+            result = await conn.execute(text(f'''
+                INSERT INTO "{SCHEMA_NAME}".{PROGRESS_TABLE} (patient_id, bundle_version)
+                SELECT f.patient_id, MAX(f.version)
+                FROM "{SCHEMA_NAME}".fhir_raw_files f
+                WHERE EXISTS (
+                    SELECT 1 FROM "{SCHEMA_NAME}".{TABLE_NAME} t
+                    WHERE t.langchain_metadata->>'patient_id' = f.patient_id
+                )
+                GROUP BY f.patient_id
+                ON CONFLICT (patient_id) DO NOTHING
+            '''))
+            logger.info(f"Backfilled {result.rowcount} patients into {PROGRESS_TABLE}")
+
+    await detect_vector_type()
+
+
+async def detect_vector_type() -> str:
+    """
+    Read the embedding column's actual type and use it for COPY, casts and
+    the vector index.
+
+    HC_AI_VECTOR_TYPE only decides the type of a table this script creates;
+    an existing table keeps its own, and a binary codec for the other type
+    would make every COPY fail.
+    """
+    global _column_vector_type, _vector_wire_dtype
+    engine = get_engine()
+    async with engine.connect() as conn:
+        result = await conn.execute(text('''
+            SELECT format_type(atttypid, atttypmod)
+            FROM pg_attribute
+            WHERE attrelid = CAST(:table AS regclass) AND attname = 'embedding' AND NOT attisdropped
+        '''), {"table": f'"{SCHEMA_NAME}".{TABLE_NAME}'})
+        column_type = result.scalar_one_or_none()
+    base_type = (column_type or "").split("(")[0]
+    if base_type not in ("vector", "halfvec"):
+        raise RuntimeError(
+            f'"{SCHEMA_NAME}".{TABLE_NAME}.embedding is {column_type or "missing"}; expected vector or halfvec'
+        )
+    if base_type != VECTOR_TYPE:
+        logger.warning(
+            f"HC_AI_VECTOR_TYPE={VECTOR_TYPE} but the embedding column is {column_type}; using {base_type}"
+        )
+    _column_vector_type = base_type
+    _vector_wire_dtype = ">f2" if base_type == "halfvec" else ">f4"
+    return base_type
+
+
+VECTOR_INDEX_NAME = "idx_hc_ai_embedding_hnsw"
+
+
+async def ensure_vector_index() -> bool:
+    """
+    Build the HNSW similarity index once rows are loaded, if the table has
+    no vector index yet.
+
+    Building after the bulk load is much cheaper than maintaining the index
+    row by row during COPY. Later incremental runs insert into the existing
+    index (no rebuild); after very large reloads, consider dropping it first
+    or REINDEX-ing. An existing ivfflat/hnsw index on the table is left alone.
+
+    Returns True if an index was built.
+    """
+    engine = get_engine()
+    async with engine.begin() as conn:
+        result = await conn.execute(text('''
+            SELECT EXISTS (
+                SELECT 1
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_am am ON am.oid = c.relam
+                WHERE i.indrelid = CAST(:table AS regclass)
+                  AND am.amname IN ('hnsw', 'ivfflat')
+            )
+        '''), {"table": f'"{SCHEMA_NAME}".{TABLE_NAME}'})
+        if result.scalar_one():
+            return False
+
+    ops = "halfvec_cosine_ops" if _column_vector_type == "halfvec" else "vector_cosine_ops"
+    # CONCURRENTLY cannot run inside a transaction block
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f'''
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS {VECTOR_INDEX_NAME}
+            ON "{SCHEMA_NAME}".{TABLE_NAME}
+            USING hnsw (embedding {ops}) WITH (m = 16, ef_construction = 64)
+        '''))
+        # A failed CONCURRENTLY build leaves an invalid index behind
+        result = await conn.execute(text('''
+            SELECT indisvalid FROM pg_index WHERE indexrelid = CAST(:index AS regclass)
+        '''), {"index": f'"{SCHEMA_NAME}".{VECTOR_INDEX_NAME}'})
+        if not result.scalar_one():
+            raise RuntimeError(f"{VECTOR_INDEX_NAME} was created but is invalid; drop it and retry")
+    return True
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BULK LOAD (COPY FROM STDIN)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Column layout created by PGEngine.ainit_vectorstore_table
+COPY_COLUMNS = ["langchain_id", "content", "embedding", "langchain_metadata"]
+
+# pgvector binary wire format: int16 dim, int16 unused, then big-endian
+# float4 (vector) or float2 (halfvec) values. Both follow the embedding
+# column's actual type once detect_vector_type has run
+_column_vector_type = VECTOR_TYPE
+_vector_wire_dtype = ">f2" if VECTOR_TYPE == "halfvec" else ">f4"
+_VECTOR_HEADER = struct.Struct(">HH")
 
-    vector_store = await PGVectorStore.create(
-        engine=pg_engine,
-        table_name=TABLE_NAME,
-        schema_name=SCHEMA_NAME,
-        embedding_service=embeddings,
+# Raw asyncpg connections that already have the vector codec registered
+_vector_codec_conns: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _vector_literal(vector: np.ndarray) -> str:
+    """pgvector text literal; a JSON float array already has that shape."""
+    return orjson.dumps(vector, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+def _encode_vector(vector: np.ndarray) -> bytes:
+    data = np.asarray(vector, dtype=_vector_wire_dtype)
+    return _VECTOR_HEADER.pack(data.shape[0], 0) + data.tobytes()
+
+
+def _decode_vector(data: bytes) -> np.ndarray:
+    dim, _ = _VECTOR_HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=_vector_wire_dtype, count=dim, offset=_VECTOR_HEADER.size)
+
+
+async def _ensure_vector_codec(raw) -> None:
+    """Register the binary pgvector codec on an asyncpg connection (once)."""
+    if raw in _vector_codec_conns:
+        return
+    schema = await raw.fetchval(
+        "SELECT typnamespace::regnamespace::text FROM pg_type WHERE typname = $1",
+        _column_vector_type,
     )
+    await raw.set_type_codec(
+        _column_vector_type,
+        schema=schema,
+        encoder=_encode_vector,
+        decoder=_decode_vector,
+        format="binary",
+    )
+    _vector_codec_conns.add(raw)
+
 
-    return vector_store
+async def mark_patients_embedded(raw, versions: Dict[str, int]) -> None:
+    """
+    Record each patient's bundle version as fully embedded.
+
+    Runs on the raw asyncpg connection inside the caller's transaction, so a
+    marker only exists once the patient's chunks are committed.
+    """
+    if not versions:
+        return
+    await raw.executemany(f'''
+        INSERT INTO "{SCHEMA_NAME}".{PROGRESS_TABLE} (patient_id, bundle_version)
+        VALUES ($1, $2)
+        ON CONFLICT (patient_id) DO UPDATE
+        SET bundle_version = GREATEST({PROGRESS_TABLE}.bundle_version, EXCLUDED.bundle_version),
+            embedded_at = now()
+    ''', list(versions.items()))
+
+
+async def delete_stale_chunks(raw, stale: Dict[str, List[str]]) -> None:
+    """
+    Delete the chunks of resources whose content changed or that left the
+    bundle ({patient_id: [resource_id, ...]}).
+
+    Runs on the raw asyncpg connection inside the caller's transaction,
+    before the replacement chunks are written.
+    """
+    pairs = [(pid, rid) for pid, rids in stale.items() for rid in rids]
+    if not pairs:
+        return
+    await raw.executemany(f'''
+        DELETE FROM "{SCHEMA_NAME}".{TABLE_NAME}
+        WHERE langchain_metadata->>'patient_id' = $1
+          AND langchain_metadata->>'resource_id' = $2
+    ''', pairs)
+
+
+async def copy_documents(
+    docs: List[Document],
+    vectors: List[np.ndarray],
+    versions: Dict[str, int],
+    stale: Optional[Dict[str, List[str]]] = None,
+) -> int:
+    """
+    Bulk-load pre-embedded documents with a single binary COPY FROM STDIN.
+
+    Vectors travel in pgvector's binary format, so the server never parses
+    float text. Stale chunks are deleted and the patients in versions are
+    marked embedded in the same transaction; returns the number of rows copied.
+    """
+    if not docs and not versions:
+        return 0
+    records = [
+        (d.id, d.page_content, v, orjson.dumps(d.metadata).decode())
+        for d, v in zip(docs, vectors)
+    ]
+    engine = get_engine()
+    async with engine.connect() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        await _ensure_vector_codec(raw)
+        async with raw.transaction():
+            await delete_stale_chunks(raw, stale or {})
+            if records:
+                await raw.copy_records_to_table(
+                    TABLE_NAME,
+                    records=records,
+                    columns=COPY_COLUMNS,
+                    schema_name=SCHEMA_NAME,
+                )
+            await mark_patients_embedded(raw, versions)
+    return len(docs)
+
+
+async def insert_documents_executemany(
+    docs: List[Document],
+    vectors: List[np.ndarray],
+    versions: Dict[str, int],
+    stale: Optional[Dict[str, List[str]]] = None,
+) -> int:
+    """
+    Insert pre-embedded documents as one executemany over a single prepared INSERT.
+
+    Fallback for HC_AI_INSERT_MODE=executemany; asyncpg pipelines the bound
+    rows instead of round-tripping each INSERT. Stale chunks are deleted and
+    the patients in versions are marked embedded in the same transaction.
+    """
+    if not docs and not versions:
+        return 0
+    rows = [
+        {
+            "id": d.id,
+            "content": d.page_content,
+            "embedding": _vector_literal(v),
+            "metadata": orjson.dumps(d.metadata).decode(),
+        }
+        for d, v in zip(docs, vectors)
+    ]
+    engine = get_engine()
+    async with engine.begin() as conn:
+        # Same connection, so the deletes and marker join the transaction begin() opened
+        raw = (await conn.get_raw_connection()).driver_connection
+        await delete_stale_chunks(raw, stale or {})
+        if rows:
+            await conn.execute(text(f'''
+                INSERT INTO "{SCHEMA_NAME}".{TABLE_NAME} ({", ".join(COPY_COLUMNS)})
+                VALUES (CAST(:id AS uuid), :content, CAST(:embedding AS {_column_vector_type}), CAST(:metadata AS json))
+            '''), rows)
+        await mark_patients_embedded(raw, versions)
+    return len(docs)
+
+
+async def write_documents(
+    docs: List[Document],
+    vectors: List[np.ndarray],
+    versions: Dict[str, int],
+    stale: Optional[Dict[str, List[str]]] = None,
+) -> int:
+    """
+    Store pre-embedded documents using the configured HC_AI_INSERT_MODE,
+    replacing the stale chunks ({patient_id: [resource_id, ...]}), and mark
+    the patients in versions ({patient_id: bundle_version}) embedded.
+    """
+    if INSERT_MODE == "executemany":
+        return await insert_documents_executemany(docs, vectors, versions, stale)
+    return await copy_documents(docs, vectors, versions, stale)
+
+
+async def embed_worker(
+    embeddings: BatchBedrockEmbeddings,
+    in_queue: asyncio.Queue,
+    out_queue: asyncio.Queue,
+    stats: Dict[str, Any],
+) -> None:
+    """
+    Embed queued (patient_id, version, stale, docs) items and pass
+    (patient_id, version, stale, docs, vectors) on to the insert writer.
+
+    Items already waiting in the queue are coalesced into one embed_documents
+    call so small patients still keep the Bedrock thread pool busy.
+    A None item stops the worker.
+    """
+    max_texts = embeddings.max_workers * EMBED_COALESCE_FACTOR
+    stopping = False
+
+    while not stopping:
+        item = await in_queue.get()
+        in_queue.task_done()
+        if item is None:
+            return
+
+        batch = [item]
+        n_texts = len(item[3])
+        while n_texts < max_texts and not in_queue.empty():
+            nxt = in_queue.get_nowait()
+            in_queue.task_done()
+            if nxt is None:
+                stopping = True
+                break
+            batch.append(nxt)
+            n_texts += len(nxt[3])
+
+        texts = [d.page_content for _, _, _, docs in batch for d in docs]
+        try:
+            vectors = await embeddings.aembed_arrays(texts)
+        except Exception as e:
+            for patient_id, _, _, docs in batch:
+                stats["embed_failures"] += len(docs)
+                stats["errors"].append({"patient_id": patient_id, "error": f"Embedding failed: {e}"})
+            logger.error(f"  ✗ Embedding of {len(texts)} chunks failed: {e}")
+            continue
+
+        offset = 0
+        for patient_id, version, stale, docs in batch:
+            await out_queue.put((patient_id, version, stale, docs, vectors[offset : offset + len(docs)]))
+            offset += len(docs)
+
+
+async def insert_writer(queue: asyncio.Queue, batch_rows: int, stats: Dict[str, Any]) -> None:
+    """
+    Drain (patient_id, version, stale, docs, vectors) items from the queue
+    and COPY them in bulk.
+
+    Rows are buffered across patients and flushed once batch_rows are pending
+    or the queue goes idle, so small patients still fill large batches. A
+    patient's chunks always arrive as one item, so each flush also marks its
+    patients embedded and deletes their stale chunks (see write_documents).
+    A None item flushes the remainder and stops the writer.
+    """
+    docs: List[Document] = []
+    vectors: List[np.ndarray] = []
+    versions: Dict[str, int] = {}
+    stale: Dict[str, List[str]] = {}
+
+    async def flush():
+        if not docs:
+            return
+        try:
+            stats["stored_chunks"] += await write_documents(docs, vectors, versions, stale)
+        except Exception as e:
+            stats["insert_failures"] += len(docs)
+            for pid in sorted(versions):
+                stats["errors"].append({"patient_id": pid, "error": f"Insert failed: {e}"})
+            logger.error(f"  ✗ Insert of {len(docs)} rows failed: {e}")
+        docs.clear()
+        vectors.clear()
+        versions.clear()
+        stale.clear()
+
+    while True:
+        if docs and queue.empty():
+            await asyncio.sleep(INSERT_FLUSH_IDLE_SECONDS)
+            if queue.empty():
+                await flush()
+
+        item = await queue.get()
+        if item is None:
+            await flush()
+            queue.task_done()
+            return
+
+        patient_id, version, item_stale, item_docs, item_vectors = item
+        docs.extend(item_docs)
+        vectors.extend(item_vectors)
+        versions[patient_id] = version
+        if item_stale:
+            stale[patient_id] = item_stale
+        queue.task_done()
+
+        if len(docs) >= batch_rows:
+            await flush()
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -374,41 +1128,55 @@ async def init_vector_store(embeddings: BatchBedrockEmbeddings) -> PGVectorStore
 
 async def embed_patient(
     patient_id: str,
-    vector_store: PGVectorStore,
-    insert_batch_size: int = 50,
+    fhir_data: List[Dict[str, Any]],
+    embed_queue: Optional[asyncio.Queue],
     dry_run: bool = False,
+    embedded: Optional[Dict[str, Optional[str]]] = None,
 ) -> Tuple[bool, int, str]:
     """
-    Fetch, chunk, embed, and store one patient's FHIR data.
+    Chunk one patient's prefetched FHIR data (see get_patient_fhir_data_many),
+    skipping resources embedded from identical content, then queue the chunks
+    for the embedding stage (see embed_worker / insert_writer). Chunks of
+    changed or removed resources are deleted when the new ones are written.
+
+    Embedding and insert failures happen downstream and are recorded in the
+    run stats by those stages; the patient is only marked embedded once its
+    chunks are committed. A patient with nothing left to embed is marked
+    right away.
 
     Returns: (success, chunk_count, error_message)
     """
     try:
-        fhir_data = await get_patient_fhir_data(patient_id)
         if not fhir_data:
             return False, 0, "No FHIR data found"
 
+        loop = asyncio.get_running_loop()
         all_docs: List[Document] = []
+        stale: List[str] = []
         for data in fhir_data:
             bundle = data["bundle"]
             filename = data["filename"]
-            docs = process_patient_resources(patient_id, filename, bundle)
+            docs, stale_ids = await loop.run_in_executor(
+                get_chunk_pool(), process_patient_resources,
+                patient_id, filename, bundle, embedded,
+            )
             all_docs.extend(docs)
+            stale.extend(stale_ids)
+
+        version = max(data["version"] for data in fhir_data)
 
         if not all_docs:
+            if not dry_run:
+                await write_documents([], [], {patient_id: version}, {patient_id: stale})
             return True, 0, "No chunks generated"
 
         if dry_run:
             return True, len(all_docs), ""
 
-        # Insert in batches (aadd_documents calls embed_documents internally)
-        stored = 0
-        for i in range(0, len(all_docs), insert_batch_size):
-            batch = all_docs[i : i + insert_batch_size]
-            await vector_store.aadd_documents(batch)
-            stored += len(batch)
+        # Blocks when the embed stage is saturated (bounded queue)
+        await embed_queue.put((patient_id, version, stale, all_docs))
 
-        return True, stored, ""
+        return True, len(all_docs), ""
 
     except Exception as e:
         return False, 0, str(e)
@@ -416,10 +1184,11 @@ async def embed_patient(
 
 async def run_batch(
     batch_size: int = 5,
-    embed_batch_size: int = 25,
-    insert_batch_size: int = 50,
+    embed_batch_size: int = DEFAULT_MAX_PARALLEL,
+    insert_batch_size: int = 1000,
     limit: Optional[int] = None,
     dry_run: bool = False,
+    build_index: bool = True,
 ) -> Dict[str, Any]:
     """Run the full batch embedding pipeline."""
 
@@ -448,16 +1217,18 @@ async def run_batch(
 
     # ── Initialize embeddings & vector store ─────────────────────────────
     embeddings = BatchBedrockEmbeddings(max_workers=embed_batch_size)
-    vector_store = None
+    # run_in_executor(None, ...) / to_thread share the Bedrock pool
+    asyncio.get_running_loop().set_default_executor(get_bedrock_executor(embed_batch_size))
 
     if not dry_run:
         logger.info(f"Testing Bedrock connection ({BEDROCK_MODEL_ID}, {AWS_REGION})...")
         if not embeddings.test_connection():
             return {"status": "error", "message": "Bedrock connection failed — check AWS credentials"}
         logger.info(f"Bedrock OK ({VECTOR_SIZE}D embeddings)")
+        embeddings.prewarm()
 
         logger.info("Initializing vector store...")
-        vector_store = await init_vector_store(embeddings)
+        await init_vector_store()
         logger.info("Vector store ready")
 
     # ── Stats ────────────────────────────────────────────────────────────
@@ -467,26 +1238,39 @@ async def run_batch(
         "successful": 0,
         "failed": 0,
         "total_chunks": 0,
+        "stored_chunks": 0,
+        "embed_failures": 0,
+        "insert_failures": 0,
         "errors": [],
     }
 
-    # ── Process in groups ────────────────────────────────────────────────
+    # ── Pipeline stages: embed workers -> insert writer ──────────────────
+    embed_queue: Optional[asyncio.Queue] = None
+    insert_queue: Optional[asyncio.Queue] = None
+    embed_tasks: List[asyncio.Task] = []
+    writer_task: Optional[asyncio.Task] = None
+    if not dry_run:
+        insert_batch_size = max(1, min(insert_batch_size, MAX_INSERT_BATCH))
+        embed_queue = asyncio.Queue(maxsize=EMBED_QUEUE_SIZE)
+        insert_queue = asyncio.Queue(maxsize=EMBED_QUEUE_SIZE * 2)
+        embed_tasks = [
+            asyncio.create_task(embed_worker(embeddings, embed_queue, insert_queue, stats))
+            for _ in range(EMBED_WORKERS)
+        ]
+        writer_task = asyncio.create_task(insert_writer(insert_queue, insert_batch_size, stats))
+
+    # ── Process patients (sliding window of batch_size) ──────────────────
+    # Each patient takes a semaphore slot before its task is created and
+    # frees it when done, so a slow patient only holds its own slot instead
+    # of stalling a whole group
     semaphore = asyncio.Semaphore(batch_size)
 
-    async def process_one(patient_id: str) -> Tuple[str, bool, int, str]:
-        async with semaphore:
-            success, chunks, error = await embed_patient(
-                patient_id, vector_store, insert_batch_size, dry_run
-            )
-            return patient_id, success, chunks, error
-
-    # Process in reporting groups (report progress every N patients)
+    # Bundles are still fetched per group (one query each); progress is
+    # reported every group_size completed patients
     group_size = max(batch_size * 4, 20)
+    groups = [patients[i : i + group_size] for i in range(0, len(patients), group_size)]
 
-    for i in range(0, len(patients), group_size):
-        group = patients[i : i + group_size]
-
-        # Progress header
+    def log_progress():
         elapsed = time.time() - start_time
         if stats["processed"] > 0:
             rate = stats["processed"] / elapsed
@@ -502,31 +1286,79 @@ async def run_batch(
             f"{'═'*60}"
         )
 
-        # Launch concurrent tasks for this group
-        tasks = [process_one(pid) for pid in group]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        for result in results:
-            stats["processed"] += 1
-
-            if isinstance(result, BaseException):
-                stats["failed"] += 1
-                stats["errors"].append({"patient_id": "unknown", "error": str(result)})
-                logger.error(f"  ✗ Exception: {result}")
-                continue
-
-            patient_id, success, chunks, error = result
-            if success:
-                stats["successful"] += 1
-                stats["total_chunks"] += chunks
-                if chunks > 0:
-                    logger.info(f"  ✓ {patient_id[:8]}...: {chunks} chunks")
-                elif not dry_run:
-                    logger.info(f"  - {patient_id[:8]}...: 0 chunks (empty bundle)")
-            else:
-                stats["failed"] += 1
-                stats["errors"].append({"patient_id": patient_id, "error": error})
-                logger.error(f"  ✗ {patient_id[:8]}...: {error}")
+    def record(patient_id: str, success: bool, chunks: int, error: str):
+        stats["processed"] += 1
+        if success:
+            stats["successful"] += 1
+            stats["total_chunks"] += chunks
+            if chunks > 0:
+                logger.info(f"  ✓ {patient_id[:8]}...: {chunks} chunks")
+            elif not dry_run:
+                logger.info(f"  - {patient_id[:8]}...: 0 chunks (nothing left to embed)")
+        else:
+            stats["failed"] += 1
+            stats["errors"].append({"patient_id": patient_id, "error": error})
+            logger.error(f"  ✗ {patient_id[:8]}...: {error}")
+        if stats["processed"] % group_size == 0 and stats["processed"] < total_patients:
+            log_progress()
+
+    async def process_one(
+        patient_id: str,
+        fhir_data: List[Dict[str, Any]],
+        embedded: Dict[str, Optional[str]],
+    ):
+        try:
+            success, chunks, error = await embed_patient(
+                patient_id, fhir_data, embed_queue, dry_run, embedded
+            )
+        except Exception as e:
+            success, chunks, error = False, 0, str(e)
+        finally:
+            semaphore.release()
+        record(patient_id, success, chunks, error)
+
+    def fetch_group(group: List[str]) -> "asyncio.Future":
+        return asyncio.gather(get_patient_fhir_data_many(group), get_embedded_resource_hashes(group))
+
+    # Bundles (and already-embedded resource hashes) are fetched one group
+    # ahead, so the next group's queries run while the current group is chunked
+    next_fetch = fetch_group(groups[0])
+    log_progress()
+
+    async with asyncio.TaskGroup() as tg:
+        for group_index, group in enumerate(groups):
+            try:
+                bundles, embedded_ids = await next_fetch
+                fetch_error = ""
+            except Exception as e:
+                bundles, embedded_ids, fetch_error = {}, {}, f"Fetch failed: {e}"
+            if group_index + 1 < len(groups):
+                next_fetch = fetch_group(groups[group_index + 1])
+
+            for pid in group:
+                if fetch_error:
+                    record(pid, False, 0, fetch_error)
+                    continue
+                await semaphore.acquire()
+                tg.create_task(process_one(pid, bundles.get(pid, []), embedded_ids.get(pid, {})))
+
+    # ── Drain pipeline ───────────────────────────────────────────────────
+    if writer_task is not None:
+        for _ in embed_tasks:
+            await embed_queue.put(None)
+        await asyncio.gather(*embed_tasks)
+        await insert_queue.put(None)
+        await writer_task
+
+    # ── Vector index (after the bulk load) ───────────────────────────────
+    if build_index and not dry_run and stats["stored_chunks"] > 0:
+        index_start = time.time()
+        try:
+            if await ensure_vector_index():
+                logger.info(f"Built {VECTOR_INDEX_NAME} in {time.time() - index_start:.1f}s")
+        except Exception as e:
+            stats["errors"].append({"patient_id": "-", "error": f"Index build failed: {e}"})
+            logger.error(f"Vector index build failed: {e}")
 
     # ── Final stats ──────────────────────────────────────────────────────
     total_time = time.time() - start_time
@@ -534,8 +1366,7 @@ async def run_batch(
     stats["rate_patients_per_second"] = stats["processed"] / total_time if total_time > 0 else 0
     stats["bedrock_api_calls"] = embeddings._call_count
     stats["bedrock_retries"] = embeddings._retry_count
-
-    embeddings.shutdown()
+    stats["embed_cache_hits"] = embeddings._cache_hits
 
     return stats
 
@@ -559,12 +1390,16 @@ def parse_args():
         help="Concurrent patients (default: 5)",
     )
     parser.add_argument(
-        "--embed-batch", type=int, default=25,
-        help="Parallel Bedrock calls (default: 25)",
+        "--embed-batch", type=int, default=DEFAULT_MAX_PARALLEL,
+        help=f"Parallel Bedrock calls (default: BEDROCK_MAX_PARALLEL or CPU count × 8 = {DEFAULT_MAX_PARALLEL})",
+    )
+    parser.add_argument(
+        "--insert-batch", type=int, default=1000,
+        help=f"Documents per COPY, coalesced across patients (default: 1000, max: {MAX_INSERT_BATCH})",
     )
     parser.add_argument(
-        "--insert-batch", type=int, default=50,
-        help="Documents per DB insert (default: 50)",
+        "--skip-index", action="store_true",
+        help="Do not build the HNSW vector index after loading",
     )
     parser.add_argument(
         "--dry-run", action="store_true",
@@ -597,11 +1432,14 @@ async def main():
             insert_batch_size=args.insert_batch,
             limit=args.limit,
             dry_run=args.dry_run,
+            build_index=not args.skip_index,
         )
     finally:
-        # Clean up DB connections
+        # Clean up DB connections, chunking workers and Bedrock threads
         engine = get_engine()
         await engine.dispose()
+        shutdown_chunk_pool()
+        shutdown_bedrock_executor()
 
     # Print summary
     print("\n" + "═" * 70)
@@ -615,7 +1453,12 @@ async def main():
         print(f"  Successful:         {stats.get('successful', 0)}")
         print(f"  Failed:             {stats.get('failed', 0)}")
         print(f"  Total chunks:       {stats.get('total_chunks', 0)}")
+        if stats.get("embed_failures", 0) > 0:
+            print(f"  Failed embeddings:  {stats['embed_failures']} chunks")
+        if stats.get("insert_failures", 0) > 0:
+            print(f"  Failed inserts:     {stats['insert_failures']} chunks")
         print(f"  Bedrock API calls:  {stats.get('bedrock_api_calls', 0)}")
+        print(f"  Duplicate chunks:   {stats.get('embed_cache_hits', 0)} (embedded once, reused)")
         if stats.get("bedrock_retries", 0) > 0:
             print(f"  Bedrock retries:    {stats['bedrock_retries']}")
         print(f"  Total time:         {stats.get('total_time_seconds', 0):.1f}s")
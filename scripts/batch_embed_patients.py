@@ -19,22 +19,28 @@ Options:
     --clean-duplicates  Remove duplicate embeddings before processing
     --limit N           Only process first N patients
     --batch-size N      Number of patients per batch (default: 10)
+    --batch-delay S     Seconds to pause between batches (default: 0)
+    --max-inflight N    Ingest POSTs in flight across all patients (default: 64)
     --ollama-url URL    Override OLLAMA_BASE_URL
 
 Environment Variables:
     OLLAMA_BASE_URL     Ollama endpoint (default: http://localhost:11434)
+    EMBED_BULK_SIZE     Resources per bulk ingest request (default: 100)
     DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME - Database connection
 """
 
 import argparse
 import asyncio
-import json
+import hashlib
 import os
+import re
 import sys
 import time
+import uuid
+from dataclasses import asdict, dataclass, field
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Any, Set, Optional, Tuple
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
 import logging
 
 # Setup path
@@ -43,9 +49,19 @@ sys.path.insert(0, str(ROOT_DIR))
 from utils.env_loader import load_env_recursive
 load_env_recursive(ROOT_DIR)
 
+import asyncpg
+import httpx
+import orjson
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
+# HTTP/2 needs the optional h2 package (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -62,18 +78,93 @@ DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME")
 SCHEMA_NAME = os.getenv("HC_AI_SCHEMA", "hc_ai_schema")
 
+# Ingest POSTs in flight across all patients (--max-inflight)
+DEFAULT_MAX_INFLIGHT = 64
+
+# Resources per /embeddings/ingest_bulk request
+BULK_SIZE = int(os.getenv("EMBED_BULK_SIZE", "100"))
+
+# Request bodies are serialized with orjson and sent as raw bytes
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Separator around each batch's progress line
+BATCH_RULE = "═" * 60
+
+# Duplicate rows removed per transaction by clean_duplicates
+DELETE_CHUNK_SIZE = 10000
+
+# Bookkeeping resources with nothing clinical to embed
+SKIP_TYPES = frozenset({"Provenance", "AuditEvent", "Bundle"})
+
 # Global engine
 _engine: Optional[AsyncEngine] = None
 
+# Raw asyncpg pool for the per-batch FHIR fetch (hot path, skips SQLAlchemy)
+_pg_pool: Optional[asyncpg.Pool] = None
 
-def get_engine() -> AsyncEngine:
+
+def get_engine(batch_size: int = 10) -> AsyncEngine:
+    """
+    Get the shared engine, creating it on first call.
+    
+    The pool is sized for batch_size patients fetching concurrently; later
+    calls return the existing engine regardless of batch_size.
+    """
     global _engine
     if _engine is None:
         conn_str = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        _engine = create_async_engine(conn_str, echo=False)
+        _engine = create_async_engine(
+            conn_str,
+            echo=False,
+            pool_size=batch_size + 5,
+            max_overflow=batch_size,
+            pool_pre_ping=True,
+        )
     return _engine
 
 
+async def _init_pg_connection(conn: asyncpg.Connection):
+    # asyncpg returns jsonb as text by default; decode bundles with orjson
+    await conn.set_type_codec(
+        "jsonb",
+        encoder=lambda value: orjson.dumps(value).decode(),
+        decoder=orjson.loads,
+        schema="pg_catalog",
+    )
+
+
+async def get_pg_pool(batch_size: int = 10) -> asyncpg.Pool:
+    """
+    Get the shared asyncpg pool, creating it on first call.
+    
+    Later calls return the existing pool regardless of batch_size.
+    """
+    global _pg_pool
+    if _pg_pool is None:
+        _pg_pool = await asyncpg.create_pool(
+            user=DB_USER,
+            password=DB_PASSWORD,
+            host=DB_HOST,
+            port=int(DB_PORT),
+            database=DB_NAME,
+            min_size=min(5, batch_size * 2),
+            max_size=batch_size * 2,
+            # Identical SQL text (module constants) hits each connection's
+            # prepared-statement cache; entries never expire
+            statement_cache_size=256,
+            max_cached_statement_lifetime=0,
+            init=_init_pg_connection,
+        )
+    return _pg_pool
+
+
+async def close_pg_pool():
+    global _pg_pool
+    if _pg_pool is not None:
+        await _pg_pool.close()
+        _pg_pool = None
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # DUPLICATE DETECTION & CLEANUP
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -81,15 +172,18 @@ def get_engine() -> AsyncEngine:
 async def check_duplicates() -> Dict[str, Any]:
     """Check for duplicate chunks in the database."""
     engine = get_engine()
-    async with engine.begin() as conn:
-        # Check for duplicate chunk_ids
+    async with engine.connect() as conn:
+        # Check for duplicate chunk_ids - only the top 20 groups cross the
+        # wire, the window count carries the total number of groups
         result = await conn.execute(text(f'''
-            SELECT langchain_metadata->>'chunk_id' as chunk_id, COUNT(*) as cnt
+            SELECT langchain_metadata->>'chunk_id' as chunk_id, COUNT(*) as cnt,
+                   COUNT(*) OVER () as groups
             FROM "{SCHEMA_NAME}".hc_ai_table
             WHERE langchain_metadata->>'chunk_id' IS NOT NULL
             GROUP BY langchain_metadata->>'chunk_id'
             HAVING COUNT(*) > 1
             ORDER BY cnt DESC
+            LIMIT 20
         '''))
         duplicates = result.fetchall()
         
@@ -99,8 +193,8 @@ async def check_duplicates() -> Dict[str, Any]:
         
         return {
             "total_embeddings": total_embeddings,
-            "duplicate_groups": len(duplicates),
-            "duplicate_details": [(d[0], d[1]) for d in duplicates[:20]]  # Top 20
+            "duplicate_groups": duplicates[0][2] if duplicates else 0,
+            "duplicate_details": [(d[0], d[1]) for d in duplicates]  # Top 20
         }
 
 
@@ -110,7 +204,7 @@ async def clean_duplicates(dry_run: bool = True) -> int:
     
     if dry_run:
         # Just count what would be deleted
-        async with engine.begin() as conn:
+        async with engine.connect() as conn:
             result = await conn.execute(text(f'''
                 WITH duplicates AS (
                     SELECT langchain_id,
@@ -125,11 +219,25 @@ async def clean_duplicates(dry_run: bool = True) -> int:
             '''))
             return result.scalar() or 0
     
-    # Actually delete duplicates
-    async with engine.begin() as conn:
-        result = await conn.execute(text(f'''
-            DELETE FROM "{SCHEMA_NAME}".hc_ai_table
-            WHERE langchain_id IN (
+    # Ordered like the window below, so its single pass can read the index
+    # instead of sorting the table. CONCURRENTLY cannot run inside a
+    # transaction block
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f'''
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_hc_ai_chunk_id_langchain_id
+            ON "{SCHEMA_NAME}".hc_ai_table ((langchain_metadata->>'chunk_id'), langchain_id)
+            WHERE langchain_metadata->>'chunk_id' IS NOT NULL
+        '''))
+    
+    # Find the duplicates once into a session temp table, then delete them
+    # DELETE_CHUNK_SIZE rows per transaction (keyset on langchain_id) so row
+    # locks and WAL stay bounded without re-running the window every batch
+    deleted = 0
+    async with engine.connect() as conn:
+        async with conn.begin():
+            await conn.execute(text(f'''
+                CREATE TEMP TABLE hc_ai_duplicate_ids AS
                 SELECT langchain_id FROM (
                     SELECT langchain_id,
                            ROW_NUMBER() OVER (
@@ -140,133 +248,228 @@ async def clean_duplicates(dry_run: bool = True) -> int:
                     WHERE langchain_metadata->>'chunk_id' IS NOT NULL
                 ) t
                 WHERE rn > 1
-            )
-        '''))
-        return result.rowcount
+            '''))
+            await conn.execute(text("ALTER TABLE hc_ai_duplicate_ids ADD PRIMARY KEY (langchain_id)"))
+        try:
+            last_id = uuid.UUID(int=0)
+            while True:
+                async with conn.begin():
+                    result = await conn.execute(text('''
+                        SELECT langchain_id FROM hc_ai_duplicate_ids
+                        WHERE langchain_id > :last_id
+                        ORDER BY langchain_id
+                        LIMIT :limit
+                    '''), {"last_id": last_id, "limit": DELETE_CHUNK_SIZE})
+                    ids = result.scalars().all()
+                    if not ids:
+                        return deleted
+                    result = await conn.execute(text(f'''
+                        DELETE FROM "{SCHEMA_NAME}".hc_ai_table
+                        WHERE langchain_id = ANY(:ids)
+                    '''), {"ids": ids})
+                last_id = ids[-1]
+                deleted += result.rowcount
+                logger.info("  Deleted %d duplicate rows so far...", deleted)
+        finally:
+            await conn.execute(text("DROP TABLE IF EXISTS hc_ai_duplicate_ids"))
+            await conn.commit()
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # PATIENT DISCOVERY
 # ═══════════════════════════════════════════════════════════════════════════════
 
-async def get_embedded_patients() -> Set[str]:
-    """Get set of patient IDs that already have embeddings."""
+async def ensure_patient_id_index():
+    """
+    Create the expression index on metadata patient_id if it is missing.
+    
+    The index drives the anti-join in get_patients_needing_embedding. Built
+    CONCURRENTLY so an already-populated table stays writable.
+    """
     engine = get_engine()
-    async with engine.begin() as conn:
-        result = await conn.execute(text(f'''
-            SELECT DISTINCT langchain_metadata->>'patient_id' 
-            FROM "{SCHEMA_NAME}".hc_ai_table
-            WHERE langchain_metadata->>'patient_id' IS NOT NULL
+    # CONCURRENTLY cannot run inside a transaction block
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f'''
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_hc_ai_patient_id
+            ON "{SCHEMA_NAME}".hc_ai_table ((langchain_metadata->>'patient_id'))
         '''))
-        return {row[0] for row in result.fetchall()}
 
 
-async def get_all_fhir_patients() -> List[str]:
-    """Get all patient IDs from FHIR raw files."""
+async def get_patients_needing_embedding(patient_ids: Optional[List[str]] = None) -> List[str]:
+    """
+    Get patient IDs that need embedding (not yet embedded).
+    
+    patient_ids, if given, restricts the search to those patients.
+    """
     engine = get_engine()
-    async with engine.begin() as conn:
+    only = "AND f.patient_id = ANY(:patient_ids)" if patient_ids is not None else ""
+    async with engine.connect() as conn:
         result = await conn.execute(text(f'''
-            SELECT DISTINCT patient_id 
-            FROM "{SCHEMA_NAME}".fhir_raw_files
-            ORDER BY patient_id
-        '''))
+            SELECT DISTINCT f.patient_id
+            FROM "{SCHEMA_NAME}".fhir_raw_files f
+            WHERE NOT EXISTS (
+                SELECT 1 FROM "{SCHEMA_NAME}".hc_ai_table t
+                WHERE t.langchain_metadata->>'patient_id' = f.patient_id
+            ) {only}
+            ORDER BY f.patient_id
+        '''), {"patient_ids": list(patient_ids)} if patient_ids is not None else {})
         return [row[0] for row in result.fetchall()]
 
 
-async def get_patients_needing_embedding() -> List[str]:
-    """Get patient IDs that need embedding (not yet embedded)."""
-    embedded = await get_embedded_patients()
-    all_patients = await get_all_fhir_patients()
-    return [p for p in all_patients if p not in embedded]
+# Both sort keys DESC so the (patient_id, version) primary key serves the
+# top-1-per-patient lookup with a backward index scan and no Sort node
+GET_PATIENTS_FHIR_SQL = f'''
+    SELECT DISTINCT ON (patient_id) patient_id, source_filename, bundle_json
+    FROM "{SCHEMA_NAME}".fhir_raw_files
+    WHERE patient_id = ANY($1)
+    ORDER BY patient_id DESC, version DESC
+'''
 
 
-async def get_patient_fhir_data(patient_id: str) -> List[Dict[str, Any]]:
-    """Get FHIR bundle data for a patient."""
-    engine = get_engine()
-    async with engine.begin() as conn:
-        result = await conn.execute(text(f'''
-            SELECT source_filename, bundle_json
-            FROM "{SCHEMA_NAME}".fhir_raw_files
-            WHERE patient_id = :patient_id
-            ORDER BY version DESC
-            LIMIT 1
-        '''), {"patient_id": patient_id})
-        rows = result.fetchall()
-        return [{"filename": r[0], "bundle": r[1]} for r in rows]
+async def get_patients_fhir_data_batch(patient_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Get the latest FHIR bundle for each patient in one query.
+    
+    Returns: {patient_id: [{"filename": ..., "bundle": ...}]}; patients with
+    no raw file are absent from the dict.
+    """
+    pool = await get_pg_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(GET_PATIENTS_FHIR_SQL, list(patient_ids))
+    return {r["patient_id"]: [{"filename": r["source_filename"], "bundle": r["bundle_json"]}] for r in rows}
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # EMBEDDING PROCESSING
 # ═══════════════════════════════════════════════════════════════════════════════
 
+async def _post_bulk(
+    client: httpx.AsyncClient,
+    url: str,
+    payloads: List[Dict[str, Any]],
+    inflight: asyncio.Semaphore,
+) -> Tuple[bool, int, str]:
+    """
+    POST a slice of resources to the bulk ingest endpoint.
+    
+    Returns: (ok, resources_count, error_message)
+    """
+    async with inflight:
+        try:
+            body = orjson.dumps({"items": payloads})
+            resp = await client.post(url, content=body, headers=JSON_HEADERS)
+            if resp.status_code == 200:
+                return True, len(payloads), ""
+            return False, len(payloads), f"{resp.status_code} - {resp.text[:100]}"
+        except Exception as e:
+            return False, len(payloads), f"API error: {e}"
+
 
-async def embed_patient(patient_id: str, api_url: str, dry_run: bool = False) -> Tuple[bool, int, str]:
+def _content_hash(resource_type: str, resource_id: str, content: str) -> str:
+    """Stable hash identifying one resource's embeddable content."""
+    return hashlib.sha256(f"{resource_type}|{resource_id}|{content}".encode()).hexdigest()
+
+
+def _build_payloads(bundle: Any, filename: str, patient_id: str) -> List[Dict[str, Any]]:
+    """
+    Build ingest payloads for every embeddable resource in a FHIR bundle.
+    
+    Resources whose content hash repeats an earlier entry of the bundle are
+    skipped. The hash is not sent or stored: get_patients_needing_embedding
+    only returns patients with no rows in hc_ai_table, explicit patient_ids
+    included, so there is nothing to dedupe against in the table.
+    """
+    if not isinstance(bundle, dict):
+        return []
+    
+    seen: Set[str] = set()
+    payloads = []
+    for entry in bundle.get("entry", []):
+        resource = entry.get("resource", {})
+        resource_type = resource.get("resourceType", "")
+        if not resource_type or resource_type in SKIP_TYPES:
+            continue
+        
+        # Build content for embedding
+        content = extract_content(resource, resource_type)
+        if not content:
+            continue
+        
+        resource_id = resource.get("id", entry.get("fullUrl", ""))
+        content_hash = _content_hash(resource_type, resource_id, content)
+        if content_hash in seen:
+            continue
+        seen.add(content_hash)
+        
+        payloads.append({
+            "id": resource_id,
+            "fullUrl": entry.get("fullUrl", ""),
+            "resourceType": resource_type,
+            "content": content,
+            "patientId": patient_id,
+            "resourceJson": orjson.dumps(resource).decode(),
+            "sourceFile": filename,
+        })
+    return payloads
+
+
+async def embed_patient(
+    patient_id: str,
+    fhir_data: List[Dict[str, Any]],
+    api_url: str,
+    client: httpx.AsyncClient,
+    dry_run: bool = False,
+    inflight: Optional[asyncio.Semaphore] = None,
+) -> Tuple[bool, int, str]:
     """
     Embed a single patient's FHIR data.
     
+    fhir_data is the patient's entry from get_patients_fhir_data_batch,
+    fetched once for the whole batch. Payloads are built in a worker thread.
+    
+    Posts through the shared client so requests reuse pooled keep-alive
+    connections to the API. A patient's resources are sent to the bulk
+    ingest endpoint in slices of BULK_SIZE; inflight is the run-wide
+    semaphore that caps concurrent POSTs across all patients.
+    
     Returns: (success, chunks_count, error_message)
     """
-    import aiohttp
-    
     try:
-        # Get patient's FHIR data
-        fhir_data = await get_patient_fhir_data(patient_id)
         if not fhir_data:
             return False, 0, "No FHIR data found"
         
+        # Preprocessing is CPU-bound; keep it off the event loop so other
+        # patients' requests keep moving
+        payloads: List[Dict[str, Any]] = []
+        for data in fhir_data:
+            payloads.extend(await asyncio.to_thread(
+                _build_payloads, data["bundle"], data["filename"], patient_id
+            ))
+        
+        if dry_run:
+            return True, len(payloads), ""
+        
         chunks_embedded = 0
         
-        for data in fhir_data:
-            bundle = data["bundle"]
-            filename = data["filename"]
-            
-            if not isinstance(bundle, dict):
+        # Send to embedding API
+        url = f"{api_url}/embeddings/ingest_bulk"
+        if inflight is None:
+            inflight = asyncio.Semaphore(DEFAULT_MAX_INFLIGHT)
+        slices = [payloads[i:i + BULK_SIZE] for i in range(0, len(payloads), BULK_SIZE)]
+        results = await asyncio.gather(
+            *(_post_bulk(client, url, items, inflight) for items in slices),
+            return_exceptions=True,
+        )
+        for items, result in zip(slices, results):
+            if isinstance(result, BaseException):
+                logger.warning("  API error for %d resources: %s", len(items), result)
                 continue
-                
-            entries = bundle.get("entry", [])
-            
-            for entry in entries:
-                resource = entry.get("resource", {})
-                resource_type = resource.get("resourceType", "")
-                resource_id = resource.get("id", entry.get("fullUrl", ""))
-                
-                if not resource_type:
-                    continue
-                
-                # Build content for embedding
-                content = extract_content(resource, resource_type)
-                if not content or len(content.strip()) == 0:
-                    continue
-                
-                if dry_run:
-                    chunks_embedded += 1
-                    continue
-                
-                # Send to embedding API
-                payload = {
-                    "id": resource_id,
-                    "fullUrl": entry.get("fullUrl", ""),
-                    "resourceType": resource_type,
-                    "content": content,
-                    "patientId": patient_id,
-                    "resourceJson": json.dumps(resource),
-                    "sourceFile": filename
-                }
-                
-                try:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.post(
-                            f"{api_url}/embeddings/ingest",
-                            json=payload,
-                            timeout=aiohttp.ClientTimeout(total=60)
-                        ) as resp:
-                            if resp.status == 200:
-                                chunks_embedded += 1
-                            else:
-                                error_text = await resp.text()
-                                logger.warning(f"  Failed to embed {resource_id}: {resp.status} - {error_text[:100]}")
-                except Exception as e:
-                    logger.warning(f"  API error for {resource_id}: {e}")
+            ok, count, error = result
+            if ok:
+                chunks_embedded += count
+            else:
+                logger.warning("  Failed to embed %d resources: %s", count, error)
         
         return True, chunks_embedded, ""
         
@@ -274,194 +477,297 @@ async def embed_patient(patient_id: str, api_url: str, dry_run: bool = False) ->
         return False, 0, str(e)
 
 
+# Any HTML tag in a narrative text.div
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _coding_text(concept: Dict[str, Any]) -> Optional[str]:
+    """Text of a CodeableConcept, falling back to its first coding's display."""
+    if "text" in concept:
+        return concept["text"]
+    if "coding" in concept and concept["coding"]:
+        return concept["coding"][0].get("display", "")
+    return None
+
+
+def _concept_extractor(
+    label: str,
+    field: str,
+    status_field: Optional[str] = None,
+) -> Callable[[Dict[str, Any]], str]:
+    """
+    Build an extractor for resources described by one CodeableConcept field.
+    
+    The label and field names are bound once, and the text/coding walk is
+    inlined, so each call is a single flat function.
+    """
+    def extract(resource: Dict[str, Any]) -> str:
+        parts = [label]
+        if field in resource:
+            concept = resource[field]
+            if "text" in concept:
+                parts.append(concept["text"])
+            elif "coding" in concept and concept["coding"]:
+                parts.append(concept["coding"][0].get("display", ""))
+        if status_field is not None and status_field in resource:
+            parts.append(f"Status: {resource[status_field]}")
+        return " ".join(parts).strip()
+    return extract
+
+
+def _extract_patient(resource: Dict[str, Any]) -> str:
+    parts = ["Patient Information:"]
+    if "name" in resource and resource["name"]:
+        name = resource["name"][0]
+        if "family" in name:
+            parts.append(f"Name: {name.get('family', '')}")
+        if "given" in name and name["given"]:
+            parts.append(name["given"][0])
+    if "gender" in resource:
+        parts.append(f"Gender: {resource['gender']}")
+    if "birthDate" in resource:
+        parts.append(f"Date of Birth: {resource['birthDate']}")
+    return " ".join(parts).strip()
+
+
+def _extract_observation(resource: Dict[str, Any]) -> str:
+    parts = ["Clinical Observation:"]
+    if "code" in resource:
+        text_value = _coding_text(resource["code"])
+        if text_value is not None:
+            parts.append(text_value)
+    if "valueQuantity" in resource:
+        vq = resource["valueQuantity"]
+        parts.append(f"Value: {vq.get('value', '')} {vq.get('unit', '')}")
+    return " ".join(parts).strip()
+
+
+def _extract_encounter(resource: Dict[str, Any]) -> str:
+    parts = ["Healthcare Encounter:"]
+    if "type" in resource and resource["type"]:
+        text_value = _coding_text(resource["type"][0])
+        if text_value is not None:
+            parts.append(text_value)
+    return " ".join(parts).strip()
+
+
+def _extract_generic(resource: Dict[str, Any]) -> str:
+    code = resource.get("code")
+    if isinstance(code, dict):
+        text_value = _coding_text(code)
+        if text_value is not None:
+            return text_value.strip()
+    return ""
+
+
+# Resource types with a fixed label and one CodeableConcept field:
+# resourceType -> (label, concept field, status field)
+_CONCEPT_TYPES: Dict[str, Tuple[str, str, Optional[str]]] = {
+    "Condition": ("Medical Condition:", "code", "clinicalStatus"),
+    "MedicationRequest": ("Medication Prescription:", "medicationCodeableConcept", "status"),
+    "Procedure": ("Medical Procedure:", "code", None),
+    "Immunization": ("Immunization:", "vaccineCode", None),
+}
+
+_CUSTOM_EXTRACTORS: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "Patient": _extract_patient,
+    "Observation": _extract_observation,
+    "Encounter": _extract_encounter,
+}
+
+
+# Specialized extractor per resourceType seen so far
+_EXTRACTOR_CACHE: Dict[str, Callable[[Dict[str, Any]], str]] = {}
+
+
+def _compile_extractor(resource_type: str) -> Callable[[Dict[str, Any]], str]:
+    """Build and cache the specialized extractor for a resource type."""
+    if resource_type in _CONCEPT_TYPES:
+        extractor = _concept_extractor(*_CONCEPT_TYPES[resource_type])
+    else:
+        extractor = _CUSTOM_EXTRACTORS.get(resource_type, _extract_generic)
+    _EXTRACTOR_CACHE[resource_type] = extractor
+    return extractor
+
+
 def extract_content(resource: Dict[str, Any], resource_type: str) -> str:
-    """Extract meaningful content from a FHIR resource for embedding."""
-    parts = []
+    """
+    Extract meaningful content from a FHIR resource for embedding.
     
+    Returns a stripped string; "" means there is nothing worth embedding.
+    """
     # Try text.div first
     if "text" in resource and isinstance(resource["text"], dict):
         div = resource["text"].get("div", "")
         if div:
             # Clean HTML
-            div = div.replace("<div>", "").replace("</div>", "")
-            div = div.replace("<", "").replace(">", " ")
-            if div.strip():
-                return div.strip()
-    
-    # Resource-specific extraction
-    if resource_type == "Patient":
-        parts.append("Patient Information:")
-        if "name" in resource and resource["name"]:
-            name = resource["name"][0]
-            if "family" in name:
-                parts.append(f"Name: {name.get('family', '')}")
-            if "given" in name and name["given"]:
-                parts.append(name["given"][0])
-        if "gender" in resource:
-            parts.append(f"Gender: {resource['gender']}")
-        if "birthDate" in resource:
-            parts.append(f"Date of Birth: {resource['birthDate']}")
-    
-    elif resource_type == "Condition":
-        parts.append("Medical Condition:")
-        if "code" in resource:
-            code = resource["code"]
-            if "text" in code:
-                parts.append(code["text"])
-            elif "coding" in code and code["coding"]:
-                parts.append(code["coding"][0].get("display", ""))
-        if "clinicalStatus" in resource:
-            parts.append(f"Status: {resource['clinicalStatus']}")
-    
-    elif resource_type == "Observation":
-        parts.append("Clinical Observation:")
-        if "code" in resource:
-            code = resource["code"]
-            if "text" in code:
-                parts.append(code["text"])
-            elif "coding" in code and code["coding"]:
-                parts.append(code["coding"][0].get("display", ""))
-        if "valueQuantity" in resource:
-            vq = resource["valueQuantity"]
-            parts.append(f"Value: {vq.get('value', '')} {vq.get('unit', '')}")
-    
-    elif resource_type == "Encounter":
-        parts.append("Healthcare Encounter:")
-        if "type" in resource and resource["type"]:
-            enc_type = resource["type"][0]
-            if "text" in enc_type:
-                parts.append(enc_type["text"])
-            elif "coding" in enc_type and enc_type["coding"]:
-                parts.append(enc_type["coding"][0].get("display", ""))
-    
-    elif resource_type == "MedicationRequest":
-        parts.append("Medication Prescription:")
-        if "medicationCodeableConcept" in resource:
-            med = resource["medicationCodeableConcept"]
-            if "text" in med:
-                parts.append(med["text"])
-            elif "coding" in med and med["coding"]:
-                parts.append(med["coding"][0].get("display", ""))
-        if "status" in resource:
-            parts.append(f"Status: {resource['status']}")
-    
-    elif resource_type == "Procedure":
-        parts.append("Medical Procedure:")
-        if "code" in resource:
-            code = resource["code"]
-            if "text" in code:
-                parts.append(code["text"])
-            elif "coding" in code and code["coding"]:
-                parts.append(code["coding"][0].get("display", ""))
-    
-    elif resource_type == "Immunization":
-        parts.append("Immunization:")
-        if "vaccineCode" in resource:
-            vax = resource["vaccineCode"]
-            if "text" in vax:
-                parts.append(vax["text"])
-            elif "coding" in vax and vax["coding"]:
-                parts.append(vax["coding"][0].get("display", ""))
-    
-    else:
-        # Generic extraction
-        if "code" in resource:
-            code = resource["code"]
-            if isinstance(code, dict):
-                if "text" in code:
-                    parts.append(code["text"])
-                elif "coding" in code and code["coding"]:
-                    parts.append(code["coding"][0].get("display", ""))
+            div = _TAG_RE.sub(" ", div).strip()
+            if div:
+                return div
     
-    return " ".join(parts) if parts else ""
+    extractor = _EXTRACTOR_CACHE.get(resource_type) or _compile_extractor(resource_type)
+    return extractor(resource)
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # MAIN BATCH PROCESSING
 # ═══════════════════════════════════════════════════════════════════════════════
 
+@dataclass
+class BatchStats:
+    """Run counters; failures are kept as parallel id/message lists."""
+    total_patients: int = 0
+    processed: int = 0
+    successful: int = 0
+    failed: int = 0
+    total_chunks: int = 0
+    error_patient_ids: List[str] = field(default_factory=list)
+    error_messages: List[str] = field(default_factory=list)
+    
+    def add_failure(self, patient_id: str, error: str):
+        self.processed += 1
+        self.failed += 1
+        self.error_patient_ids.append(patient_id)
+        self.error_messages.append(error)
+
+
 async def run_batch_embedding(
     api_url: str,
     batch_size: int = 10,
     limit: Optional[int] = None,
-    dry_run: bool = False
+    dry_run: bool = False,
+    batch_delay: float = 0.0,
+    max_inflight: int = DEFAULT_MAX_INFLIGHT,
+    patient_ids: Optional[List[str]] = None,
 ) -> Dict[str, Any]:
-    """Run batch embedding for all patients needing it."""
+    """
+    Run batch embedding for all patients needing it.
     
+    patient_ids, if given, limits the run to those patients; any that already
+    have rows in hc_ai_table are skipped like in discovery, so re-runs do not
+    store a second copy of their chunks.
+    """
     start_time = time.time()
     
     # Get patients needing embedding
+    if not dry_run:
+        await ensure_patient_id_index()
     logger.info("Discovering patients needing embedding...")
-    patients = await get_patients_needing_embedding()
+    patients = await get_patients_needing_embedding(patient_ids)
+    if patient_ids is not None:
+        # Keep the caller's order
+        pending = set(patients)
+        patients = [pid for pid in dict.fromkeys(patient_ids) if pid in pending]
     
     if limit:
         patients = patients[:limit]
     
     total_patients = len(patients)
-    logger.info(f"Found {total_patients} patients to embed")
+    logger.info("Found %d patients to embed", total_patients)
     
     if total_patients == 0:
         return {"status": "complete", "message": "All patients already embedded"}
     
-    # Stats
-    stats = {
-        "total_patients": total_patients,
-        "processed": 0,
-        "successful": 0,
-        "failed": 0,
-        "total_chunks": 0,
-        "errors": []
-    }
-    
-    # Process in batches
-    for i in range(0, len(patients), batch_size):
-        batch = patients[i:i+batch_size]
-        batch_num = i // batch_size + 1
+    stats = BatchStats(total_patients=total_patients)
+    
+    if not dry_run:
+        await get_pg_pool(batch_size)
+    
+    # Caps concurrent POSTs across all patients of a batch, however many
+    # slices each one has
+    inflight = asyncio.Semaphore(max_inflight)
+    
+    # One client for the whole run so POSTs reuse keep-alive connections
+    # (multiplexed over HTTP/2 when h2 is installed and the API negotiates it)
+    limits = httpx.Limits(
+        max_connections=max_inflight,
+        max_keepalive_connections=max_inflight,
+        keepalive_expiry=60,
+    )
+    async with httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=60.0,
+        limits=limits,
+    ) as client:
+        # Process in batches
         total_batches = (len(patients) + batch_size - 1) // batch_size
+        for i in range(0, len(patients), batch_size):
+            batch = patients[i:i+batch_size]
+            batch_num = i // batch_size + 1
         
-        # Progress info
-        elapsed = time.time() - start_time
-        if stats["processed"] > 0:
-            rate = stats["processed"] / elapsed
-            remaining = (total_patients - stats["processed"]) / rate
-            eta = timedelta(seconds=int(remaining))
-        else:
-            eta = "calculating..."
-        
-        logger.info(f"\n{'═'*60}")
-        logger.info(f"BATCH {batch_num}/{total_batches} | Progress: {stats['processed']}/{total_patients} | ETA: {eta}")
-        logger.info(f"{'═'*60}")
-        
-        # Process batch
-        for patient_id in batch:
-            stats["processed"] += 1
+            # Progress info
+            if logger.isEnabledFor(logging.INFO):
+                elapsed = time.time() - start_time
+                if stats.processed > 0:
+                    rate = stats.processed / elapsed
+                    remaining = (total_patients - stats.processed) / rate
+                    eta = str(timedelta(seconds=int(remaining)))
+                else:
+                    eta = "calculating..."
             
+                logger.info("\n%s", BATCH_RULE)
+                logger.info("BATCH %d/%d | Progress: %d/%d | ETA: %s",
+                            batch_num, total_batches, stats.processed, total_patients, eta)
+                logger.info(BATCH_RULE)
+        
+            # Process batch - patients in a batch run concurrently
             if dry_run:
-                logger.info(f"  [DRY-RUN] Would embed patient: {patient_id[:8]}...")
-                stats["successful"] += 1
+                for patient_id in batch:
+                    logger.info("  [DRY-RUN] Would embed patient: %.8s...", patient_id)
+                stats.processed += len(batch)
+                stats.successful += len(batch)
+                continue
+        
+            # One query fetches the whole batch's bundles
+            try:
+                fhir_data = await get_patients_fhir_data_batch(batch)
+            except Exception as e:
+                logger.error("  ✗ Failed to fetch FHIR data for batch %d: %s", batch_num, e)
+                for pid in batch:
+                    stats.add_failure(pid, str(e))
                 continue
             
-            success, chunks, error = await embed_patient(patient_id, api_url, dry_run)
+            results = await asyncio.gather(
+                *(
+                    embed_patient(pid, fhir_data.get(pid, []), api_url, client, dry_run, inflight)
+                    for pid in batch
+                ),
+                return_exceptions=True,
+            )
+        
+            batch_ok = 0
+            batch_chunks = 0
+            for patient_id, result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    success, chunks, error = False, 0, str(result)
+                else:
+                    success, chunks, error = result
             
-            if success:
-                stats["successful"] += 1
-                stats["total_chunks"] += chunks
-                logger.info(f"  ✓ {patient_id[:8]}...: {chunks} chunks")
-            else:
-                stats["failed"] += 1
-                stats["errors"].append({"patient_id": patient_id, "error": error})
-                logger.error(f"  ✗ {patient_id[:8]}...: {error}")
+                if success:
+                    batch_ok += 1
+                    batch_chunks += chunks
+                    logger.debug("  ✓ %.8s...: %d chunks", patient_id, chunks)
+                else:
+                    stats.add_failure(patient_id, error)
+                    logger.error("  ✗ %.8s...: %s", patient_id, error)
+            
+            stats.processed += batch_ok
+            stats.successful += batch_ok
+            stats.total_chunks += batch_chunks
+            logger.info("  Batch %d: ok=%d fail=%d chunks=%d",
+                        batch_num, batch_ok, len(batch) - batch_ok, batch_chunks)
         
-        # Small delay between batches to avoid overwhelming the API
-        if not dry_run and i + batch_size < len(patients):
-            await asyncio.sleep(0.5)
+            # Optional pause between batches to ease load on the API
+            if batch_delay > 0 and i + batch_size < len(patients):
+                await asyncio.sleep(batch_delay)
     
     # Final stats
     total_time = time.time() - start_time
-    stats["total_time_seconds"] = total_time
-    stats["rate_patients_per_second"] = stats["processed"] / total_time if total_time > 0 else 0
+    result = asdict(stats)
+    result["total_time_seconds"] = total_time
+    result["rate_patients_per_second"] = stats.processed / total_time if total_time > 0 else 0
     
-    return stats
+    return result
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -499,7 +805,19 @@ def parse_args():
         "--batch-size", 
         type=int, 
         default=10,
-        help="Number of patients per batch (default: 10)"
+        help="Number of patients embedded concurrently per batch (default: 10)"
+    )
+    parser.add_argument(
+        "--batch-delay",
+        type=float,
+        default=0.0,
+        help="Seconds to pause between batches (default: 0)"
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=DEFAULT_MAX_INFLIGHT,
+        help=f"Ingest POSTs in flight across all patients (default: {DEFAULT_MAX_INFLIGHT})"
     )
     parser.add_argument(
         "--api-url", 
@@ -517,10 +835,13 @@ def parse_args():
 async def main():
     args = parse_args()
     
+    # Size the connection pool for the patient fan-out before any query runs
+    get_engine(args.batch_size)
+    
     # Override Ollama URL if specified
     if args.ollama_url:
         os.environ["OLLAMA_BASE_URL"] = args.ollama_url
-        logger.info(f"Using Ollama URL: {args.ollama_url}")
+        logger.info("Using Ollama URL: %s", args.ollama_url)
     
     print("\n" + "═" * 70)
     print("  FHIR Patient Batch Embedding Script")
@@ -562,12 +883,17 @@ async def main():
             return
     
     # Run batch embedding
-    stats = await run_batch_embedding(
-        api_url=args.api_url,
-        batch_size=args.batch_size,
-        limit=args.limit,
-        dry_run=args.dry_run
-    )
+    try:
+        stats = await run_batch_embedding(
+            api_url=args.api_url,
+            batch_size=args.batch_size,
+            limit=args.limit,
+            dry_run=args.dry_run,
+            batch_delay=args.batch_delay,
+            max_inflight=args.max_inflight
+        )
+    finally:
+        await close_pg_pool()
     
     # Print summary
     print("\n" + "═" * 70)
@@ -580,10 +906,10 @@ async def main():
     print(f"  Total time: {stats.get('total_time_seconds', 0):.1f}s")
     print(f"  Rate: {stats.get('rate_patients_per_second', 0):.2f} patients/sec")
     
-    if stats.get('errors'):
-        print(f"\n  Errors ({len(stats['errors'])} total):")
-        for err in stats['errors'][:5]:
-            print(f"    - {err['patient_id'][:20]}...: {err['error'][:50]}")
+    if stats.get('error_patient_ids'):
+        print(f"\n  Errors ({len(stats['error_patient_ids'])} total):")
+        for patient_id, error in list(zip(stats['error_patient_ids'], stats['error_messages']))[:5]:
+            print(f"    - {patient_id[:20]}...: {error[:50]}")
     
     print("═" * 70 + "\n")
 
@@ -4,7 +4,6 @@ Quick script to check if embeddings are actually in the database.
 """
 import os
 import sys
-import asyncio
 from pathlib import Path
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy import text
@@ -12,6 +11,7 @@ from sqlalchemy import text
 ROOT_DIR = Path(__file__).resolve().parents[1]  # Go up 1 level from scripts/ to project root
 sys.path.insert(0, str(ROOT_DIR))
 from utils.env_loader import load_env_recursive
+from utils.event_loop import run
 load_env_recursive(ROOT_DIR)
 
 POSTGRES_USER = os.environ.get("DB_USER")
@@ -82,4 +82,4 @@ async def check_database():
         await engine.dispose()
 
 if __name__ == "__main__":
-    asyncio.run(check_database())
+    run(check_database())
@@ -1,6 +1,5 @@
 import os
 import sys
-import asyncio
 
 # Add scripts/ and root to path
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -9,6 +8,7 @@ sys.path.insert(0, CURRENT_DIR)
 sys.path.insert(0, ROOT_DIR)
 
 from utils.env_loader import load_env_recursive
+from utils.event_loop import run
 load_env_recursive(ROOT_DIR)
 
 import ingest_fhir_json
@@ -27,8 +27,7 @@ async def check_patients():
     print(f"Checking {len(ids)} patients in Postgres ({ingest_fhir_json.DB_HOST}:{ingest_fhir_json.DB_PORT}/{ingest_fhir_json.DB_NAME})...")
     
     try:
-        found_records = await ingest_fhir_json.get_latest_raw_files_by_patient_ids(ids)
-        found_ids = {r['patient_id'] for r in found_records}
+        found_ids = await ingest_fhir_json.exists_patient_ids(ids)
         
         missing = []
         for name, pid in candidates:
@@ -47,4 +46,4 @@ async def check_patients():
         print(f"Error checking DB: {e}")
 
 if __name__ == "__main__":
-    asyncio.run(check_patients())
+    run(check_patients())
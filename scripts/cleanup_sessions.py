@@ -6,6 +6,21 @@ from boto3.dynamodb.conditions import Key
 os.environ["AWS_REGION"] = "us-east-1"
 os.environ["DDB_ENDPOINT"] = "http://localhost:8001"
 
+def _turn_keys(turns_table, session_id: str):
+    """Yield the primary key of every turn in a session, paging through the query."""
+    kwargs = {
+        "KeyConditionExpression": Key("session_id").eq(session_id),
+        "ProjectionExpression": "session_id, turn_ts",
+    }
+    while True:
+        resp = turns_table.query(**kwargs)
+        for item in resp.get("Items", []):
+            yield {"session_id": item["session_id"], "turn_ts": item["turn_ts"]}
+        if "LastEvaluatedKey" not in resp:
+            break
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
 def cleanup_sessions(user_id: str, limit: int = 20):
     print(f"Cleaning up sessions for {user_id}. Maintaining max {limit}...")
     
@@ -47,28 +62,24 @@ def cleanup_sessions(user_id: str, limit: int = 20):
         sessions_to_delete = sessions[limit:]
         print(f"Deleting {len(sessions_to_delete)} old sessions...")
         
-        # 4. Delete them
-        count = 0
-        for session in sessions_to_delete:
-            pk = session['session_id']
-            sk = session['sk']
-            
-            # Delete summary
-            table.delete_item(Key={'session_id': pk, 'sk': sk})
-            
-            # Also clean up turns table? 
-            # The store.clear_session method does this, but importing it might be tricky if we want to batch this.
-            # For now, let's just delete the summary so it disappears from the UI. 
-            # Ideally we should use store.clear_session(pk) but that fetches first.
-            # Let's use the store's clear_session to be thorough, even if slower.
-            
-            store.clear_session(pk)
-            
-            count += 1
-            if count % 5 == 0:
-                print(f"Deleted {count}/{len(sessions_to_delete)}...")
-                
-        print(f"Cleanup complete! Deleted {count} sessions. {limit} sessions remain.")
+        # 4. Delete them. batch_writer packs up to 25 deletes into each BatchWriteItem call.
+        with table.batch_writer() as batch:
+            for session in sessions_to_delete:
+                batch.delete_item(Key={'session_id': session['session_id'], 'sk': session['sk']})
+        print(f"Deleted {len(sessions_to_delete)} session summaries.")
+
+        # 5. Delete their turns the same way, rather than store.clear_session per session,
+        # which re-deletes the summary and opens a batch per page of turns.
+        turns_table = store.turns_table
+        turn_count = 0
+        with turns_table.batch_writer() as batch:
+            for session in sessions_to_delete:
+                for key in _turn_keys(turns_table, session['session_id']):
+                    batch.delete_item(Key=key)
+                    turn_count += 1
+        print(f"Deleted {turn_count} turns.")
+
+        print(f"Cleanup complete! Deleted {len(sessions_to_delete)} sessions. {limit} sessions remain.")
 
     except Exception as e:
         print(f"Error during cleanup: {e}")
@@ -1,9 +1,19 @@
 #!/usr/bin/env python
 """
 Quick script to embed the 5 verified test patients.
+
+Patients that already have chunks in hc_ai_table are skipped, so running it
+again embeds nothing; check with --dry-run.
 """
-import subprocess
+import argparse
+import asyncio
 import sys
+from typing import List
+
+from sqlalchemy import text
+
+import batch_embed_patients
+import ingest_fhir_json
 
 # The 5 verified test patient IDs (partial)
 PATIENT_PREFIXES = [
@@ -14,79 +24,59 @@ PATIENT_PREFIXES = [
     '7f7ad77a',  # Carlo Herzog
 ]
 
-def main():
+API_URL = "http://localhost:8000"
+
+
+async def _resolve_prefixes(prefixes: List[str]) -> List[str]:
+    """Full patient ID for each prefix found in the raw FHIR table, in prefix order, in one query."""
+    engine = ingest_fhir_json.get_engine()
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text(
+                    f"""
+                    SELECT DISTINCT ON (p.ord) r.patient_id
+                    FROM unnest(CAST(:prefixes AS text[])) WITH ORDINALITY AS p(prefix, ord)
+                    JOIN "{ingest_fhir_json.SCHEMA_NAME}"."{ingest_fhir_json.RAW_TABLE}" r
+                      ON r.patient_id LIKE p.prefix || '%'
+                    ORDER BY p.ord, r.patient_id
+                    """
+                ),
+                {'prefixes': prefixes},
+            )
+            return list(result.scalars())
+    finally:
+        await engine.dispose()
+
+
+async def main(dry_run: bool = False):
     print("="*70)
     print("  Embedding 5 Verified Test Patients")
     print("="*70)
-    
-    # Get full patient IDs from database
-    get_ids_script = """
-import asyncio
-import os
-from pathlib import Path
-import sys
-sys.path.insert(0, '.')
-from utils.env_loader import load_env_recursive
-load_env_recursive(Path('.'))
-
-from sqlalchemy import text
-from sqlalchemy.ext.asyncio import create_async_engine
-
-async def get_ids():
-    user = os.getenv('DB_USER')
-    password = os.getenv('DB_PASSWORD')
-    host = os.getenv('DB_HOST', 'localhost')
-    port = os.getenv('DB_PORT', '5432')
-    name = os.getenv('DB_NAME')
-    
-    conn_str = f'postgresql+asyncpg://{user}:{password}@{host}:{port}/{name}'
-    engine = create_async_engine(conn_str, echo=False)
-    
-    prefixes = %s
-    patient_ids = []
-    
-    async with engine.begin() as conn:
-        for prefix in prefixes:
-            result = await conn.execute(text('''
-                SELECT DISTINCT patient_id 
-                FROM hc_ai_schema.fhir_raw_files
-                WHERE patient_id LIKE :prefix
-            '''), {'prefix': f'{prefix}%%'})
-            pid = result.scalar()
-            if pid:
-                patient_ids.append(pid)
-    
-    for pid in patient_ids:
-        print(pid)
 
-asyncio.run(get_ids())
-""" % PATIENT_PREFIXES
-    
-    result = subprocess.run(
-        ['python', '-c', get_ids_script],
-        capture_output=True,
-        text=True,
-        cwd='/Users/raph/Documents/hc_ai'
-    )
-    
-    if result.returncode != 0:
-        print(f"Error getting patient IDs: {result.stderr}")
+    # Get full patient IDs from database
+    try:
+        patient_ids = await _resolve_prefixes(PATIENT_PREFIXES)
+    except Exception as e:
+        print(f"Error getting patient IDs: {e}")
         sys.exit(1)
-    
-    patient_ids = [line.strip() for line in result.stdout.strip().split('\n') if line.strip()]
-    
-    print(f"\nFound {len(patient_ids)} patients to embed:")
+
+    print(f"\nFound {len(patient_ids)} verified patients:")
     for pid in patient_ids:
         print(f"  - {pid[:20]}...")
-    
+
     # Now run batch embed for just these patients
-    print(f"\nRunning batch_embed_patients.py with limit {len(patient_ids)}...")
-    result = subprocess.run(
-        ['python', 'scripts/batch_embed_patients.py', '--limit', str(len(patient_ids))],
-        cwd='/Users/raph/Documents/hc_ai'
-    )
-    
-    sys.exit(result.returncode)
+    print(f"\nRunning batch embedding for {len(patient_ids)} patients{' (dry run)' if dry_run else ''}...")
+    try:
+        stats = await batch_embed_patients.run_batch_embedding(api_url=API_URL, patient_ids=patient_ids, dry_run=dry_run)
+    finally:
+        await batch_embed_patients.close_pg_pool()
+        await batch_embed_patients.get_engine().dispose()
+
+    print(f"\nSuccessful: {stats.get('successful', 0)} | Failed: {stats.get('failed', 0)} | Chunks: {stats.get('total_chunks', 0)}")
+
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true", help="Show which patients would be embedded without embedding them")
+    asyncio.run(main(parser.parse_args().dry_run))
@@ -20,13 +20,18 @@ Behavior:
 import argparse
 import asyncio
 import hashlib
-import json
+import heapq
 import os
+import zlib
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
 
+import orjson
 from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 # Load .env from repo root (one level up from scripts/ folder)
@@ -34,6 +39,7 @@ ROOT_DIR = Path(__file__).resolve().parents[1]  # Go up 1 level from scripts/ to
 import sys
 sys.path.insert(0, str(ROOT_DIR))
 from utils.env_loader import load_env_recursive
+from utils.event_loop import run
 load_env_recursive(ROOT_DIR)
 
 DB_USER = os.getenv("DB_USER")
@@ -48,8 +54,16 @@ LOG_TABLE = os.getenv("HC_AI_RAW_LOG_TABLE", "fhir_raw_ingest_log")
 
 DEFAULT_DATA_DIR = ROOT_DIR / "data" / "fhir"
 DEFAULT_MAX_FILES = 10_000  # per requirement: first 10,000 files ordered by filename
+POOL_SIZE = int(os.getenv("HC_AI_INGEST_POOL_SIZE", "16"))
+DEFAULT_BATCH_SIZE = int(os.getenv("HC_AI_INGEST_BATCH_SIZE", "200"))
+DEFAULT_CONCURRENCY = 4  # batch writers; each holds up to one batch of parsed bundles in memory
+READ_AHEAD = 64  # files read ahead of the writers
+LOG_FLUSH_SIZE = 100
+LOG_FLUSH_INTERVAL = 0.05  # seconds the log writer waits to fill a batch
 
 _engine: Optional[AsyncEngine] = None
+_tables_ready = asyncio.Event()
+_tables_lock = asyncio.Lock()
 
 
 # ------------------------------- Engine & Schema ------------------------------- #
@@ -65,7 +79,8 @@ def get_engine() -> AsyncEngine:
     if _engine is None:
         _require_env()
         conn_str = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        _engine = create_async_engine(conn_str, echo=False)
+        # bundle_json reads decode through orjson rather than stdlib json (SQLAlchemy installs it as the jsonb codec)
+        _engine = create_async_engine(conn_str, echo=False, pool_size=POOL_SIZE, max_overflow=0, json_deserializer=orjson.loads)
     return _engine
 
 
@@ -106,6 +121,17 @@ async def ensure_tables(engine: AsyncEngine):
                 """
             )
         )
+        # Covers the metadata columns so listings, existence checks and the ingest preload
+        # can be index-only scans and never touch the (TOASTed) bundle_json.
+        await conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS "idx_{RAW_TABLE}_patient_ver"
+                ON "{SCHEMA_NAME}"."{RAW_TABLE}" (patient_id, version DESC)
+                INCLUDE (source_filename, file_path, file_hash, ingested_at);
+                """
+            )
+        )
 
         await conn.execute(
             text(
@@ -134,10 +160,22 @@ async def ensure_tables(engine: AsyncEngine):
         )
 
 
+async def ensure_tables_once():
+    """Run ensure_tables on first use only, so reads don't pay its DDL round-trips every call."""
+    if _tables_ready.is_set():
+        return
+    async with _tables_lock:
+        if not _tables_ready.is_set():
+            await ensure_tables(get_engine())
+            _tables_ready.set()
+
+
 # ------------------------------- Helpers ------------------------------- #
 
-def compute_hash(data: bytes) -> str:
-    return hashlib.sha256(data).hexdigest()
+def compute_hash_of_file(path: Path) -> Tuple[bytes, str]:
+    """A file's bytes and their sha256, from a single read."""
+    data = path.read_bytes()
+    return data, hashlib.sha256(data).hexdigest()
 
 
 def extract_patient_id(bundle: Dict[str, Any]) -> str:
@@ -155,74 +193,58 @@ def extract_patient_id(bundle: Dict[str, Any]) -> str:
     return "unknown"
 
 
-def load_bundle(path: Path) -> Tuple[Dict[str, Any], str]:
-    data = path.read_bytes()
-    bundle = json.loads(data)
-    return bundle, compute_hash(data)
+_UTF8_BOM = b"\xef\xbb\xbf"
 
 
-async def get_existing_version(conn, patient_id: str, filename: str, file_hash: str) -> Optional[int]:
+def parse_bundle(data: bytes) -> Dict[str, Any]:
+    # orjson (unlike json.loads on bytes) rejects a leading UTF-8 BOM, which some exporters write
+    return orjson.loads(data.removeprefix(_UTF8_BOM))
+
+
+async def get_stored_files(conn) -> Dict[Tuple[str, str], Tuple[str, int]]:
+    """(source_filename, file_hash) -> (patient_id, version) for everything already stored."""
     res = await conn.execute(
-        text(
-            f"""
-            SELECT version
-            FROM "{SCHEMA_NAME}"."{RAW_TABLE}"
-            WHERE patient_id = :patient_id
-              AND source_filename = :filename
-              AND file_hash = :file_hash
-            LIMIT 1
-            """
-        ),
-        {"patient_id": patient_id, "filename": filename, "file_hash": file_hash},
+        text(f'SELECT source_filename, file_hash, patient_id, version FROM "{SCHEMA_NAME}"."{RAW_TABLE}"')
     )
-    row = res.fetchone()
-    return row[0] if row else None
+    return {(r[0], r[1]): (r[2], r[3]) for r in res.fetchall()}
+
 
+async def insert_raw_files(conn, rows: List[Dict[str, Any]]) -> Set[Tuple[str, str, str]]:
+    """Insert versioned rows in one statement; returns the (patient_id, filename, hash) keys actually written.
 
-async def next_version_for_patient(conn, patient_id: str) -> int:
+    Identical content already stored (e.g. by a concurrent run) is left alone and missing from the result.
+    """
     res = await conn.execute(
-        text(
-            f"""
-            SELECT COALESCE(MAX(version), 0) + 1
-            FROM "{SCHEMA_NAME}"."{RAW_TABLE}"
-            WHERE patient_id = :patient_id
-            """
-        ),
-        {"patient_id": patient_id},
-    )
-    return res.scalar_one()
-
-
-async def insert_raw_file(
-    conn,
-    patient_id: str,
-    filename: str,
-    file_path: str,
-    file_hash: str,
-    bundle_json: Dict[str, Any],
-    version: int,
-):
-    await conn.execute(
         text(
             f"""
             INSERT INTO "{SCHEMA_NAME}"."{RAW_TABLE}"
                 (patient_id, source_filename, file_path, file_hash, bundle_json, version)
-            VALUES
-                (:patient_id, :filename, :file_path, :file_hash, CAST(:bundle_json AS jsonb), :version)
+            SELECT patient_id, source_filename, file_path, file_hash, CAST(bundle_json AS jsonb), version
+            FROM unnest(
+                CAST(:patient_ids AS text[]), CAST(:filenames AS text[]), CAST(:file_paths AS text[]),
+                CAST(:file_hashes AS text[]), CAST(:bundle_jsons AS text[]), CAST(:versions AS integer[])
+            ) AS t(patient_id, source_filename, file_path, file_hash, bundle_json, version)
+            ON CONFLICT (patient_id, source_filename, file_hash) DO NOTHING
+            RETURNING patient_id, source_filename, file_hash
             """
         ),
         {
-            "patient_id": patient_id,
-            "filename": filename,
-            "file_path": file_path,
-            "file_hash": file_hash,
-            "bundle_json": json.dumps(bundle_json),
-            "version": version,
+            "patient_ids": [r["patient_id"] for r in rows],
+            "filenames": [r["filename"] for r in rows],
+            "file_paths": [r["file_path"] for r in rows],
+            "file_hashes": [r["file_hash"] for r in rows],
+            "bundle_jsons": [r["bundle_json"] for r in rows],
+            "versions": [r["version"] for r in rows],
         },
     )
+    return {(r[0], r[1], r[2]) for r in res.fetchall()}
 
 
-async def log_ingest(conn, patient_id: str, filename: str, file_path: str, file_hash: str, status: str, version: Optional[int], message: str = ""):
+def _row_key(row: Dict[str, Any]) -> Tuple[str, str, str]:
+    return row["patient_id"], row["filename"], row["file_hash"]
+
+
+async def log_ingest_many(conn, entries: List[Dict[str, Any]]):
     await conn.execute(
         text(
             f"""
@@ -232,59 +254,300 @@ async def log_ingest(conn, patient_id: str, filename: str, file_path: str, file_
                 (:patient_id, :filename, :file_path, :file_hash, :version, :status, :message)
             """
         ),
-        {
-            "patient_id": patient_id,
-            "filename": filename,
-            "file_path": file_path,
-            "file_hash": file_hash,
-            "version": version,
-            "status": status,
-            "message": message[:2000],
-        },
+        [{**entry, "message": entry.get("message", "")[:2000]} for entry in entries],
     )
 
 
-# ------------------------------- Ingest Logic ------------------------------- #
+async def log_ingest(conn, patient_id: str, filename: str, file_path: str, file_hash: str, status: str, version: Optional[int], message: str = ""):
+    await log_ingest_many(
+        conn,
+        [
+            {
+                "patient_id": patient_id,
+                "filename": filename,
+                "file_path": file_path,
+                "file_hash": file_hash,
+                "version": version,
+                "status": status,
+                "message": message,
+            }
+        ],
+    )
 
-async def process_file(conn, path: Path, dry_run: bool = False) -> Tuple[str, str, str]:
-    bundle, file_hash = load_bundle(path)
-    patient_id = extract_patient_id(bundle)
-    filename = path.name
-    existing_version = await get_existing_version(conn, patient_id, filename, file_hash)
 
-    if existing_version is not None:
-        await log_ingest(conn, patient_id, filename, str(path), file_hash, status="skipped-identical", version=existing_version, message="Identical content already stored")
-        return patient_id, filename, "skipped"
+# ------------------------------- Ingest Logic ------------------------------- #
 
-    version = await next_version_for_patient(conn, patient_id)
-    if not dry_run:
-        await insert_raw_file(conn, patient_id, filename, str(path), file_hash, bundle, version)
-        await log_ingest(conn, patient_id, filename, str(path), file_hash, status="ingested", version=version)
-    return patient_id, filename, "ingested"
+def select_files(data_dir: Path, max_files: Optional[int]) -> List[Path]:
+    """The first max_files *.json files by name; memory stays O(max_files) however large the directory."""
+    with os.scandir(data_dir) as it:
+        names = (e.name for e in it if e.name.endswith(".json") and e.is_file())
+        chosen = sorted(names) if max_files is None else heapq.nsmallest(max_files, names)
+    return [data_dir / name for name in chosen]
+
+
+# Set in each reader process by _init_reader; (source_filename, file_hash) pairs already stored.
+_known_files: frozenset = frozenset()
+
+
+def _init_reader(known_files: frozenset):
+    global _known_files
+    _known_files = known_files
+
+
+def read_file(path: Path) -> Dict[str, Any]:
+    """Hash one bundle and, unless that exact file is already stored, parse it into a row for ingest_batch.
+
+    Known files come back without patient_id/bundle_json; the caller fills those in from get_stored_files.
+    """
+    data, file_hash = compute_hash_of_file(path)
+    row: Dict[str, Any] = {"filename": path.name, "file_path": str(path), "file_hash": file_hash}
+    if (path.name, file_hash) in _known_files:
+        return row
+    # Drop a UTF-8 BOM once here: it would also fail the jsonb cast of the text bound below.
+    data = data.removeprefix(_UTF8_BOM)
+    row["patient_id"] = extract_patient_id(parse_bundle(data))
+    # Postgres parses it into jsonb anyway; ship the file's own text instead of re-serializing the dict.
+    row["bundle_json"] = data.decode("utf-8")
+    return row
+
+
+_LOG_KEYS = ("patient_id", "filename", "file_path", "file_hash")
+
+
+async def ingest_batch(
+    conn, rows: List[Dict[str, Any]], max_versions: Dict[str, int], dry_run: bool = False
+) -> Tuple[Dict[str, int], List[Dict[str, Any]], Dict[str, int]]:
+    """Version and insert a batch of rows in one round-trip; returns counts, log rows and new max versions.
+
+    Rows that already carry a version are known duplicates and are only logged. New files get
+    the next version after max_versions, which is only read here: the returned versions must be
+    merged into it by the caller once the transaction commits, so a rolled-back batch leaves no
+    version gaps. That relies on every row of a patient going through the same writer.
+
+    Rows the insert skips because a concurrent run already stored the same content are logged
+    as skipped-identical; the batch is then re-versioned without them, so they consume no version.
+
+    If the batch insert fails (e.g. a bundle with a \\u0000 escape, which jsonb rejects), the
+    rows are retried one at a time, each in its own savepoint, so only the bad files fail.
+    """
+    counts = {"ingested": 0, "skipped": 0, "failed": 0}
+    pending: List[Dict[str, Any]] = []
+    log_entries: List[Dict[str, Any]] = []
+    for row in rows:
+        version = row.get("version")
+        if version is not None:
+            counts["skipped"] += 1
+            log_entries.append({**{k: row[k] for k in _LOG_KEYS}, "version": version, "status": "skipped-identical", "message": "Identical content already stored"})
+            continue
+        if dry_run:
+            counts["ingested"] += 1
+            continue
+        pending.append(row)
+
+    def skip_concurrent(row: Dict[str, Any]):
+        counts["skipped"] += 1
+        log_entries.append({**{k: row[k] for k in _LOG_KEYS}, "version": None, "status": "skipped-identical", "message": "Identical content stored concurrently"})
+
+    while pending:
+        new_versions: Dict[str, int] = {}
+        to_insert: List[Dict[str, Any]] = []
+        for row in pending:
+            version = new_versions.get(row["patient_id"], max_versions.get(row["patient_id"], 0)) + 1
+            new_versions[row["patient_id"]] = version
+            to_insert.append({**row, "version": version})
+        savepoint = await conn.begin_nested()
+        try:
+            written = await insert_raw_files(conn, to_insert)
+        except DBAPIError:
+            await savepoint.rollback()
+            break
+        if len(written) == len(to_insert):
+            await savepoint.commit()
+            counts["ingested"] += len(to_insert)
+            log_entries.extend({**{k: row[k] for k in _LOG_KEYS}, "version": row["version"], "status": "ingested"} for row in to_insert)
+            return counts, log_entries, new_versions
+        # Some rows were already there; undo the rest and hand out their versions again without the gaps.
+        await savepoint.rollback()
+        for row in pending:
+            if _row_key(row) not in written:
+                skip_concurrent(row)
+        pending = [row for row in pending if _row_key(row) in written]
+
+    # Row-by-row fallback; versions are handed out again so failed or skipped files don't consume one.
+    new_versions = {}
+    for row in pending:
+        meta = {k: row[k] for k in _LOG_KEYS}
+        version = new_versions.get(row["patient_id"], max_versions.get(row["patient_id"], 0)) + 1
+        try:
+            async with conn.begin_nested():
+                written = await insert_raw_files(conn, [{**row, "version": version}])
+        except DBAPIError as exc:
+            counts["failed"] += 1
+            print(f"[ERROR] {row['filename']}: {exc}")
+            log_entries.append({**meta, "version": None, "status": "failed", "message": str(exc)})
+            continue
+        if not written:
+            skip_concurrent(row)
+            continue
+        new_versions[row["patient_id"]] = version
+        counts["ingested"] += 1
+        log_entries.append({**meta, "version": version, "status": "ingested"})
+    return counts, log_entries, new_versions
+
+
+def writer_for(patient_id: str, writers: int) -> int:
+    """Writer that owns a patient; routing by patient keeps its versions in one writer's hands."""
+    return zlib.crc32(patient_id.encode()) % writers
+
+
+async def _log_worker(engine: AsyncEngine, log_queue: asyncio.Queue):
+    """Write queued ingest-log rows in batches of up to LOG_FLUSH_SIZE, off the ingest path."""
+    loop = asyncio.get_running_loop()
+    while True:
+        entries = [await log_queue.get()]
+        deadline = loop.time() + LOG_FLUSH_INTERVAL
+        while len(entries) < LOG_FLUSH_SIZE:
+            try:
+                entries.append(await asyncio.wait_for(log_queue.get(), max(0.0, deadline - loop.time())))
+            except asyncio.TimeoutError:
+                break
+        try:
+            async with engine.begin() as conn:
+                await log_ingest_many(conn, entries)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[LOG-ERROR] dropped {len(entries)} log rows: {exc}")
+        finally:
+            for _ in entries:
+                log_queue.task_done()
 
 
-async def ingest_dir(data_dir: Path, max_files: int, dry_run: bool = False) -> Dict[str, int]:
-    engine = get_engine()
-    await ensure_tables(engine)
+def _log_failure(log_queue: asyncio.Queue, path: Path, message: str):
+    print(f"[ERROR] {path.name}: {message}")
+    log_queue.put_nowait(
+        {"patient_id": "unknown", "filename": path.name, "file_path": str(path), "file_hash": "", "version": None, "status": "failed", "message": message}
+    )
 
-    files = sorted(data_dir.glob("*.json"))
-    selected = files[:max_files] if max_files is not None else files
 
-    stats = {"total": len(selected), "ingested": 0, "skipped": 0, "failed": 0}
+async def _read_files(
+    paths: List[Path],
+    executor: Executor,
+    stored: Dict[Tuple[str, str], Tuple[str, int]],
+    row_queues: List[asyncio.Queue],
+    log_queue: asyncio.Queue,
+) -> Dict[str, int]:
+    """Producer: read files in the process pool, in order, and queue each row for its patient's writer.
 
-    for path in selected:
+    Keeps up to READ_AHEAD reads in flight; a full queue pauses reading until that writer catches up.
+    """
+    loop = asyncio.get_running_loop()
+    counts = {"failed": 0}
+    pending: Deque[Tuple[Path, asyncio.Future]] = deque()
+
+    async def settle():
+        path, future = pending.popleft()
+        try:
+            row = await future
+        except Exception as exc:  # noqa: BLE001
+            counts["failed"] += 1
+            _log_failure(log_queue, path, str(exc))
+            return
+        if "bundle_json" not in row:
+            row["patient_id"], row["version"] = stored[(row["filename"], row["file_hash"])]
+        await row_queues[writer_for(row["patient_id"], len(row_queues))].put(row)
+
+    try:
+        for path in paths:
+            pending.append((path, loop.run_in_executor(executor, read_file, path)))
+            if len(pending) >= READ_AHEAD:
+                await settle()
+        while pending:
+            await settle()
+    finally:
+        for row_queue in row_queues:
+            await row_queue.put(None)
+    return counts
+
+
+async def _write_rows(
+    engine: AsyncEngine,
+    row_queue: asyncio.Queue,
+    max_versions: Dict[str, int],
+    log_queue: asyncio.Queue,
+    batch_size: int,
+    dry_run: bool,
+) -> Dict[str, int]:
+    """Consumer: take up to batch_size rows off the queue and write them as one transaction, until the end marker."""
+    counts = {"ingested": 0, "skipped": 0, "failed": 0}
+    done = False
+    while not done:
+        rows: List[Dict[str, Any]] = []
+        while len(rows) < batch_size:
+            row = await row_queue.get()
+            if row is None:
+                done = True
+                break
+            rows.append(row)
+        if not rows:
+            continue
         try:
             async with engine.begin() as conn:
-                _, filename, status = await process_file(conn, path, dry_run=dry_run)
-                stats[status] = stats.get(status, 0) + 1
+                batch_counts, log_entries, new_versions = await ingest_batch(conn, rows, max_versions, dry_run=dry_run)
         except Exception as exc:  # noqa: BLE001
-            stats["failed"] += 1
-            try:
-                async with engine.begin() as conn:
-                    await log_ingest(conn, patient_id="unknown", filename=path.name, file_path=str(path), file_hash="", status="failed", version=None, message=str(exc))
-            except Exception as log_exc:  # noqa: BLE001
-                print(f"[LOG-ERROR] {path.name}: {log_exc}")
-            print(f"[ERROR] {path.name}: {exc}")
+            counts["failed"] += len(rows)
+            for r in rows:
+                _log_failure(log_queue, Path(r["file_path"]), str(exc))
+            continue
+        # Only take the versions and log once the batch has committed.
+        max_versions.update(new_versions)
+        for status, n in batch_counts.items():
+            counts[status] += n
+        for entry in log_entries:
+            log_queue.put_nowait(entry)
+    return counts
+
+
+async def ingest_dir(
+    data_dir: Path,
+    max_files: int,
+    dry_run: bool = False,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Dict[str, int]:
+    engine = get_engine()
+    await ensure_tables_once()
+    # Everything needed to dedupe and version comes from this one read; the rest of the run is
+    # in-memory decisions plus batched writes.
+    async with engine.connect() as conn:
+        stored = await get_stored_files(conn)
+    max_versions: Dict[str, int] = {}
+    for patient_id, version in stored.values():
+        max_versions[patient_id] = max(version, max_versions.get(patient_id, 0))
+
+    selected = select_files(data_dir, max_files)
+
+    stats = {"total": len(selected), "ingested": 0, "skipped": 0, "failed": 0}
+
+    # One producer reads/parses/hashes in a process pool (CPU) while `writers` consumers each write
+    # batches on their own pooled connection (I/O), so wall time tends to max(parse, db) not their sum.
+    # Leave one pooled connection for the log writer and never exceed the pool, or waiters hit pool_timeout.
+    # Readers only parse files whose (name, hash) isn't stored yet, so re-runs are hash-bound.
+    # Each patient's rows go to one writer (see writer_for), so versions are never handed out twice.
+    writers = max(1, min(concurrency, POOL_SIZE - 1))
+    row_queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=max(1, READ_AHEAD // writers)) for _ in range(writers)]
+    log_queue: asyncio.Queue = asyncio.Queue()
+    log_task = asyncio.create_task(_log_worker(engine, log_queue))
+    try:
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_init_reader, initargs=(frozenset(stored),)) as executor:
+            results = await asyncio.gather(
+                _read_files(selected, executor, stored, row_queues, log_queue),
+                *(_write_rows(engine, row_queue, max_versions, log_queue, batch_size, dry_run) for row_queue in row_queues),
+            )
+        await log_queue.join()
+    finally:
+        log_task.cancel()
+    for counts in results:
+        for status, n in counts.items():
+            stats[status] += n
     return stats
 
 
@@ -293,7 +556,7 @@ async def ingest_dir(data_dir: Path, max_files: int, dry_run: bool = False) -> D
 async def get_raw_files_by_patient(patient_id: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
     """Fetch raw bundles for a patient, newest versions first."""
     engine = get_engine()
-    await ensure_tables(engine)
+    await ensure_tables_once()
     async with engine.begin() as conn:
         res = await conn.execute(
             text(
@@ -325,7 +588,7 @@ async def get_raw_files_by_patient(patient_id: str, limit: int = 50, offset: int
 async def get_raw_file(patient_id: str, filename: str) -> Optional[Dict[str, Any]]:
     """Fetch latest version of a specific file for a patient."""
     engine = get_engine()
-    await ensure_tables(engine)
+    await ensure_tables_once()
     async with engine.begin() as conn:
         res = await conn.execute(
             text(
@@ -358,22 +621,34 @@ async def get_raw_files_by_patients(patient_ids: List[str], limit_per_patient: i
     """Fetch raw bundles for multiple patients, newest versions first."""
     if not patient_ids:
         return []
+    params: Dict[str, Any] = {"patient_ids": patient_ids}
+    # Trim per patient in SQL so versions past the limit never leave the server.
+    rank_filter = ""
+    if limit_per_patient is not None:
+        rank_filter = "WHERE rn <= :limit_per_patient"
+        params["limit_per_patient"] = limit_per_patient
     engine = get_engine()
-    await ensure_tables(engine)
+    await ensure_tables_once()
     async with engine.begin() as conn:
         res = await conn.execute(
             text(
                 f"""
                 SELECT patient_id, source_filename, file_path, file_hash, version, ingested_at, bundle_json
-                FROM "{SCHEMA_NAME}"."{RAW_TABLE}"
-                WHERE patient_id = ANY(:patient_ids)
+                FROM (
+                    SELECT
+                        patient_id, source_filename, file_path, file_hash, version, ingested_at, bundle_json,
+                        ROW_NUMBER() OVER (PARTITION BY patient_id ORDER BY version DESC) AS rn
+                    FROM "{SCHEMA_NAME}"."{RAW_TABLE}"
+                    WHERE patient_id = ANY(:patient_ids)
+                ) ranked
+                {rank_filter}
                 ORDER BY patient_id, version DESC
                 """
             ),
-            {"patient_ids": patient_ids},
+            params,
         )
         rows = res.fetchall()
-        results = [
+        return [
             {
                 "patient_id": r[0],
                 "source_filename": r[1],
@@ -385,16 +660,6 @@ async def get_raw_files_by_patients(patient_ids: List[str], limit_per_patient: i
             }
             for r in rows
         ]
-    if limit_per_patient is None:
-        return results
-    trimmed: List[Dict[str, Any]] = []
-    counts: Dict[str, int] = {}
-    for item in results:
-        pid = item["patient_id"]
-        counts[pid] = counts.get(pid, 0) + 1
-        if counts[pid] <= limit_per_patient:
-            trimmed.append(item)
-    return trimmed
 
 
 async def get_latest_raw_files_by_patient_ids(patient_ids: List[str]) -> List[Dict[str, Any]]:
@@ -402,7 +667,7 @@ async def get_latest_raw_files_by_patient_ids(patient_ids: List[str]) -> List[Di
     if not patient_ids:
         return []
     engine = get_engine()
-    await ensure_tables(engine)
+    await ensure_tables_once()
     async with engine.begin() as conn:
         res = await conn.execute(
             text(
@@ -437,6 +702,26 @@ async def get_latest_raw_files_by_patient_ids(patient_ids: List[str]) -> List[Di
         ]
 
 
+async def exists_patient_ids(patient_ids: List[str]) -> Set[str]:
+    """Which of patient_ids have at least one raw bundle, without fetching any bundle_json."""
+    if not patient_ids:
+        return set()
+    engine = get_engine()
+    await ensure_tables_once()
+    async with engine.connect() as conn:
+        res = await conn.execute(
+            text(
+                f"""
+                SELECT DISTINCT patient_id
+                FROM "{SCHEMA_NAME}"."{RAW_TABLE}"
+                WHERE patient_id = ANY(:patient_ids)
+                """
+            ),
+            {"patient_ids": patient_ids},
+        )
+        return set(res.scalars())
+
+
 # ------------------------------- CLI ------------------------------- #
 
 def parse_args():
@@ -445,6 +730,8 @@ def parse_args():
     parser.add_argument("--max-files", type=int, default=DEFAULT_MAX_FILES, help="Maximum files to process, ordered by filename (default: 10000)")
     parser.add_argument("--no-limit", action="store_true", help="Process all files (overrides --max-files)")
     parser.add_argument("--dry-run", action="store_true", help="Parse and hash only; no DB writes")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help=f"Files written per transaction (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help=f"Batch writers running in parallel, capped below the pool size (default: {DEFAULT_CONCURRENCY})")
     return parser.parse_args()
 
 
@@ -457,12 +744,12 @@ async def main():
         raise FileNotFoundError(f"Data directory not found: {data_dir}")
 
     started = datetime.utcnow()
-    print(f"Starting ingest from {data_dir} (max_files={max_files}, dry_run={args.dry_run}) at {started.isoformat()}Z")
-    stats = await ingest_dir(data_dir, max_files=max_files, dry_run=args.dry_run)
+    print(f"Starting ingest from {data_dir} (max_files={max_files}, dry_run={args.dry_run}, batch_size={args.batch_size}, concurrency={args.concurrency}) at {started.isoformat()}Z")
+    stats = await ingest_dir(data_dir, max_files=max_files, dry_run=args.dry_run, concurrency=args.concurrency, batch_size=args.batch_size)
     finished = datetime.utcnow()
     print(f"Finished at {finished.isoformat()}Z | duration={(finished - started).total_seconds():.1f}s")
     print(f"Stats: {stats}")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main())
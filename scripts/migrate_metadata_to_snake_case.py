@@ -7,22 +7,61 @@ metadata keys for consistency with retrieval code.
 
 Before: {"patientId": "...", "resourceId": "...", ...}
 After:  {"patient_id": "...", "resource_id": "...", ...}
+
+Usage:
+    python scripts/migrate_metadata_to_snake_case.py [--convert-jsonb]
+
+--convert-jsonb also converts langchain_metadata from json to jsonb. That
+rewrites the whole table under an ACCESS EXCLUSIVE lock, blocking every
+reader and writer until it finishes; run it in a maintenance window.
 """
+import argparse
 import asyncio
 import asyncpg
 import os
 from pathlib import Path
 import sys
 import json
+import uuid
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT_DIR))
 from utils.env_loader import load_env_recursive
 load_env_recursive(ROOT_DIR)
 
+BATCH_SIZE = 10_000  # rows rewritten per transaction
+BATCH_TIMEOUT = '5min'  # statement_timeout for each batch
+MIGRATION_LOCK = 'hc_ai_metadata_migration'  # advisory lock name; one run at a time
+CONVERT_LOCK_TIMEOUT = '5s'  # give up on --convert-jsonb rather than queue everyone behind it
+CONVERT_TIMEOUT = '1h'  # statement_timeout for the --convert-jsonb table rewrite
+
+# camelCase → snake_case; keys not listed here (e.g. 'status') are kept as-is
+KEY_MAP = {
+    # Core identifiers
+    'patientId': 'patient_id',
+    'resourceId': 'resource_id',
+    'resourceType': 'resource_type',
+    'fullUrl': 'full_url',
+    'sourceFile': 'source_file',
+
+    # Chunk identifiers
+    'chunkId': 'chunk_id',
+    'chunkIndex': 'chunk_index',
+    'totalChunks': 'total_chunks',
+    'chunkSize': 'chunk_size',
+
+    # Additional metadata
+    'effectiveDate': 'effective_date',
+    'lastUpdated': 'last_updated',
+}
+
+
+async def migrate_metadata(convert_jsonb: bool = False):
+    """
+    Migrate all metadata keys from camelCase to snake_case.
 
-async def migrate_metadata():
-    """Migrate all metadata keys from camelCase to snake_case."""
+    convert_jsonb also converts the column from json to jsonb (see module docstring).
+    """
     print("\n" + "="*80)
     print("METADATA MIGRATION: camelCase → snake_case")
     print("="*80)
@@ -36,11 +75,17 @@ async def migrate_metadata():
     )
     
     try:
+        # A second concurrent run exits instead of racing the first. Session-level lock, so it
+        # is released when the connection closes, however the run ends.
+        if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", MIGRATION_LOCK):
+            print("\n⚠️  Another metadata migration is running (advisory lock held). Exiting.")
+            return
+        
         # Count total records
         total = await conn.fetchval(
             "SELECT COUNT(*) FROM hc_ai_schema.hc_ai_table"
         )
-        print(f"\n📊 Total records to migrate: {total:,}")
+        print(f"\n📊 Total records: {total:,}")
         
         # Show sample BEFORE migration
         print("\n🔍 Sample metadata BEFORE migration:")
@@ -53,40 +98,101 @@ async def migrate_metadata():
             metadata = json.loads(sample_before['langchain_metadata']) if isinstance(sample_before['langchain_metadata'], str) else sample_before['langchain_metadata']
             print(f"  Keys: {list(metadata.keys())}")
         
-        # Perform migration
-        print("\n⚙️  Running migration...")
-        result = await conn.execute("""
-            UPDATE hc_ai_schema.hc_ai_table
-            SET langchain_metadata = (
-                SELECT jsonb_object_agg(
-                    CASE key
-                        -- Core identifiers
-                        WHEN 'patientId' THEN 'patient_id'
-                        WHEN 'resourceId' THEN 'resource_id'
-                        WHEN 'resourceType' THEN 'resource_type'
-                        WHEN 'fullUrl' THEN 'full_url'
-                        WHEN 'sourceFile' THEN 'source_file'
-                        
-                        -- Chunk identifiers
-                        WHEN 'chunkId' THEN 'chunk_id'
-                        WHEN 'chunkIndex' THEN 'chunk_index'
-                        WHEN 'totalChunks' THEN 'total_chunks'
-                        WHEN 'chunkSize' THEN 'chunk_size'
-                        
-                        -- Additional metadata
-                        WHEN 'effectiveDate' THEN 'effective_date'
-                        WHEN 'lastUpdated' THEN 'last_updated'
-                        
-                        -- Keep other keys as-is (e.g., 'status')
-                        ELSE key
-                    END,
-                    value
-                )
-                FROM jsonb_each(langchain_metadata::jsonb)
-            )::json
+        # langchain_postgres creates the column as json. jsonb avoids a reparse on every
+        # ->> / ? access and can be GIN-indexed; it is read and written as JSON text either
+        # way, so PGVectorStore is unaffected. The conversion rewrites the whole table under
+        # an ACCESS EXCLUSIVE lock, so it only runs on request, and gives up instead of
+        # waiting long for the lock (every query queued behind it would wait too).
+        column_type = await conn.fetchval("""
+            SELECT atttypid::regtype::text
+            FROM pg_attribute
+            WHERE attrelid = 'hc_ai_schema.hc_ai_table'::regclass
+              AND attname = 'langchain_metadata'
         """)
+        if column_type == 'json' and convert_jsonb:
+            print("\n⚠️  Converting langchain_metadata from json to jsonb: the table is locked until the rewrite ends...")
+            try:
+                async with conn.transaction():
+                    await conn.execute(f"SET LOCAL lock_timeout = '{CONVERT_LOCK_TIMEOUT}'")
+                    await conn.execute(f"SET LOCAL statement_timeout = '{CONVERT_TIMEOUT}'")
+                    await conn.execute("""
+                        ALTER TABLE hc_ai_schema.hc_ai_table
+                        ALTER COLUMN langchain_metadata TYPE jsonb USING langchain_metadata::jsonb
+                    """)
+            except (asyncpg.exceptions.LockNotAvailableError, asyncpg.exceptions.QueryCanceledError) as e:
+                print(f"\n⚠️  json → jsonb conversion aborted, nothing changed ({e}). Retry when the table is quieter.")
+                return
+            column_type = 'jsonb'
+        elif column_type == 'json':
+            print("\nℹ️  langchain_metadata is json; pass --convert-jsonb to convert it (locks the table).")
+        
+        # Only rows still holding a camelCase key are touched, so a re-run after an interruption
+        # picks up where the last one stopped.
+        pending = await conn.fetchval("""
+            SELECT COUNT(*)
+            FROM hc_ai_schema.hc_ai_table
+            WHERE langchain_metadata::jsonb ?| $1::text[]
+        """, list(KEY_MAP))
+        print(f"📊 Records to migrate: {pending:,}")
+        
+        # Perform migration in primary-key order, one short transaction per batch, so no
+        # single statement locks or rewrites the whole table. (ctid would move under us:
+        # every updated row gets a new one.)
+        print(f"\n⚙️  Running migration in batches of {BATCH_SIZE:,}...")
+        last_id = uuid.UUID(int=0)
+        migrated = 0
+        while True:
+            async with conn.transaction():
+                await conn.execute(f"SET LOCAL statement_timeout = '{BATCH_TIMEOUT}'")
+                row = await conn.fetchrow(f"""
+                    WITH batch AS (
+                        SELECT langchain_id
+                        FROM hc_ai_schema.hc_ai_table
+                        WHERE langchain_id > $1
+                          AND langchain_metadata::jsonb ?| $3::text[]
+                        ORDER BY langchain_id
+                        LIMIT $2
+                    ),
+                    updated AS (
+                        UPDATE ONLY hc_ai_schema.hc_ai_table t
+                        -- Rename only the legacy keys present, rather than rebuilding every
+                        -- pair; a snake_case key that already exists keeps its value. The
+                        -- ::jsonb casts are no-ops on a jsonb column
+                        SET langchain_metadata = ((
+                            SELECT jsonb_object_agg(m.snake, t.langchain_metadata::jsonb->m.camel)
+                            FROM unnest($3::text[], $4::text[]) AS m(camel, snake)
+                            WHERE t.langchain_metadata::jsonb ? m.camel
+                        ) || (t.langchain_metadata::jsonb - $3::text[]))::{column_type}
+                        FROM batch
+                        WHERE t.langchain_id = batch.langchain_id
+                        RETURNING 1
+                    )
+                    SELECT
+                        (SELECT langchain_id FROM batch ORDER BY langchain_id DESC LIMIT 1) AS last_id,
+                        (SELECT COUNT(*) FROM updated) AS updated
+                """, last_id, BATCH_SIZE, list(KEY_MAP), list(KEY_MAP.values()))
+            if row["last_id"] is None:
+                break
+            last_id = row["last_id"]
+            migrated += row["updated"]
+            print(f"  ... {migrated:,}/{pending:,} records")
         
-        print(f"✅ Migration complete: {result}")
+        print(f"✅ Migration complete: {migrated:,} records updated")
+        
+        # Index the key retrieval filters on (langchain_metadata->>'patient_id' = ...), and the
+        # whole document for key-existence (?, ?|) and containment (@>) lookups. jsonb_path_ops
+        # would be smaller but cannot answer ?. CONCURRENTLY keeps the table writable; it cannot
+        # run inside a transaction. A json column has no GIN operator class.
+        print("\n⚙️  Indexing metadata...")
+        await conn.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_hc_ai_patient_id
+            ON hc_ai_schema.hc_ai_table ((langchain_metadata->>'patient_id'))
+        """)
+        if column_type == 'jsonb':
+            await conn.execute("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_hc_ai_meta_gin
+                ON hc_ai_schema.hc_ai_table USING GIN (langchain_metadata)
+            """)
         
         # Show sample AFTER migration
         print("\n🔍 Sample metadata AFTER migration:")
@@ -105,7 +211,7 @@ async def migrate_metadata():
         patient_count = await conn.fetchval("""
             SELECT COUNT(*) 
             FROM hc_ai_schema.hc_ai_table
-            WHERE (langchain_metadata::jsonb) ? 'patient_id'
+            WHERE langchain_metadata::jsonb ? 'patient_id'
         """)
         print(f"\n✓ Records with 'patient_id' key: {patient_count:,}/{total:,}")
         
@@ -124,4 +230,10 @@ async def migrate_metadata():
 
 
 if __name__ == "__main__":
-    asyncio.run(migrate_metadata())
+    parser = argparse.ArgumentParser(description="Migrate hc_ai_table metadata keys to snake_case")
+    parser.add_argument(
+        "--convert-jsonb",
+        action="store_true",
+        help="Also convert langchain_metadata from json to jsonb (rewrites and locks the whole table)",
+    )
+    asyncio.run(migrate_metadata(parser.parse_args().convert_jsonb))
@@ -1,4 +1,8 @@
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from api.session.store_dynamodb import get_session_store
 from boto3.dynamodb.conditions import Key
 
@@ -6,62 +10,111 @@ from boto3.dynamodb.conditions import Key
 os.environ["AWS_REGION"] = "us-east-1"
 os.environ["DDB_ENDPOINT"] = "http://localhost:8001"
 
-def migrate_user(old_uid: str, new_uid: str):
+TRANSACT_CHUNK = 100  # TransactWriteItems limit per call
+TRANSACT_ATTEMPTS = 5
+
+
+def _iter_session_pages(table, user_id: str):
+    """Yield user_id's sessions one Query page at a time.
+
+    The next page is fetched on a worker thread while the caller works on the current one,
+    so at most two pages are held in memory. The worker pages through the table's low-level
+    client (thread-safe, unlike the resource the caller's batch_writer uses); it is the
+    resource's client, so items still come back as plain Python values.
+    """
+    paginator = table.meta.client.get_paginator("query")
+    pages = iter(paginator.paginate(
+        TableName=table.name,
+        IndexName="user_id-index",
+        KeyConditionExpression=Key("user_id").eq(user_id),
+    ))
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        next_page = pool.submit(next, pages, None)
+        while (resp := next_page.result()) is not None:
+            next_page = pool.submit(next, pages, None)
+            yield resp.get("Items", [])
+
+
+def _set_user_id(client, table_name: str, sessions, new_uid: str) -> int:
+    """SET user_id on a chunk of sessions in one TransactWriteItems call, leaving other attributes alone.
+
+    client is the table resource's client, which (de)serializes attribute values itself. Sessions
+    deleted since the Query fail their attribute_exists condition and are skipped rather than
+    recreated as stubs. Returns the number of sessions updated.
+    """
+    items = [
+        {
+            "Update": {
+                "TableName": table_name,
+                "Key": {"session_id": s["session_id"], "sk": s["sk"]},
+                "UpdateExpression": "SET user_id = :u",
+                "ConditionExpression": "attribute_exists(session_id)",
+                "ExpressionAttributeValues": {":u": new_uid},
+            }
+        }
+        for s in sessions
+    ]
+    attempt = 0
+    while items:
+        try:
+            client.transact_write_items(TransactItems=items)
+            break
+        except client.exceptions.TransactionCanceledException as e:
+            reasons = e.response.get("CancellationReasons", [])
+            gone = {i for i, r in enumerate(reasons) if r.get("Code") == "ConditionalCheckFailed"}
+            if gone:
+                # Nothing in the chunk was applied; resend it without the deleted sessions
+                items = [item for i, item in enumerate(items) if i not in gone]
+                continue
+            # Usually a conflict with a concurrent write to one of the items; the chunk is all-or-nothing
+            attempt += 1
+            if attempt == TRANSACT_ATTEMPTS:
+                raise
+            time.sleep(0.1 * 2 ** (attempt - 1))
+    return len(items)
+
+
+def migrate_user(old_uid: str, new_uid: str, in_place: bool = False):
+    """Move every session of old_uid to new_uid.
+
+    By default each session is re-put whole through batch_writer. With in_place, only user_id
+    is updated (TransactWriteItems), so concurrent writes to other attributes are not lost.
+    """
     print(f"Starting migration from {old_uid} to {new_uid}...")
     
     try:
         store = get_session_store()
         table = store.summary_table
         
-        # 1. Find all sessions for old user
-        print("Finding sessions...")
-        sessions = []
-        start_key = None
-        
-        while True:
-            kwargs = {
-                "IndexName": "user_id-index",
-                "KeyConditionExpression": Key("user_id").eq(old_uid),
-            }
-            if start_key:
-                kwargs["ExclusiveStartKey"] = start_key
-                
-            resp = table.query(**kwargs)
-            sessions.extend(resp.get("Items", []))
-            
-            start_key = resp.get("LastEvaluatedKey")
-            if not start_key:
-                break
-                
-        print(f"Found {len(sessions)} sessions to migrate.")
-        
-        if not sessions:
+        # 1. Stream the old user's sessions page by page. The GSI projects ALL attributes, so
+        # the queried items are complete and batch_writer can send them 25 per BatchWriteItem
+        # (it resends UnprocessedItems; boto3's retry handler backs off on throttling).
+        print("Migrating sessions...")
+        count = 0
+        with table.batch_writer() as batch:
+            for page in _iter_session_pages(table, old_uid):
+                # 2. Move each session to the new user_id
+                if in_place:
+                    for i in range(0, len(page), TRANSACT_CHUNK):
+                        chunk = page[i:i + TRANSACT_CHUNK]
+                        count += _set_user_id(table.meta.client, table.name, chunk, new_uid)
+                        print(f"Migrated {count}...")
+                    continue
+
+                for session in page:
+                    batch.put_item(Item={**session, 'user_id': new_uid})
+                    count += 1
+                    if count % 10 == 0:
+                        print(f"Migrated {count}...")
+
+        if not count:
             print("No sessions found. Exiting.")
             return
 
-        # 2. Update each session
-        count = 0
-        # Note: batch_writer doesn't support update_item, only put_item and delete_item.
-        # Since we want to update only one field and batch_writer is for put/delete,
-        # we will iterate and update individually. It's 36 items, so it's fast enough.
-        
-        for session in sessions:
-            pk = session['session_id']
-            sk = session['sk']
-            
-            table.update_item(
-                Key={'session_id': pk, 'sk': sk},
-                UpdateExpression="SET user_id = :new_uid",
-                ExpressionAttributeValues={':new_uid': new_uid}
-            )
-            count += 1
-            if count % 10 == 0:
-                print(f"Migrated {count}/{len(sessions)}...")
-                
         print(f"Migration complete! {count} sessions transferred to '{new_uid}'.")
 
     except Exception as e:
         print(f"Error during migration: {e}")
 
 if __name__ == "__main__":
-    migrate_user("178eb255", "raph")
+    migrate_user("178eb255", "raph", in_place="--in-place" in sys.argv)
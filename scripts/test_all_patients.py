@@ -6,20 +6,39 @@ Outputs results to a markdown report.
 Usage:
     python scripts/test_all_patients.py
     python scripts/test_all_patients.py --output results/test_report.md
+    python scripts/test_all_patients.py --concurrency 8
+    python scripts/test_all_patients.py --refresh      # ignore cached results
+    python scripts/test_all_patients.py --from-cache   # report from cached results only
 """
 
 import argparse
 import asyncio
+import hashlib
+import io
+import itertools
+import json
 import os
+import re
+import shutil
 import sys
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from secrets import token_hex
+from typing import Any, Dict, List, Optional, TextIO
 
 import httpx
 
+# HTTP/2 lets the concurrent queries share one connection; needs httpx[http2]
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 # Test configuration
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 TIMEOUT_SECONDS = 180  # 3 minutes per query (32B model is slow)
+DEFAULT_CONCURRENCY = 4  # In-flight queries; the semaphore is the only backpressure
 
 # All test patients from ReferencePanel.tsx
 PATIENTS = [
@@ -99,6 +118,17 @@ HALLUCINATION_PATTERNS = [
     "[CODE]",  # Placeholder leak
 ]
 
+HALLUCINATION_PATTERNS_LOWER = [p.lower() for p in HALLUCINATION_PATTERNS]
+
+# All patterns in one case-insensitive scan. The lookahead lets matches overlap, and longer
+# patterns are tried first where two start at the same position.
+_HALLUCINATION_RE = re.compile(
+    "(?=("
+    + "|".join(re.escape(p) for p in sorted(HALLUCINATION_PATTERNS, key=len, reverse=True))
+    + "))",
+    re.IGNORECASE,
+)
+
 
 class TestResult:
     """Holds result of a single test."""
@@ -130,14 +160,31 @@ class TestResult:
         self.hallucinations = self._check_hallucinations()
         self.passed = self._evaluate_pass()
 
+    def to_dict(self) -> Dict[str, Any]:
+        """Constructor arguments, for the on-disk result cache."""
+        return {
+            "patient_name": self.patient_name,
+            "patient_id": self.patient_id,
+            "prompt": self.prompt,
+            "response": self.response,
+            "sources": self.sources,
+            "tool_calls": self.tool_calls,
+            "iteration_count": self.iteration_count,
+            "duration_seconds": self.duration_seconds,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TestResult":
+        """Rebuild a result (and its computed fields) from to_dict() output."""
+        return cls(**data)
+
     def _check_hallucinations(self) -> List[str]:
         """Check for known hallucination patterns."""
-        found = []
-        response_lower = self.response.lower()
-        for pattern in HALLUCINATION_PATTERNS:
-            if pattern.lower() in response_lower:
-                found.append(pattern)
-        return found
+        if not self.has_response:
+            return []  # Already a failure; nothing worth scanning
+        hits = {m.group(1).lower() for m in _HALLUCINATION_RE.finditer(self.response)}
+        return [p for p, low in zip(HALLUCINATION_PATTERNS, HALLUCINATION_PATTERNS_LOWER) if low in hits]
 
     def _evaluate_pass(self) -> bool:
         """Determine if test passed."""
@@ -150,42 +197,242 @@ class TestResult:
         return True
 
 
+def _cache_path(cache_dir: str, patient_id: str, prompt: str) -> str:
+    """Cache file for one (patient, prompt) pair."""
+    return os.path.join(cache_dir, f"{patient_id}_{hashlib.md5(prompt.encode()).hexdigest()[:8]}.json")
+
+
+def _load_cached(path: str) -> Optional[TestResult]:
+    """Cached result at `path`, or None if there is none."""
+    try:
+        with open(path) as f:
+            return TestResult.from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+
+
+def _save_cached(path: str, result: TestResult) -> None:
+    """Write a result to the cache; written to a temp file first so a crash never leaves half a file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(result.to_dict(), f)
+    os.replace(tmp_path, path)
+
+
+def load_cached_results(cache_dir: str) -> List[TestResult]:
+    """Cached results for the selected patients × prompts, in run order; missing pairs are skipped."""
+    results = []
+    for patient, prompt in itertools.product(PATIENTS, PROMPTS):
+        cached = _load_cached(_cache_path(cache_dir, patient["id"], prompt))
+        if cached is None:
+            print(f"  (no cached result for {patient['name']}: {prompt[:50]}...)")
+        else:
+            results.append(cached)
+    return results
+
+
+def _write_header(out: TextIO, results: List[TestResult]) -> None:
+    """Write the report title and summary table."""
+
+    # Calculate summary stats
+    total = len(results)
+    passed = sum(1 for r in results if r.passed)
+    failed = total - passed
+    hallucinations = sum(1 for r in results if r.hallucinations)
+    errors = sum(1 for r in results if r.error)
+    avg_duration = sum(r.duration_seconds for r in results) / total if total > 0 else 0
+
+    out.write("# Atlas Agent Test Report\n")
+    out.write("\n")
+    out.write(f"**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    out.write("\n")
+    out.write("## Summary\n")
+    out.write("\n")
+    out.write("| Metric | Value |\n")
+    out.write("|--------|-------|\n")
+    out.write(f"| Total Tests | {total} |\n")
+    out.write(f"| ✓ Passed | {passed} ({100*passed/total:.1f}%) |\n")
+    out.write(f"| ✗ Failed | {failed} ({100*failed/total:.1f}%) |\n")
+    out.write(f"| Hallucinations | {hallucinations} |\n")
+    out.write(f"| Errors | {errors} |\n")
+    out.write(f"| Avg Duration | {avg_duration:.1f}s |\n")
+    out.write("\n")
+    out.write("---\n")
+
+
+def _write_patient(out: TextIO, patient_results: List[TestResult]) -> None:
+    """Write one patient's section: their pass count, then each prompt's result."""
+    patient_passed = sum(1 for r in patient_results if r.passed)
+    patient_total = len(patient_results)
+
+    out.write(f"## {patient_results[0].patient_name}\n")
+    out.write("\n")
+    out.write(f"**Patient ID:** `{patient_results[0].patient_id}`\n")
+    out.write(f"**Results:** {patient_passed}/{patient_total} passed\n")
+    out.write("\n")
+
+    for result in patient_results:
+        status_icon = "✓" if result.passed else "✗"
+        out.write(f"### {status_icon} {result.prompt}\n")
+        out.write("\n")
+
+        if result.error:
+            out.write(f"**Error:** {result.error}\n")
+            out.write("\n")
+        else:
+            # Response preview (first 500 chars)
+            response_preview = result.response[:500]
+            if len(result.response) > 500:
+                response_preview += "..."
+
+            out.write("**Response:**\n")
+            out.write("```\n")
+            out.write(f"{response_preview}\n")
+            out.write("```\n")
+            out.write("\n")
+
+            out.write(f"**Tool Calls:** {', '.join(result.tool_calls) if result.tool_calls else 'None'}\n")
+            out.write(f"**Duration:** {result.duration_seconds:.1f}s\n")
+            out.write(f"**Iterations:** {result.iteration_count}\n")
+
+            if result.hallucinations:
+                out.write(f"**⚠️ Hallucinations Detected:** {', '.join(result.hallucinations)}\n")
+
+            if result.sources:
+                out.write(f"**Sources:** {len(result.sources)} chunks retrieved\n")
+
+            out.write("\n")
+
+    out.write("---\n")
+
+
+def generate_markdown_report(results: List[TestResult], output_path: str) -> str:
+    """Generate a markdown report from test results."""
+
+    # Group results by patient
+    by_patient: Dict[str, List[TestResult]] = {}
+    for result in results:
+        by_patient.setdefault(result.patient_name, []).append(result)
+
+    buf = io.StringIO()
+    _write_header(buf, results)
+    for patient_results in by_patient.values():
+        buf.write("\n")
+        _write_patient(buf, patient_results)
+    report_content = buf.getvalue()
+
+    # Ensure output directory exists
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    with open(output_path, "w") as f:
+        f.write(report_content)
+
+    return report_content
+
+
+class ReportWriter:
+    """Streams patient sections to `<output>.part` as tests finish.
+
+    Sections go out in PATIENTS order, each once all of that patient's prompts
+    are done, after which the full responses are dropped. `close()` writes the
+    summary header to the output and appends the body, so an interrupted run
+    still leaves the finished sections in the .part file.
+    """
+
+    def __init__(self, output_path: str, prompts_per_patient: int):
+        self.output_path = output_path
+        self.part_path = f"{output_path}.part"
+        self.prompts_per_patient = prompts_per_patient
+        self._pending: Dict[int, Dict[int, TestResult]] = {}
+        self._next_patient = 0
+
+        # Ensure output directory exists
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        self._body = open(self.part_path, "w")
+
+    def add(self, test_num: int, result: TestResult) -> None:
+        """Record a finished test and write out any patient sections now complete."""
+        patient_idx, prompt_idx = divmod(test_num - 1, self.prompts_per_patient)
+        self._pending.setdefault(patient_idx, {})[prompt_idx] = result
+
+        while len(self._pending.get(self._next_patient, ())) == self.prompts_per_patient:
+            slots = self._pending.pop(self._next_patient)
+            patient_results = [slots[i] for i in range(self.prompts_per_patient)]
+            self._body.write("\n")
+            _write_patient(self._body, patient_results)
+            self._body.flush()
+            for r in patient_results:
+                r.response = ""  # Already in the report; keep only the stats
+            self._next_patient += 1
+
+    def close(self, results: List[TestResult]) -> None:
+        """Write the summary header followed by the streamed sections."""
+        self._body.close()
+        with open(self.output_path, "w") as out, open(self.part_path) as body:
+            _write_header(out, results)
+            shutil.copyfileobj(body, out)
+        os.remove(self.part_path)
+
+
+def make_client() -> httpx.AsyncClient:
+    """Shared keep-alive client for the whole run."""
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=16),
+        timeout=TIMEOUT_SECONDS,
+    )
+
+
 async def query_agent(
+    client: httpx.AsyncClient,
     patient_id: str,
     query: str,
     session_id: str,
 ) -> Dict[str, Any]:
     """Send a query to the agent API."""
-    async with httpx.AsyncClient(timeout=TIMEOUT_SECONDS) as client:
-        response = await client.post(
-            f"{API_BASE_URL}/agent/query",
-            json={
-                "query": query,
-                "patient_id": patient_id,
-                "session_id": session_id,
-            },
-        )
-        response.raise_for_status()
-        return response.json()
+    response = await client.post(
+        f"{API_BASE_URL}/agent/query",
+        json={
+            "query": query,
+            "patient_id": patient_id,
+            "session_id": session_id,
+        },
+    )
+    response.raise_for_status()
+    return response.json()
 
 
 async def run_single_test(
+    client: httpx.AsyncClient,
     patient: Dict[str, Any],
     prompt: str,
     test_num: int,
     total_tests: int,
+    cache_dir: Optional[str] = None,
+    refresh: bool = False,
 ) -> TestResult:
-    """Run a single test case."""
+    """Run a single test case.
+
+    With `cache_dir`, a cached result is reused unless `refresh`, and each completed
+    (non-error) result is cached for the next run.
+    """
     patient_name = patient["name"]
     patient_id = patient["id"]
-    session_id = f"test-{patient_id[:8]}-{datetime.now().strftime('%H%M%S')}"
+    session_id = f"test-{patient_id[:8]}-{token_hex(4)}"
+    label = f"  [{test_num}/{total_tests}] {patient_name}: {prompt[:50]}..."
 
-    print(f"  [{test_num}/{total_tests}] {patient_name}: {prompt[:50]}...", end=" ", flush=True)
+    cache_path = _cache_path(cache_dir, patient_id, prompt) if cache_dir else None
+    if cache_path and not refresh:
+        cached = _load_cached(cache_path)
+        if cached is not None:
+            print(f"{label} {'✓ PASS' if cached.passed else '✗ FAIL'} (cached)")
+            return cached
 
-    start_time = datetime.now()
+    start = time.perf_counter()
     try:
-        result = await query_agent(patient_id, prompt, session_id)
-        duration = (datetime.now() - start_time).total_seconds()
+        result = await query_agent(client, patient_id, prompt, session_id)
+        duration = time.perf_counter() - start
 
         test_result = TestResult(
             patient_name=patient_name,
@@ -197,17 +444,19 @@ async def run_single_test(
             iteration_count=result.get("iteration_count", 0),
             duration_seconds=duration,
         )
+        if cache_path:
+            _save_cached(cache_path, test_result)
 
         status = "✓ PASS" if test_result.passed else "✗ FAIL"
         if test_result.hallucinations:
             status += f" (hallucination: {test_result.hallucinations[0]})"
-        print(f"{status} ({duration:.1f}s)")
+        print(f"{label} {status} ({duration:.1f}s)")
 
         return test_result
 
     except Exception as e:
-        duration = (datetime.now() - start_time).total_seconds()
-        print(f"✗ ERROR: {e}")
+        duration = time.perf_counter() - start
+        print(f"{label} ✗ ERROR: {e}")
         return TestResult(
             patient_name=patient_name,
             patient_id=patient_id,
@@ -221,135 +470,53 @@ async def run_single_test(
         )
 
 
-async def run_all_tests() -> List[TestResult]:
-    """Run all test cases."""
-    results = []
+async def run_all_tests(
+    client: httpx.AsyncClient,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    report: Optional[ReportWriter] = None,
+    cache_dir: Optional[str] = None,
+    refresh: bool = False,
+) -> List[TestResult]:
+    """Run all test cases, at most `concurrency` at a time, in patient × prompt order.
+
+    If `report` is given, each result is handed to it as soon as it finishes.
+    `cache_dir` and `refresh` are passed to run_single_test.
+    """
     total_tests = len(PATIENTS) * len(PROMPTS)
-    test_num = 0
 
     print(f"\n{'='*60}")
-    print(f"Running {total_tests} tests ({len(PATIENTS)} patients × {len(PROMPTS)} prompts)")
+    print(f"Running {total_tests} tests ({len(PATIENTS)} patients × {len(PROMPTS)} prompts, "
+          f"{concurrency} at a time)")
     print(f"{'='*60}\n")
 
     for patient in PATIENTS:
-        print(f"\n📋 Patient: {patient['name']} ({patient['age']} yrs)")
+        print(f"📋 Patient: {patient['name']} ({patient['age']} yrs)")
         print(f"   ID: {patient['id']}")
         print(f"   Expected: {', '.join(patient['expected_conditions'][:3])}")
-        print()
-
-        for prompt in PROMPTS:
-            test_num += 1
-            result = await run_single_test(patient, prompt, test_num, total_tests)
-            results.append(result)
-
-            # Small delay between requests to avoid overwhelming the server
-            await asyncio.sleep(1)
-
-    return results
-
-
-def generate_markdown_report(results: List[TestResult], output_path: str) -> str:
-    """Generate a markdown report from test results."""
-
-    # Calculate summary stats
-    total = len(results)
-    passed = sum(1 for r in results if r.passed)
-    failed = total - passed
-    hallucinations = sum(1 for r in results if r.hallucinations)
-    errors = sum(1 for r in results if r.error)
-    avg_duration = sum(r.duration_seconds for r in results) / total if total > 0 else 0
+    print()
 
-    # Build markdown
-    lines = [
-        "# Atlas Agent Test Report",
-        "",
-        f"**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-        "",
-        "## Summary",
-        "",
-        "| Metric | Value |",
-        "|--------|-------|",
-        f"| Total Tests | {total} |",
-        f"| ✓ Passed | {passed} ({100*passed/total:.1f}%) |",
-        f"| ✗ Failed | {failed} ({100*failed/total:.1f}%) |",
-        f"| Hallucinations | {hallucinations} |",
-        f"| Errors | {errors} |",
-        f"| Avg Duration | {avg_duration:.1f}s |",
-        "",
-        "---",
-        "",
-    ]
+    sem = asyncio.Semaphore(concurrency)
 
-    # Group results by patient
-    patients_seen = []
-    for result in results:
-        if result.patient_name not in patients_seen:
-            patients_seen.append(result.patient_name)
-
-    for patient_name in patients_seen:
-        patient_results = [r for r in results if r.patient_name == patient_name]
-        patient_passed = sum(1 for r in patient_results if r.passed)
-        patient_total = len(patient_results)
-
-        lines.append(f"## {patient_name}")
-        lines.append("")
-        lines.append(f"**Patient ID:** `{patient_results[0].patient_id}`")
-        lines.append(f"**Results:** {patient_passed}/{patient_total} passed")
-        lines.append("")
-
-        for result in patient_results:
-            status_icon = "✓" if result.passed else "✗"
-            lines.append(f"### {status_icon} {result.prompt}")
-            lines.append("")
-
-            if result.error:
-                lines.append(f"**Error:** {result.error}")
-                lines.append("")
-            else:
-                # Response preview (first 500 chars)
-                response_preview = result.response[:500]
-                if len(result.response) > 500:
-                    response_preview += "..."
-
-                lines.append("**Response:**")
-                lines.append("```")
-                lines.append(response_preview)
-                lines.append("```")
-                lines.append("")
-
-                lines.append(f"**Tool Calls:** {', '.join(result.tool_calls) if result.tool_calls else 'None'}")
-                lines.append(f"**Duration:** {result.duration_seconds:.1f}s")
-                lines.append(f"**Iterations:** {result.iteration_count}")
-
-                if result.hallucinations:
-                    lines.append(f"**⚠️ Hallucinations Detected:** {', '.join(result.hallucinations)}")
-
-                if result.sources:
-                    lines.append(f"**Sources:** {len(result.sources)} chunks retrieved")
-
-                lines.append("")
-
-        lines.append("---")
-        lines.append("")
-
-    # Write report
-    report_content = "\n".join(lines)
+    async def _guarded(patient: Dict[str, Any], prompt: str, test_num: int) -> TestResult:
+        async with sem:
+            result = await run_single_test(
+                client, patient, prompt, test_num, total_tests, cache_dir=cache_dir, refresh=refresh,
+            )
+        if report is not None:
+            report.add(test_num, result)
+        return result
 
-    # Ensure output directory exists
-    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    return await asyncio.gather(*[
+        _guarded(patient, prompt, test_num)
+        for test_num, (patient, prompt) in enumerate(itertools.product(PATIENTS, PROMPTS), 1)
+    ])
 
-    with open(output_path, "w") as f:
-        f.write(report_content)
 
-    return report_content
-
-
-async def check_server_health() -> bool:
+async def check_server_health(client: httpx.AsyncClient) -> bool:
     """Check if the API server is running."""
     try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            response = await client.get(f"{API_BASE_URL}/health")
-            return response.status_code == 200
+        response = await client.get(f"{API_BASE_URL}/health", timeout=5)
+        return response.status_code == 200
     except Exception:
         return False
 
@@ -370,15 +537,26 @@ async def main():
         type=int,
         help="Test only a specific prompt (1-4)",
     )
+    parser.add_argument(
+        "--concurrency", "-c",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Maximum queries in flight at once (default: {DEFAULT_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Re-run every test, ignoring cached results",
+    )
+    parser.add_argument(
+        "--from-cache",
+        action="store_true",
+        help="Build the report from cached results only, without querying the API",
+    )
     args = parser.parse_args()
 
-    # Check server health
-    print("Checking API server health...")
-    if not await check_server_health():
-        print(f"ERROR: API server not responding at {API_BASE_URL}")
-        print("Start the server with: uvicorn api.main:app --reload --port 8000")
-        sys.exit(1)
-    print(f"✓ API server healthy at {API_BASE_URL}")
+    # Cached results live next to the report
+    cache_dir = os.path.join(os.path.dirname(args.output) or ".", ".cache")
 
     # Filter patients/prompts if specified
     global PATIENTS, PROMPTS
@@ -395,14 +573,37 @@ async def main():
             print(f"ERROR: Prompt number must be 1-{len(PROMPTS)}")
             sys.exit(1)
 
-    # Run tests
-    results = await run_all_tests()
+    if args.from_cache:
+        results = load_cached_results(cache_dir)
+        if not results:
+            print(f"ERROR: No cached results in {cache_dir}")
+            sys.exit(1)
 
-    # Generate report
-    print(f"\n{'='*60}")
-    print("Generating report...")
-    generate_markdown_report(results, args.output)
-    print(f"✓ Report saved to: {args.output}")
+        print(f"\n{'='*60}")
+        print(f"Generating report from {len(results)} cached results...")
+        generate_markdown_report(results, args.output)
+        print(f"✓ Report saved to: {args.output}")
+    else:
+        async with make_client() as client:
+            # Check server health
+            print("Checking API server health...")
+            if not await check_server_health(client):
+                print(f"ERROR: API server not responding at {API_BASE_URL}")
+                print("Start the server with: uvicorn api.main:app --reload --port 8000")
+                sys.exit(1)
+            print(f"✓ API server healthy at {API_BASE_URL}")
+
+            # Run tests, streaming each patient's section to the report as it completes
+            report = ReportWriter(args.output, len(PROMPTS))
+            results = await run_all_tests(
+                client, max(1, args.concurrency), report, cache_dir=cache_dir, refresh=args.refresh,
+            )
+
+        # Finish report
+        print(f"\n{'='*60}")
+        print("Finalizing report...")
+        report.close(results)
+        print(f"✓ Report saved to: {args.output}")
 
     # Print summary
     passed = sum(1 for r in results if r.passed)
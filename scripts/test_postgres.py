@@ -1,16 +1,26 @@
 #!/usr/bin/env python3
 import os
 import uuid
+import struct
 import asyncio
+import weakref
 from pathlib import Path
 from datetime import datetime
 
+import httpx
+import orjson
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy import text
 from langchain_postgres import PGVectorStore, PGEngine
 from langchain_core.documents import Document
 from langchain_ollama import OllamaEmbeddings
 
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 ## Test with Cohere Embeddings (NVM)
 # from langchain_cohere import CohereEmbeddings
 
@@ -42,6 +52,13 @@ required_vars = {
 TABLE_NAME = "vectorstore"  # @param {type: "string"}
 VECTOR_SIZE = 1024  # @param {type: "int"}
 SCHEMA_NAME = "test_schema"
+VECTOR_INDEX_NAME = f"{TABLE_NAME}_embedding_hnsw_idx"
+
+# Column layout created by PGEngine.ainit_vectorstore_table
+COPY_COLUMNS = ["langchain_id", "content", "embedding", "langchain_metadata"]
+
+# Raw asyncpg connections that already have the vector codec registered
+_vector_codec_conns: "weakref.WeakSet" = weakref.WeakSet()
 
 
 def print_section(title: str):
@@ -56,66 +73,103 @@ def print_status(message: str, status: str = "✓"):
     print(f"  {status} {message}")
 
 
-async def verify_table_exists(engine, schema_name: str, table_name: str) -> bool:
+async def _driver_connection(conn):
+    """The asyncpg connection under a SQLAlchemy one; small probes skip SQLAlchemy's compile layer"""
+    return (await conn.get_raw_connection()).driver_connection
+
+
+async def verify_table_exists(conn, schema_name: str, table_name: str) -> bool:
     """Check if table exists in the database"""
-    async with engine.begin() as conn:
-        res = await conn.execute(
-            text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE  table_schema = :schema_name
-                    AND    table_name   = :table_name
-                )
-            """),
-            {"schema_name": schema_name, "table_name": table_name}
-        )
-        return res.scalar_one()
+    raw = await _driver_connection(conn)
+    return await raw.fetchval(
+        """
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables 
+                WHERE  table_schema = $1
+                AND    table_name   = $2
+            )
+        """,
+        schema_name,
+        table_name,
+    )
 
 
-async def get_table_info(engine, schema_name: str, table_name: str):
+async def get_table_info(conn, schema_name: str, table_name: str):
     """Get table structure information"""
-    async with engine.begin() as conn:
-        res = await conn.execute(
-            text("""
-                SELECT 
-                    column_name,
-                    data_type,
-                    character_maximum_length,
-                    is_nullable
-                FROM information_schema.columns
-                WHERE table_schema = :schema_name
-                AND table_name = :table_name
-                ORDER BY ordinal_position
-            """),
-            {"schema_name": schema_name, "table_name": table_name}
-        )
-        return res.fetchall()
+    raw = await _driver_connection(conn)
+    return await raw.fetch(
+        """
+            SELECT 
+                column_name,
+                data_type,
+                character_maximum_length,
+                is_nullable
+            FROM information_schema.columns
+            WHERE table_schema = $1
+            AND table_name = $2
+            ORDER BY ordinal_position
+        """,
+        schema_name,
+        table_name,
+    )
 
 
-async def get_row_count(engine, schema_name: str, table_name: str) -> int:
+async def get_row_count(conn, schema_name: str, table_name: str) -> int:
     """Get the number of rows in the table"""
-    async with engine.begin() as conn:
-        res = await conn.execute(
-            text(f'SELECT COUNT(*) FROM "{schema_name}"."{table_name}"')
-        )
-        return res.scalar_one()
-
-
-async def get_sample_documents(engine, schema_name: str, table_name: str, limit: int = 5):
-    """Get sample documents from the table"""
-    async with engine.begin() as conn:
-        res = await conn.execute(
-            text(f'''
-                SELECT 
-                    langchain_id,
-                    LEFT(content, 50) as content_preview,
-                    langchain_metadata
-                FROM "{schema_name}"."{table_name}"
-                LIMIT :limit
-            '''),
-            {"limit": limit}
-        )
-        return res.fetchall()
+    raw = await _driver_connection(conn)
+    return await raw.fetchval(f'SELECT COUNT(*) FROM "{schema_name}"."{table_name}"')
+
+
+async def iter_sample_documents(conn, schema_name: str, table_name: str, limit: int = 5):
+    """Yield sample documents from the table as they arrive from the server"""
+    # Stream through an asyncpg cursor; cursors need a transaction, which the autocommit
+    # connection doesn't open on its own. $1 is typed in the SQL so no type lookup is needed.
+    raw = await _driver_connection(conn)
+    async with raw.transaction():
+        async for row in raw.cursor(
+            f'''
+            SELECT 
+                langchain_id,
+                LEFT(content, 50) as content_preview,
+                langchain_metadata
+            FROM "{schema_name}"."{table_name}"
+            LIMIT $1::int
+            ''',
+            limit,
+        ):
+            yield row
+
+
+def _encode_vector(vector) -> bytes:
+    """pgvector binary wire format: int16 dim, int16 unused, then big-endian float4 values."""
+    return struct.pack(f">HH{len(vector)}f", len(vector), 0, *vector)
+
+
+async def _ensure_vector_codec(raw) -> None:
+    """Register the binary pgvector codec on an asyncpg connection (once)"""
+    if raw in _vector_codec_conns:
+        return
+    vector_schema = await raw.fetchval(
+        "SELECT typnamespace::regnamespace::text FROM pg_type WHERE typname = 'vector'"
+    )
+    await raw.set_type_codec("vector", schema=vector_schema, encoder=_encode_vector, decoder=bytes, format="binary")
+    _vector_codec_conns.add(raw)
+
+
+async def copy_embeddings(conn, schema_name: str, table_name: str, texts, vectors, metadatas, ids) -> None:
+    """Bulk-load pre-embedded rows with one binary COPY FROM STDIN instead of an INSERT per row"""
+    raw = await _driver_connection(conn)
+    # Later batches on the same connection go straight to the COPY
+    await _ensure_vector_codec(raw)
+    await raw.copy_records_to_table(
+        table_name,
+        records=[
+            (row_id, content, vector, orjson.dumps(metadata).decode())
+            for row_id, content, vector, metadata in zip(ids, texts, vectors, metadatas)
+        ],
+        columns=COPY_COLUMNS,
+        schema_name=schema_name,
+    )
 
 
 async def main():
@@ -129,46 +183,12 @@ async def main():
     CONNECTION_STRING = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
     engine = create_async_engine(
         CONNECTION_STRING,
+        pool_size=5,
+        max_overflow=0,
+        # jsonb the engine encodes or decodes (PGVectorStore metadata, the sample preview) uses orjson
+        json_serializer=lambda obj: orjson.dumps(obj).decode(),
+        json_deserializer=orjson.loads,
     )
-    
-    ## Create the schema if it doesn't exist
-    print_section("1. Schema Creation")
-    async with engine.begin() as conn:
-        await conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{SCHEMA_NAME}"'))
-    print_status(f"Schema '{SCHEMA_NAME}' created/verified")
-    
-    pg_engine = PGEngine.from_engine(engine=engine)
-
-    # Check if the table already exists before trying to create it
-    print_section("2. Table Creation")
-    already_exists = await verify_table_exists(engine, SCHEMA_NAME, TABLE_NAME)
-    
-    if not already_exists:
-        await pg_engine.ainit_vectorstore_table(
-            table_name=TABLE_NAME,
-            vector_size=VECTOR_SIZE,
-            schema_name=SCHEMA_NAME,    # Default: "public"
-        )
-        print_status(f"Table '{SCHEMA_NAME}.{TABLE_NAME}' created successfully")
-    else:
-        print_status(f"Table '{SCHEMA_NAME}.{TABLE_NAME}' already exists, skipping creation.", "ℹ")
-    
-    # Verify table exists and show structure
-    table_exists = await verify_table_exists(engine, SCHEMA_NAME, TABLE_NAME)
-    if table_exists:
-        print_status("Table verification: EXISTS", "✓")
-        table_info = await get_table_info(engine, SCHEMA_NAME, TABLE_NAME)
-        print("\n  Table Structure:")
-        print("  " + "-" * 66)
-        print(f"  {'Column':<25} {'Type':<25} {'Nullable':<10}")
-        print("  " + "-" * 66)
-        for col in table_info:
-            col_name, data_type, max_len, nullable = col
-            type_str = f"{data_type}({max_len})" if max_len else data_type
-            print(f"  {col_name:<25} {type_str:<25} {nullable:<10}")
-    else:
-        print_status("Table verification: NOT FOUND", "✗")
-        raise Exception("Table was not created successfully!")
 
     ## Embeddings
     # Example: Use Cohere embeddings or Ollama mxbai-embed-large:latest (local)
@@ -178,125 +198,183 @@ async def main():
     # embedding = CohereEmbeddings(model="embed-english-v3.0", cohere_api_key=os.environ["COHERE_API_KEY"])
 
     # Option 2: Ollama local embedding (mxbai-embed-large:latest)
+    # Every embed call goes through this one keep-alive connection pool (HTTP/2 when h2 is
+    # installed and Ollama sits behind TLS; plain http:// stays on HTTP/1.1). The script owns
+    # the transport, so it can close the pool without reaching into OllamaEmbeddings' client.
+    ollama_transport = httpx.AsyncHTTPTransport(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=40, keepalive_expiry=30.0),
+    )
     embedding = OllamaEmbeddings(
         model="mxbai-embed-large:latest",  # for local Ollama
-        base_url="http://localhost:11434" # default for Ollama
+        base_url="http://localhost:11434", # default for Ollama
+        async_client_kwargs={"transport": ollama_transport, "timeout": 300.0},
     )
+    
+    # One connection for the setup, checks and cleanup. Autocommit, so the schema is visible to
+    # PGEngine's own connections right away and no open transaction holds locks on the table
+    # when it is dropped. Leaving the block also closes the Ollama connection pool.
+    async with ollama_transport, engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+
+        ## Create the schema if it doesn't exist
+        print_section("1. Schema Creation")
+        await conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{SCHEMA_NAME}"'))
+        print_status(f"Schema '{SCHEMA_NAME}' created/verified")
+    
+        pg_engine = PGEngine.from_engine(engine=engine)
 
-    ## Vector Store
-    store = await PGVectorStore.create(
-        engine=pg_engine,
-        table_name=TABLE_NAME,
-        schema_name=SCHEMA_NAME,
-        embedding_service=embedding,
-    )
+        # Check if the table already exists before trying to create it
+        print_section("2. Table Creation")
+        already_exists = await verify_table_exists(conn, SCHEMA_NAME, TABLE_NAME)
+    
+        if not already_exists:
+            await pg_engine.ainit_vectorstore_table(
+                table_name=TABLE_NAME,
+                vector_size=VECTOR_SIZE,
+                schema_name=SCHEMA_NAME,    # Default: "public"
+            )
+            print_status(f"Table '{SCHEMA_NAME}.{TABLE_NAME}' created successfully")
+        else:
+            print_status(f"Table '{SCHEMA_NAME}.{TABLE_NAME}' already exists, skipping creation.", "ℹ")
+
+        # ANN index so similarity searches don't seq-scan every vector; built on the empty table,
+        # the rows added below are indexed as they arrive
+        await conn.execute(text("SET maintenance_work_mem = '512MB'"))
+        await conn.execute(text(f'''
+            CREATE INDEX IF NOT EXISTS "{VECTOR_INDEX_NAME}"
+            ON "{SCHEMA_NAME}"."{TABLE_NAME}"
+            USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)
+        '''))
+        await conn.execute(text("RESET maintenance_work_mem"))
+        print_status(f"HNSW index '{VECTOR_INDEX_NAME}' created/verified")
+    
+        # Verify table exists and show structure; the column listing answers both in one query
+        table_info = await get_table_info(conn, SCHEMA_NAME, TABLE_NAME)
+        if table_info:
+            print_status("Table verification: EXISTS", "✓")
+            print("\n  Table Structure:")
+            print("  " + "-" * 66)
+            print(f"  {'Column':<25} {'Type':<25} {'Nullable':<10}")
+            print("  " + "-" * 66)
+            for col in table_info:
+                col_name, data_type, max_len, nullable = col
+                type_str = f"{data_type}({max_len})" if max_len else data_type
+                print(f"  {col_name:<25} {type_str:<25} {nullable:<10}")
+        else:
+            print_status("Table verification: NOT FOUND", "✗")
+            raise Exception("Table was not created successfully!")
 
-    ## Add Documents
-    docs = [
-        Document(
-            id=str(uuid.uuid4()),
-            page_content="Red Apple",
-            metadata={"description": "red", "content": "1", "category": "fruit"},
-        ),
-        Document(
-            id=str(uuid.uuid4()),
-            page_content="Banana Cavendish",
-            metadata={"description": "yellow", "content": "2", "category": "fruit"},
-        ),
-        Document(
-            id=str(uuid.uuid4()),
-            page_content="Orange Navel",
-            metadata={"description": "orange", "content": "3", "category": "fruit"},
-        ),
-    ]
-
-    print_section("3. Adding Documents")
-    await store.aadd_documents(docs)
-    print_status(f"Added {len(docs)} documents")
+        ## Vector Store
+        # create() checks the table has the columns PGVectorStore expects, which COPY_COLUMNS relies on
+        await PGVectorStore.create(
+            engine=pg_engine,
+            table_name=TABLE_NAME,
+            schema_name=SCHEMA_NAME,
+            embedding_service=embedding,
+        )
+
+        ## Add Documents
+        docs = [
+            Document(
+                id=str(uuid.uuid4()),
+                page_content="Red Apple",
+                metadata={"description": "red", "content": "1", "category": "fruit"},
+            ),
+            Document(
+                id=str(uuid.uuid4()),
+                page_content="Banana Cavendish",
+                metadata={"description": "yellow", "content": "2", "category": "fruit"},
+            ),
+            Document(
+                id=str(uuid.uuid4()),
+                page_content="Orange Navel",
+                metadata={"description": "orange", "content": "3", "category": "fruit"},
+            ),
+        ]
+
+        all_texts = ["Apples and oranges", "Cars and airplanes", "Pineapple", "Train", "Banana"]
+
+        # Embed the documents and the texts together in one /api/embed request, then COPY the
+        # precomputed vectors in (aadd_documents/aadd_texts would each make their own request and
+        # INSERT row by row)
+        vectors = await embedding.aembed_documents([doc.page_content for doc in docs] + all_texts)
+        doc_vectors, text_vectors = vectors[:len(docs)], vectors[len(docs):]
+
+        print_section("3. Adding Documents")
+        await copy_embeddings(
+            conn,
+            SCHEMA_NAME,
+            TABLE_NAME,
+            [doc.page_content for doc in docs],
+            doc_vectors,
+            metadatas=[doc.metadata for doc in docs],
+            ids=[doc.id for doc in docs],
+        )
+        print_status(f"Added {len(docs)} documents")
     
-    # Verify documents were added
-    row_count = await get_row_count(engine, SCHEMA_NAME, TABLE_NAME)
-    print_status(f"Total rows in table: {row_count}", "✓")
-
-    ## Add Texts
-    print_section("4. Adding Texts")
-    all_texts = ["Apples and oranges", "Cars and airplanes", "Pineapple", "Train", "Banana"]
-    metadatas = [{"len": len(t)} for t in all_texts]
-    ids = [str(uuid.uuid4()) for _ in all_texts]
-    await store.aadd_texts(all_texts, metadatas=metadatas, ids=ids)
-    print_status(f"Added {len(all_texts)} text entries")
+        # Verify documents were added
+        row_count = await get_row_count(conn, SCHEMA_NAME, TABLE_NAME)
+        print_status(f"Total rows in table: {row_count}", "✓")
+
+        ## Add Texts
+        print_section("4. Adding Texts")
+        metadatas = [{"len": len(t)} for t in all_texts]
+        ids = [str(uuid.uuid4()) for _ in all_texts]
+        await copy_embeddings(conn, SCHEMA_NAME, TABLE_NAME, all_texts, text_vectors, metadatas=metadatas, ids=ids)
+        print_status(f"Added {len(all_texts)} text entries")
     
-    # Verify all data was added
-    final_row_count = await get_row_count(engine, SCHEMA_NAME, TABLE_NAME)
-    expected_count = len(docs) + len(all_texts)
-    print_status(f"Total rows in table: {final_row_count} (expected: {expected_count})", "✓")
+        # Verify all data was added
+        final_row_count = await get_row_count(conn, SCHEMA_NAME, TABLE_NAME)
+        expected_count = len(docs) + len(all_texts)
+        print_status(f"Total rows in table: {final_row_count} (expected: {expected_count})", "✓")
     
-    if final_row_count == expected_count:
-        print_status("Row count matches expected value!", "✓")
-    else:
-        print_status(f"Warning: Row count mismatch! Expected {expected_count}, got {final_row_count}", "⚠")
+        if final_row_count == expected_count:
+            print_status("Row count matches expected value!", "✓")
+        else:
+            print_status(f"Warning: Row count mismatch! Expected {expected_count}, got {final_row_count}", "⚠")
     
-    # Show sample documents
-    print_section("5. Sample Data Preview")
-    samples = await get_sample_documents(engine, SCHEMA_NAME, TABLE_NAME, limit=5)
-    if samples:
-        print(f"  Showing {len(samples)} sample rows:\n")
-        for i, (doc_id, content_preview, metadata) in enumerate(samples, 1):
+        # Show sample documents
+        print_section("5. Sample Data Preview")
+        sample_limit = 5
+        shown = 0
+        async for doc_id, content_preview, metadata in iter_sample_documents(conn, SCHEMA_NAME, TABLE_NAME, limit=sample_limit):
+            shown += 1
+            if shown == 1:
+                print(f"  Showing up to {sample_limit} sample rows:\n")
             # Safely handle doc_id (could be UUID object or None)
             doc_id_str = str(doc_id) if doc_id else "N/A"
             doc_id_display = doc_id_str[:36] + "..." if len(doc_id_str) > 36 else doc_id_str
-            
+        
             # Safely handle content_preview (could be None)
             content_display = str(content_preview) if content_preview else "N/A"
             if len(content_display) > 50:
                 content_display = content_display[:50] + "..."
-            
-            print(f"  [{i}] ID: {doc_id_display}")
+        
+            print(f"  [{shown}] ID: {doc_id_display}")
             print(f"      Content: {content_display}")
             if metadata:
                 print(f"      Metadata: {metadata}")
             print()
-    else:
-        print_status("No documents found in table", "⚠")
-
-    ## Drop the Table
-    print_section("6. Dropping Table")
-    await pg_engine.adrop_table(TABLE_NAME, schema_name=SCHEMA_NAME)
-    print_status(f"Table '{SCHEMA_NAME}.{TABLE_NAME}' dropped")
-
-    # Drop all other non-extension objects in the database, confirm truly empty.
-    print_section("7. Dropping ALL Tables, Views, and Sequences from Schema")
-    async with engine.begin() as conn:
-        # Drop all user tables, views, and sequences from the target schema
-        # Use format() with %I for safe identifier quoting in PL/pgSQL
-        result = await conn.execute(
-            text(f"""
-            DO $$
-            DECLARE
-                r RECORD;
-                schema_name TEXT := '{SCHEMA_NAME.replace("'", "''")}';
-            BEGIN
-                -- Drop TABLES
-                FOR r IN (SELECT tablename FROM pg_tables WHERE schemaname = schema_name) LOOP
-                    EXECUTE format('DROP TABLE IF EXISTS %I.%I CASCADE', schema_name, r.tablename);
-                END LOOP;
-                -- Drop VIEWS
-                FOR r IN (SELECT viewname FROM pg_views WHERE schemaname = schema_name) LOOP
-                    EXECUTE format('DROP VIEW IF EXISTS %I.%I CASCADE', schema_name, r.viewname);
-                END LOOP;
-                -- Drop SEQUENCES
-                FOR r IN (SELECT sequencename FROM pg_sequences WHERE schemaname = schema_name) LOOP
-                    EXECUTE format('DROP SEQUENCE IF EXISTS %I.%I CASCADE', schema_name, r.sequencename);
-                END LOOP;
-            END$$;
-            """)
-        )
+        if not shown:
+            print_status("No documents found in table", "⚠")
+
+        ## Drop the Table
+        print_section("6. Dropping Table")
+        await pg_engine.adrop_table(TABLE_NAME, schema_name=SCHEMA_NAME)
+        print_status(f"Table '{SCHEMA_NAME}.{TABLE_NAME}' dropped")
+
+        # Drop all other non-extension objects in the database, confirm truly empty.
+        print_section("7. Dropping ALL Tables, Views, and Sequences from Schema")
+        # Dropping the schema lets Postgres' dependency graph remove every object in it in one
+        # statement; recreate it empty (it only ever holds this test's objects, with default privileges)
+        await conn.execute(text(f'DROP SCHEMA IF EXISTS "{SCHEMA_NAME}" CASCADE'))
+        await conn.execute(text(f'CREATE SCHEMA "{SCHEMA_NAME}"'))
 
-    print_status("Dropped all tables, views, and sequences (except extensions) in schema", "✓")
+        print_status("Dropped all tables, views, and sequences (except extensions) in schema", "✓")
 
-    # Show that database is empty except for extensions
-    print_section("8. Current non-extension Objects in Schema")
-    async with engine.connect() as conn:
+        # Show that database is empty except for extensions
+        print_section("8. Current non-extension Objects in Schema")
         rows = []
         result = await conn.execute(
             text("""
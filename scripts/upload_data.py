@@ -24,11 +24,15 @@ AWS credentials are resolved via the standard AWS mechanisms:
 from __future__ import annotations
 
 import argparse
+import functools
 import mimetypes
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Iterator
 
 import boto3
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import BotoCoreError, ClientError
 
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
@@ -37,41 +41,85 @@ AWS_REGION = os.getenv("AWS_REGION")
 
 DEFAULT_BUCKET = "hc-ai.bucket"
 DEFAULT_SOURCE = "data"
+# Uploads are network-bound, so small files overlap their request latency
+DEFAULT_WORKERS = 16
 
 
-def _guess_content_type(path: Path) -> str:
-    ctype, _ = mimetypes.guess_type(str(path))
+# Content types for the extensions data/ actually holds; anything else asks mimetypes
+KNOWN_CONTENT_TYPES = {
+    ".json": "application/json",
+    ".ndjson": "application/x-ndjson",
+    ".csv": "text/csv",
+    ".txt": "text/plain",
+    ".pdf": "application/pdf",
+    ".parquet": "application/octet-stream",
+}
+
+mimetypes.init()
+
+
+@functools.lru_cache(maxsize=None)
+def _mimetypes_content_type(suffix: str) -> str:
+    ctype, _ = mimetypes.guess_type(f"file{suffix}")
     return ctype or "application/octet-stream"
 
 
+def _guess_content_type(suffix: str) -> str:
+    """Content type for a (lower-cased) file suffix."""
+    return KNOWN_CONTENT_TYPES.get(suffix) or _mimetypes_content_type(suffix)
+
+
+def _iter_files(directory: str) -> Iterator[os.DirEntry]:
+    """Yield every file below directory using one scandir per directory.
+
+    Symlinked directories are not descended into, matching os.walk's default.
+    """
+    with os.scandir(directory) as entries:
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif not entry.is_dir():
+                yield entry
+    for subdir in subdirs:
+        yield from _iter_files(subdir)
+
+
 def upload_directory(
     source_dir: Path,
     bucket: str,
     prefix: str = "",
     region: str = AWS_REGION,
+    workers: int = DEFAULT_WORKERS,
 ) -> None:
-    """Upload all files under source_dir to S3."""
+    """Upload all files under source_dir to S3, `workers` files at a time."""
     if not source_dir.exists() or not source_dir.is_dir():
         raise ValueError(f"Source directory does not exist or is not a directory: {source_dir}")
 
     session = boto3.Session(region_name=region)
-    s3 = session.client("s3")
+    # One client shared by all upload threads; size its pool so none of them wait on a connection
+    s3 = session.client("s3", config=BotoConfig(max_pool_connections=workers + 5))
+
+    def _upload(local_path: Path, key: str, extra_args: dict) -> None:
+        print(f"Uploading {local_path} -> s3://{bucket}/{key} ({extra_args['ContentType']})")
+        s3.upload_file(str(local_path), bucket, key, ExtraArgs=extra_args)
 
     total = 0
-    for root, _, files in os.walk(source_dir):
-        root_path = Path(root)
-        for name in files:
-            local_path = root_path / name
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for entry in _iter_files(str(source_dir)):
+            local_path = Path(entry.path)
             rel_path = local_path.relative_to(source_dir)
             key = f"{prefix.rstrip('/')}/{rel_path.as_posix()}" if prefix else rel_path.as_posix()
 
-            extra_args = {"ContentType": _guess_content_type(local_path)}
+            extra_args = {"ContentType": _guess_content_type(local_path.suffix.lower())}
+            futures[executor.submit(_upload, local_path, key, extra_args)] = local_path
 
-            print(f"Uploading {local_path} -> s3://{bucket}/{key} ({extra_args['ContentType']})")
+        for future in as_completed(futures):
             try:
-                s3.upload_file(str(local_path), bucket, key, ExtraArgs=extra_args)
+                future.result()
             except (BotoCoreError, ClientError) as e:
-                print(f"FAILED to upload {local_path}: {e}")
+                print(f"FAILED to upload {futures[future]}: {e}")
             else:
                 total += 1
 
@@ -100,6 +148,12 @@ def parse_args() -> argparse.Namespace:
         default=AWS_REGION,
         help=f"AWS region for S3 client (default: {AWS_REGION})",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Number of files to upload concurrently (default: {DEFAULT_WORKERS})",
+    )
     return parser.parse_args()
 
 
@@ -108,7 +162,13 @@ def main() -> int:
     source_dir = Path(args.source).resolve()
 
     try:
-        upload_directory(source_dir=source_dir, bucket=args.bucket, prefix=args.prefix, region=args.region)
+        upload_directory(
+            source_dir=source_dir,
+            bucket=args.bucket,
+            prefix=args.prefix,
+            region=args.region,
+            workers=args.workers,
+        )
     except Exception as e:  # noqa: BLE001
         print(f"Error during upload: {e}")
         return 1
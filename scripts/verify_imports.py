@@ -2,33 +2,74 @@
 import ast
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
+
+def _api_modules() -> frozenset[str]:
+    """Dotted names of every package (directory) and .py module under api/."""
+    api_dir = ROOT_DIR / "api"
+    modules = set()
+    for path in api_dir.rglob("*"):
+        if path.is_dir():
+            modules.add(path.relative_to(ROOT_DIR).as_posix().replace("/", "."))
+        elif path.suffix == ".py":
+            modules.add(path.relative_to(ROOT_DIR).with_suffix("").as_posix().replace("/", "."))
+    return frozenset(modules)
+
+
+# Resolved once; an import is valid if its module is a directory or .py file here
+API_MODULES = _api_modules()
+
+# Statement-list fields in source order; imports are statements, so expressions
+# never need visiting
+_STMT_FIELDS = ("body", "handlers", "orelse", "finalbody", "cases")
+
+
+class _ImportCollector(ast.NodeVisitor):
+    """Collect Import/ImportFrom nodes, descending only into nested statement bodies."""
+
+    def __init__(self) -> None:
+        self.imports: list[ast.Import | ast.ImportFrom] = []
+
+    def visit_Import(self, node: ast.Import) -> None:
+        self.imports.append(node)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        self.imports.append(node)
+
+    def generic_visit(self, node: ast.AST) -> None:
+        for field in _STMT_FIELDS:
+            for child in getattr(node, field, ()):
+                self.visit(child)
+
+
 def verify_imports_in_file(filepath: Path) -> list[str]:
     errors = []
     try:
-        with open(filepath, "r") as f:
-            content = f.read()
+        data = filepath.read_bytes()
+        # Every file is parsed, so syntax errors are still reported
+        tree = ast.parse(data, filename=str(filepath))
+        # Fast path: a file that never mentions "api." can't import from api/, so skip collecting imports
+        if b"api." not in data:
+            return errors
         
-        tree = ast.parse(content, filename=str(filepath))
+        collector = _ImportCollector()
+        collector.visit(tree)
 
-        for node in ast.walk(tree):
+        for node in collector.imports:
             if isinstance(node, ast.ImportFrom):
                 module = node.module
                 level = node.level
                 
                 # Check absolute internal imports (api.*)
                 if module and module.startswith("api."):
-                    # Convert python path to file path
-                    parts = module.split('.')
-                    target_path = ROOT_DIR.joinpath(*parts)
-                    
-                    # Check if it exists as directory (package) or file (.py)
-                    if not (target_path.exists() or target_path.with_suffix('.py').exists()):
+                    # Check it resolves to a package (directory) or module (.py)
+                    if module not in API_MODULES:
                         errors.append(f"Broken absolute import: {module} (Line {node.lineno})")
                 
                 # Check relative imports (roughly)
@@ -39,11 +80,8 @@ def verify_imports_in_file(filepath: Path) -> list[str]:
 
             elif isinstance(node, ast.Import):
                 for alias in node.names:
-                    if alias.name.startswith("api."):
-                        parts = alias.name.split('.')
-                        target_path = ROOT_DIR.joinpath(*parts)
-                        if not (target_path.exists() or target_path.with_suffix('.py').exists()):
-                            errors.append(f"Broken absolute import: {alias.name} (Line {node.lineno})")
+                    if alias.name.startswith("api.") and alias.name not in API_MODULES:
+                        errors.append(f"Broken absolute import: {alias.name} (Line {node.lineno})")
 
     except Exception as e:
         errors.append(f"Failed to parse {filepath.relative_to(ROOT_DIR)}: {e}")
@@ -60,6 +98,7 @@ def main():
     scan_dirs = ["api", "scripts", "debug"]
     ignore_dirs = ["POC_agent", "POC_embeddings", "POC_retrieval", "POC_RAGAS", "postgres", "__pycache__"]
     
+    py_files = []
     for d in scan_dirs:
         start_dir = ROOT_DIR / d
         if not start_dir.exists():
@@ -68,17 +107,16 @@ def main():
         for root, dirs, files in os.walk(start_dir):
             # Filtering ignored dirs in place
             dirs[:] = [d for d in dirs if d not in ignore_dirs]
-            
-            for file in files:
-                if file.endswith(".py"):
-                    full_path = Path(root) / file
-                    file_errors = verify_imports_in_file(full_path)
-                    
-                    if file_errors:
-                        print(f"File: {full_path.relative_to(ROOT_DIR)}")
-                        for err in file_errors:
-                            print(f"  ❌ {err}")
-                            issues_found += 1
+            py_files.extend(Path(root) / file for file in files if file.endswith(".py"))
+
+    # Parsing is pure CPU, so fan files out across cores; map keeps report order
+    with ProcessPoolExecutor() as executor:
+        for full_path, file_errors in zip(py_files, executor.map(verify_imports_in_file, py_files, chunksize=32)):
+            if file_errors:
+                print(f"File: {full_path.relative_to(ROOT_DIR)}")
+                for err in file_errors:
+                    print(f"  ❌ {err}")
+                    issues_found += 1
 
     if issues_found == 0:
         print("\n✅ No broken internal imports found in scanned directories.")
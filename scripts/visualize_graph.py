@@ -7,8 +7,11 @@ Generates Mermaid diagrams and ASCII representations of the agent workflow.
 from __future__ import annotations
 
 import argparse
+import hashlib
+import os
 import sys
 from pathlib import Path
+from typing import Callable
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
@@ -16,11 +19,38 @@ if str(ROOT_DIR) not in sys.path:
 
 from api.agent.multi_agent_graph import create_multi_agent_graph
 
+# Rendered diagrams, keyed by graph structure, so unchanged graphs skip the layout work
+CACHE_DIR = ROOT_DIR / ".cache"
 
-def print_mermaid_diagram(graph) -> str:
+
+def _graph_hash(graph_obj) -> str:
+    """Stable hash of the nodes and edges a diagram is drawn from."""
+    structure = (
+        sorted((node_id, node.name) for node_id, node in graph_obj.nodes.items()),
+        sorted((e.source, e.target, e.conditional, str(e.data)) for e in graph_obj.edges),
+    )
+    return hashlib.blake2b(repr(structure).encode(), digest_size=16).hexdigest()
+
+
+def _cached_render(graph_obj, suffix: str, render: Callable[[], str]) -> str:
+    """Return render()'s output from .cache/graph-<hash><suffix>, rendering and storing it on a miss."""
+    cache_path = CACHE_DIR / f"graph-{_graph_hash(graph_obj)}{suffix}"
+    try:
+        return cache_path.read_text()
+    except FileNotFoundError:
+        pass
+    rendered = render()
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    tmp_path.write_text(rendered)
+    os.replace(tmp_path, cache_path)
+    return rendered
+
+
+def print_mermaid_diagram(graph_obj) -> str:
     """Generate and print Mermaid diagram."""
     try:
-        mermaid = graph.get_graph().draw_mermaid()
+        mermaid = _cached_render(graph_obj, ".mmd", graph_obj.draw_mermaid)
         print("=" * 80)
         print("MERMAID DIAGRAM")
         print("=" * 80)
@@ -32,10 +62,10 @@ def print_mermaid_diagram(graph) -> str:
         return ""
 
 
-def print_ascii_diagram(graph) -> str:
+def print_ascii_diagram(graph_obj) -> str:
     """Generate and print ASCII diagram."""
     try:
-        ascii_diag = graph.get_graph().draw_ascii()
+        ascii_diag = _cached_render(graph_obj, ".txt", graph_obj.draw_ascii)
         print("\n" + "=" * 80)
         print("ASCII DIAGRAM")
         print("=" * 80)
@@ -47,10 +77,8 @@ def print_ascii_diagram(graph) -> str:
         return ""
 
 
-def print_graph_info(graph):
+def print_graph_info(graph_obj):
     """Print detailed graph information."""
-    graph_obj = graph.get_graph()
-    
     print("\n" + "=" * 80)
     print("GRAPH STRUCTURE INFORMATION")
     print("=" * 80)
@@ -130,17 +158,19 @@ def main() -> int:
     try:
         print("Generating graph...")
         graph = create_multi_agent_graph()
+        # Build the drawable graph once; every output below reads from it
+        graph_obj = graph.get_graph()
         
         mermaid = ""
 
         if args.format in ["mermaid", "both"]:
-            mermaid = print_mermaid_diagram(graph)
+            mermaid = print_mermaid_diagram(graph_obj)
 
         if args.format in ["ascii", "both"]:
-            print_ascii_diagram(graph)
+            print_ascii_diagram(graph_obj)
         
         if args.format == "info":
-            print_graph_info(graph)
+            print_graph_info(graph_obj)
         
         if args.output and mermaid:
             save_mermaid_to_file(mermaid, args.output)
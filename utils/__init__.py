@@ -1,5 +1,6 @@
 """Utility modules for the Atlas project."""
 
 from utils.env_loader import load_env_recursive
+from utils.event_loop import run
 
-__all__ = ["load_env_recursive"]
+__all__ = ["load_env_recursive", "run"]
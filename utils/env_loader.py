@@ -7,11 +7,73 @@ This module provides a function to load environment variables from:
 
 from __future__ import annotations
 
+import functools
 import os
 from pathlib import Path
-from typing import Optional
+from typing import AbstractSet, Iterator, Optional
 
-from dotenv import load_dotenv
+from dotenv import dotenv_values
+
+# Common directories that shouldn't have .env files
+EXCLUDE_DIRS = frozenset({
+    ".git",
+    "__pycache__",
+    ".pytest_cache",
+    "node_modules",
+    ".venv",
+    "venv",
+    "env",
+    ".env",
+    "dist",
+    "build",
+})
+
+
+def _iter_env_files(directory: str, exclude_dirs: AbstractSet[str]) -> Iterator[Path]:
+    """Yield .env files below directory, pruning excluded and symlinked dirs.
+
+    One scandir per directory answers both "is there a .env here" and
+    "which subdirectories to descend into" without extra stat calls.
+    """
+    with os.scandir(directory) as entries:
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in exclude_dirs:
+                    subdirs.append(entry.path)
+            elif entry.name == ".env" and entry.is_file():
+                yield Path(entry.path)
+    for subdir in subdirs:
+        yield from _iter_env_files(subdir, exclude_dirs)
+
+
+@functools.lru_cache(maxsize=None)
+def _subfolder_env_files(root_dir: Path) -> tuple[Path, ...]:
+    """Sorted subfolder .env files under root_dir, found once per process.
+
+    Several modules call load_env_recursive on the same root at import time;
+    only the first call walks the tree.
+    """
+    root_env = root_dir / ".env"
+    return tuple(sorted(
+        env_path for env_path in _iter_env_files(str(root_dir), EXCLUDE_DIRS) if env_path != root_env
+    ))
+
+
+@functools.lru_cache(maxsize=None)
+def _read_env_file(path: str, mtime_ns: int) -> dict[str, str]:
+    """Parsed values of one .env file; mtime_ns in the key re-parses it after an edit."""
+    return {key: value for key, value in dotenv_values(path).items() if value is not None}
+
+
+def _apply_env_file(env_path: Path, override: bool) -> None:
+    """Set a .env file's values in os.environ, parsing each distinct file only once.
+
+    Keyed on the resolved path, so a symlinked copy of another .env reuses its parse.
+    """
+    real_path = os.path.realpath(env_path)
+    values = _read_env_file(real_path, os.stat(real_path).st_mtime_ns)
+    os.environ.update({key: value for key, value in values.items() if override or key not in os.environ})
 
 
 def load_env_recursive(root_dir: Optional[Path | str] = None) -> None:
@@ -36,36 +98,11 @@ def load_env_recursive(root_dir: Optional[Path | str] = None) -> None:
     # First, load root .env file if it exists
     root_env = root_dir / ".env"
     if root_env.exists():
-        load_dotenv(root_env, override=False)
-    
-    # Then, find and load all .env files in subfolders
-    # Exclude common directories that shouldn't have .env files
-    exclude_dirs = {
-        ".git",
-        "__pycache__",
-        ".pytest_cache",
-        "node_modules",
-        ".venv",
-        "venv",
-        "env",
-        ".env",
-        "dist",
-        "build",
-    }
-    
-    env_files = []
-    for root, dirs, files in os.walk(root_dir):
-        # Skip excluded directories
-        dirs[:] = [d for d in dirs if d not in exclude_dirs]
-        
-        # Check for .env file in current directory
-        env_path = Path(root) / ".env"
-        if env_path.exists() and env_path != root_env:
-            env_files.append(env_path)
+        _apply_env_file(root_env, override=False)
     
-    # Sort by path to ensure consistent loading order
-    env_files.sort()
+    # Then, find all .env files in subfolders, sorted by path for a consistent loading order
+    env_files = _subfolder_env_files(root_dir)
     
     # Load subfolder .env files (these will override root values)
     for env_file in env_files:
-        load_dotenv(env_file, override=True)
+        _apply_env_file(env_file, override=True)
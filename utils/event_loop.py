@@ -0,0 +1,20 @@
+"""Entry point for running the scripts' async main functions."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Coroutine, TypeVar
+
+T = TypeVar("T")
+
+
+def run(coro: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine to completion on uvloop when available, else the default asyncio loop.
+
+    uvloop is installed with uvicorn[standard]; it is unavailable on Windows.
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.run(coro)
+    return uvloop.run(coro)